@@ -0,0 +1,121 @@
+import pandas as pd
+
+# 预计算列的后缀：有效权重、权重×指标
+_W = '|w'
+_WX = '|wx'
+
+
+def weighted_sums(df, metrics, weight):
+    """
+    一次性计算加权平均所需的中间列：权重合计、每个指标的有效权重
+    以及 权重×指标 的乘积。指标或权重为空的行不计入该指标的分子和分母。
+    """
+    w = df[weight]
+    data = {weight: w}
+    for col in metrics:
+        valid_w = w.where(df[col].notna())
+        data[col + _W] = valid_w
+        data[col + _WX] = df[col] * valid_w
+    return pd.DataFrame(data, index=df.index)
+
+
+def weighted_means(sums, keys, metrics, weight):
+    """
+    基于 weighted_sums 的结果，用一次 groupby().sum() 计算任意分组下
+    所有指标的加权平均。keys 为分组用的 Series 列表，为空时返回整体的一行。
+    返回的数据框以分组键为索引，包含权重合计列和各指标的加权平均列。
+    """
+    if keys:
+        totals = sums.groupby(keys, sort=True, observed=True).sum()
+    else:
+        totals = sums.sum().to_frame().T
+
+    result = pd.DataFrame({weight: totals[weight]}, index=totals.index)
+    for col in metrics:
+        # 没有有效数据的分组结果为 NaN
+        result[col] = totals[col + _WX] / totals[col + _W].where(totals[col + _W] != 0)
+    return result
+
+
+# 月度分项汇总在数据仓中的表名
+PARTIALS_TABLE = '月度分项汇总'
+
+# 分项汇总中的其他后缀：有效记录数、指标合计、最小值、最大值
+_N = '|n'
+_X = '|x'
+_MIN = '|min'
+_MAX = '|max'
+
+
+def partials(df, keys, metrics, weight):
+    """
+    按 keys（通常为 月份 和 供应商）计算可合并的分项汇总：权重的合计、记录数、最小值、最大值，
+    以及每个指标的有效权重、权重×指标、记录数、合计、最小值和最大值。
+    这些量都可以跨分组直接相加或取最值，因此任意月份范围的汇总只需用 merge_partials
+    合并对应月份的分项，不必重新读取明细。分组键为空的记录也保留。
+    返回以 keys 为列的数据框（每个分组一行）。
+    """
+    frame = weighted_sums(df, metrics, weight).join(df[metrics])
+    columns = {
+        weight: (weight, 'sum'),
+        weight + _N: (weight, 'count'),
+        weight + _MIN: (weight, 'min'),
+        weight + _MAX: (weight, 'max'),
+    }
+    for col in metrics:
+        columns.update({
+            col + _W: (col + _W, 'sum'),
+            col + _WX: (col + _WX, 'sum'),
+            col + _N: (col, 'count'),
+            col + _X: (col, 'sum'),
+            col + _MIN: (col, 'min'),
+            col + _MAX: (col, 'max'),
+        })
+    return frame.groupby(keys, sort=True, observed=True, dropna=False).agg(**columns).reset_index()
+
+
+def partial_layout(partials):
+    """从分项汇总的列名得到 (分组列, 权重列, 指标列)"""
+    metrics = [c[:-len(_WX)] for c in partials.columns if c.endswith(_WX)]
+    weight = next(c for c in partials.columns
+                  if c + _N in partials.columns and c + _WX not in partials.columns)
+    keys = [c for c in partials.columns if '|' not in c and c != weight]
+    return keys, weight, metrics
+
+
+def merge_partials(partials, keys, metrics, weight):
+    """
+    合并分项汇总得到任意分组下的统计量，keys 为分组用的 Series 列表，为空时返回整体的一行。
+    返回以分组键为索引、(列名, 统计量) 为列的数据框：权重为 sum/count/mean/max/min，
+    指标为 weighted（加权平均）/count/mean/max/min。
+    """
+    spec = {weight: 'sum', weight + _N: 'sum', weight + _MIN: 'min', weight + _MAX: 'max'}
+    for col in metrics:
+        spec.update({col + _W: 'sum', col + _WX: 'sum', col + _N: 'sum', col + _X: 'sum',
+                     col + _MIN: 'min', col + _MAX: 'max'})
+    if keys:
+        totals = partials.groupby(keys, sort=True, observed=True).agg(spec)
+    else:
+        # 逐列合并，保持记录数为整数
+        totals = pd.DataFrame({col: [partials[col].agg(func)] for col, func in spec.items()})
+
+    def ratio(numerator, denominator):
+        # 没有有效数据的分组结果为 NaN
+        return numerator / denominator.where(denominator != 0)
+
+    result = {
+        (weight, 'sum'): totals[weight],
+        (weight, 'count'): totals[weight + _N],
+        (weight, 'mean'): ratio(totals[weight], totals[weight + _N]),
+        (weight, 'max'): totals[weight + _MAX],
+        (weight, 'min'): totals[weight + _MIN],
+    }
+    for col in metrics:
+        result.update({
+            (col, 'weighted'): ratio(totals[col + _WX], totals[col + _W]),
+            (col, 'count'): totals[col + _N],
+            (col, 'mean'): ratio(totals[col + _X], totals[col + _N]),
+            (col, 'max'): totals[col + _MAX],
+            (col, 'min'): totals[col + _MIN],
+        })
+    return pd.DataFrame(result, index=totals.index)
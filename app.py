@@ -1,19 +1,24 @@
 from flask import Flask, render_template, request, jsonify, Response, send_file
 from flask_cors import CORS # Import CORS
 import os
-import threading
-import queue
+import shutil
+import tempfile
 import time
+import importlib
 import json
 import logging
-import pandas as pd
 
 # Ensure local imports work
 import sys
 sys.path.append(os.getcwd())
 
-import cz
-import hy
+# The pipeline, preview and query modules (and pandas with them) are
+# imported on first use, so the server starts without loading them
+import jobs
+import logbus
+import metrics
+import store
+import watch
 
 app = Flask(__name__)
 app.secret_key = 'fuel_management_secret'
@@ -22,148 +27,417 @@ CORS(app) # Enable CORS for all routes
 # Configuration
 UPLOAD_FOLDERS = {
     'hy': '无人值守化验月报',
-    'cz': '无人值守称重月报'
+    'cz': '无人值守称重月报',
+    'shc': '收耗存数据'
 }
 RESULT_FILES = {
     'hy': '化验月报汇总.xlsx',
-    'cz': '称重月报汇总.xlsx'
+    'cz': '称重月报汇总.xlsx',
+    'shc': '收耗存汇总.xlsx'
 }
+# Data store tables served by /api/query/<type>, with the query
+# parameters that filter on each column
+QUERY_SOURCES = {
+    'hy': {
+        'table': '原始数据',
+        'date': '化验日期',
+        'filters': {'supplier': '供应商全称', 'company': '公司名称'}
+    },
+    'cz': {
+        'table': '合并数据',
+        'filters': {'supplier': '供应商全称', 'company': '供应单位', 'transport': '运输单位'}
+    }
+}
+# Grouping choices of /api/query/<type>?rollup=..., merged from the monthly partials
+ROLLUP_GROUPS = {
+    'total': [],
+    'month': ['报表月份'],
+    'supplier': ['供应商全称'],
+    'month,supplier': ['报表月份', '供应商全称']
+}
+PREVIEW_PAGE_SIZE = 100
+PREVIEW_MAX_PAGE_SIZE = 1000
+# Upload limits: whole request and each single report
+MAX_UPLOAD_SIZE = 200 * 1024 * 1024
+MAX_UPLOAD_FILE_SIZE = 20 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
+# Modules whose parse_report validates uploads and fills the ingestion cache
+PARSERS = {
+    'hy': 'hy',
+    'cz': 'cz',
+    'shc': 'shc'
+}
+# Number of processes used to parse monthly reports in parallel
+INGEST_WORKERS = int(os.environ.get('RM_WORKERS', os.cpu_count() or 1))
+# Number of pipeline runs that may execute at the same time
+JOB_WORKERS = int(os.environ.get('RM_JOB_WORKERS', 2))
+# Watch the input folders and rerun a pipeline when its reports change
+WATCH_FOLDERS = os.environ.get('RM_WATCH', '0') == '1'
+WATCH_DEBOUNCE = float(os.environ.get('RM_WATCH_DEBOUNCE', watch.DEBOUNCE_SECONDS))
+# SQLite file holding job and log state shared by all worker processes
+# (set by wsgi.py); unset keeps the state in memory for a single process
+STATE_DB = os.environ.get('RM_STATE_DB')
 
 # Ensure directories exist
 for folder in UPLOAD_FOLDERS.values():
     if not os.path.exists(folder):
         os.makedirs(folder)
 
-# Global queue for log streaming
-log_queue = queue.Queue()
+# Log bus shared by all log stream clients, with a bounded replay buffer
+LOG_HISTORY_SIZE = 1000
+if STATE_DB:
+    log_bus = logbus.SqliteLogBus(STATE_DB, maxlen=LOG_HISTORY_SIZE)
+    # Run metrics too, so /api/metrics shows the runs of every worker process
+    metrics.use_database(STATE_DB)
+else:
+    log_bus = logbus.LogBus(maxlen=LOG_HISTORY_SIZE)
 
 def log_callback(message):
-    """Callback function to push logs to the queue."""
-    log_queue.put(message)
+    """Callback function to publish logs to every subscriber."""
+    log_bus.publish(message)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+class UploadRejected(Exception):
+    """An uploaded file was not saved; args are (filename, reason)."""
+
+def save_upload(file, file_type):
+    """
+    Stream an uploaded file to disk in chunks, enforcing the per-file size
+    limit, and parse it before it enters the input folder.
+
+    A file that cannot be parsed is deleted and raises UploadRejected, so it
+    never breaks later runs. A valid file is moved in with its parse cache
+    entry already written, so runs in every worker process read it from the
+    cache. Returns (filename, size, rows).
+    """
+    import ingest
+    folder = UPLOAD_FOLDERS[file_type]
+    # Keep the original (possibly Chinese) name but drop any path components
+    filename = os.path.basename(file.filename.replace('\\', '/'))
+    save_path = os.path.join(folder, filename)
+    # The parsers read the month from the file name, so the temp copy keeps
+    # it inside a unique hidden folder that runs and the watcher ignore
+    tmp_dir = tempfile.mkdtemp(prefix='.uploading-', dir=folder)
+    tmp_path = os.path.join(tmp_dir, filename)
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_FILE_SIZE:
+                    raise UploadRejected(filename, 'File too large')
+                out.write(chunk)
+        pipeline = importlib.import_module(PARSERS[file_type])
+        try:
+            rows = ingest.preload(file_type, tmp_path, pipeline.parse_report, pipeline.PARSE_VERSION,
+                                  target=save_path, log=log_callback)
+        except Exception as e:
+            raise UploadRejected(filename, f'Not a valid report: {e}')
+        # Replace atomically so a running task never sees a half-written report
+        os.replace(tmp_path, save_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return filename, size, rows
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-    
-    file = request.files['file']
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
     file_type = request.form.get('type') # 'hy' or 'cz'
-    
-    if file.filename == '':
+
+    if not files:
         return jsonify({'error': 'No selected file'}), 400
-        
-    if file and file_type in UPLOAD_FOLDERS:
-        filename = file.filename
-        if not (filename.endswith('.xls') or filename.endswith('.xlsx')):
-             return jsonify({'error': 'Invalid file type. Only Excel files allowed.'}), 400
-
-        save_path = os.path.join(UPLOAD_FOLDERS[file_type], filename)
-        file.save(save_path)
-        log_callback(f"文件上传成功: {filename} -> {UPLOAD_FOLDERS[file_type]}")
-        return jsonify({'message': f'File uploaded to {UPLOAD_FOLDERS[file_type]}'})
-    
-    return jsonify({'error': 'Invalid request'}), 400
+    if file_type not in UPLOAD_FOLDERS:
+        return jsonify({'error': 'Invalid request'}), 400
+
+    invalid = [f.filename for f in files if not f.filename.lower().endswith(('.xls', '.xlsx'))]
+    if invalid:
+        return jsonify({'error': f"Invalid file type. Only Excel files allowed: {', '.join(invalid)}"}), 400
+
+    results = []
+    for file in files:
+        try:
+            filename, size, rows = save_upload(file, file_type)
+        except UploadRejected as e:
+            filename, reason = e.args
+            log_callback(f"!!! 文件校验失败，未保存: {filename}: {reason}")
+            results.append({'file': filename, 'error': reason})
+            continue
+        log_callback(f"文件上传成功: {filename} -> {UPLOAD_FOLDERS[file_type]}（{rows} 行）")
+        results.append({'file': filename, 'size': size, 'rows': rows})
+
+    saved = [r for r in results if 'error' not in r]
+    rejected = [r['file'] for r in results if 'error' in r]
+    response = {'message': f'{len(saved)} file(s) uploaded to {UPLOAD_FOLDERS[file_type]}', 'files': results}
+    if rejected:
+        response['error'] = f"Rejected: {', '.join(rejected)}"
+        return jsonify(response), 400
+    return jsonify(response)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'Upload too large (limit {MAX_UPLOAD_SIZE // (1024 * 1024)} MB per request)'}), 413
+
+TASK_NAMES = {
+    'hy': '化验月报汇总',
+    'cz': '称重月报汇总',
+    'shc': '收耗存汇总',
+    'all': '全部汇总'
+}
 
 @app.route('/api/run', methods=['POST'])
 def run_task():
     task_type = request.json.get('type')
     
-    if task_type == 'hy':
-        thread = threading.Thread(target=run_hy_task)
-        thread.start()
-        return jsonify({'message': '化验月报汇总任务已启动'})
-    elif task_type == 'cz':
-        thread = threading.Thread(target=run_cz_task)
-        thread.start()
-        return jsonify({'message': '称重月报汇总任务已启动'})
-    else:
+    if task_type not in TASK_NAMES:
         return jsonify({'error': 'Unknown task type'}), 400
 
+    job, coalesced = job_manager.submit(task_type)
+    if coalesced:
+        message = f'{TASK_NAMES[task_type]}任务已在队列中，本次请求已合并'
+    elif job.status == 'pending':
+        message = f'{TASK_NAMES[task_type]}任务已加入队列'
+    else:
+        message = f'{TASK_NAMES[task_type]}任务已启动'
+    return jsonify({'message': message, 'job_id': job.id, 'coalesced': coalesced})
+
+@app.route('/api/jobs')
+def list_jobs():
+    return jsonify([job.to_dict() for job in job_manager.list()])
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
 def run_hy_task():
+    import hy
     log_callback(">>> 开始执行化验月报汇总...")
-    try:
-        hy.run_analysis(log_callback=log_callback)
-        log_callback("<<< 化验汇总任务完成。")
-    except Exception as e:
-        log_callback(f"!!! 任务出错: {e}")
+    hy.run_analysis(log_callback=log_callback, workers=INGEST_WORKERS)
+    log_callback("<<< 化验汇总任务完成。")
 
 def run_cz_task():
+    import cz
     log_callback(">>> 开始执行称重月报汇总...")
+    cz.run_weight_processing(log_callback=log_callback, workers=INGEST_WORKERS)
+    log_callback("<<< 称重汇总任务完成。")
+
+def run_all_task():
+    import runner
+    log_callback(">>> 开始执行全部汇总（跳过输入未变动的阶段）...")
+    status = runner.run(log=log_callback, workers=INGEST_WORKERS)
+    failed = [name for name, result in status.items() if result in ('failed', 'blocked')]
+    if failed:
+        raise RuntimeError(f"未完成的阶段: {'、'.join(failed)}")
+    log_callback("<<< 全部汇总任务完成。")
+
+def run_shc_task():
+    import shc
+    log_callback(">>> 开始执行收耗存汇总...")
+    shc.run_stock_processing(log_callback=log_callback, workers=INGEST_WORKERS)
+    log_callback("<<< 收耗存汇总任务完成。")
+
+# Bounded pool for pipeline runs; duplicate requests are coalesced per task type
+TASK_RUNNERS = {'hy': run_hy_task, 'cz': run_cz_task, 'shc': run_shc_task, 'all': run_all_task}
+# 'all' runs every pipeline, so it never overlaps a single-pipeline job
+EXCLUSIVE_TASKS = ('all',)
+if STATE_DB:
+    job_manager = jobs.SqliteJobManager(TASK_RUNNERS, STATE_DB, max_workers=JOB_WORKERS,
+                                        on_error=lambda job, e: log_callback(f"!!! 任务出错: {e}"),
+                                        exclusive=EXCLUSIVE_TASKS)
+else:
+    job_manager = jobs.JobManager(TASK_RUNNERS, max_workers=JOB_WORKERS,
+                                  on_error=lambda job, e: log_callback(f"!!! 任务出错: {e}"),
+                                  exclusive=EXCLUSIVE_TASKS)
+
+def on_folder_change(task_type, files):
+    """
+    Folder watcher callback: queue a run-all, which reruns the pipeline whose
+    reports changed plus the pipelines depending on it and skips the rest.
+    """
+    log_callback(f"检测到 {UPLOAD_FOLDERS[task_type]} 中的文件变动: {'、'.join(files)}")
+    job, coalesced = job_manager.submit('all')
+    if not coalesced:
+        log_callback(f"已自动提交{TASK_NAMES['all']}任务 {job.id}")
+
+def start_watcher():
+    watcher = watch.FolderWatcher(UPLOAD_FOLDERS, on_folder_change, debounce=WATCH_DEBOUNCE,
+                                  log=log_callback).start()
+    mode = '文件系统事件' if watcher.mode == 'events' else '定时扫描'
+    log_callback(f"已开启文件夹监视（{mode}），报表变动后自动执行汇总")
+    return watcher
+
+def _last_event_id():
+    """Cursor of a reconnecting client: Last-Event-ID header or ?last_id=."""
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    if value is None:
+        return None
     try:
-        cz.run_weight_processing(log_callback=log_callback)
-        log_callback("<<< 称重汇总任务完成。")
-    except Exception as e:
-        log_callback(f"!!! 任务出错: {e}")
+        last_id = int(value)
+    except ValueError:
+        return None
+    # Ids restart with the server; replay the whole buffer in that case
+    return last_id if last_id <= log_bus.last_id else 0
 
 @app.route('/api/logs')
 def stream_logs():
-    def event_stream():
+    last_id = _last_event_id()
+    if last_id is None:
+        # New clients only receive messages from now on
+        last_id = log_bus.last_id
+
+    def event_stream(last_id):
         while True:
-            try:
-                # Wait for new log message
-                message = log_queue.get(timeout=20) 
-                yield f"data: {json.dumps({'message': message})}\n\n"
-            except queue.Empty:
+            events = log_bus.wait(last_id, timeout=20)
+            if not events:
                 # Send keep-alive
                 yield f": keep-alive\n\n"
+                continue
+            for event_id, message in events:
+                yield f"id: {event_id}\ndata: {json.dumps({'message': message})}\n\n"
+            last_id = events[-1][0]
     
-    return Response(event_stream(), mimetype="text/event-stream")
+    return Response(event_stream(last_id), mimetype="text/event-stream")
+
+@app.route('/api/logs/history')
+def log_history():
+    """Polling alternative to the SSE stream (used by the mini program)."""
+    try:
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'error': 'after must be an integer'}), 400
+    if after > log_bus.last_id:
+        after = 0
+    events = log_bus.since(after)
+    return jsonify({
+        'last_id': events[-1][0] if events else max(after, 0),
+        'messages': [{'id': event_id, 'message': message} for event_id, message in events]
+    })
+
+@app.route('/api/metrics')
+def run_metrics():
+    """
+    Stage and per-file timings of the most recent pipeline runs (oldest first).
+
+    Query parameters: type (hy or cz) to filter by pipeline and limit for the
+    number of runs; the server keeps the last RM_METRICS_HISTORY runs
+    (across all worker processes when RM_STATE_DB is set).
+    """
+    pipeline = request.args.get('type')
+    if pipeline is not None and pipeline not in UPLOAD_FOLDERS:
+        return jsonify({'error': 'Invalid type'}), 400
+    try:
+        limit = max(int(request.args.get('limit', metrics.HISTORY)), 0)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    runs = metrics.history(pipeline)
+    return jsonify({'runs': runs[len(runs) - limit:] if limit else []})
 
 @app.route('/download/<type>')
 def download_result(type):
     if type in RESULT_FILES:
         filename = RESULT_FILES[type]
-        if os.path.exists(filename):
-            return send_file(filename, as_attachment=True)
+        # Serve the immutable copy in the latest store snapshot, so a run
+        # rewriting the workbook never affects a download in progress
+        try:
+            path = store.export_path(type, filename)
+        except FileNotFoundError:
+            path = filename
+        if os.path.exists(path):
+            return send_file(os.path.abspath(path), as_attachment=True, download_name=filename)
         else:
             return f"文件 {filename} 尚未生成，请先运行任务。", 404
     return "Invalid file type", 400
 
 @app.route('/api/preview/<type>')
 def preview_result(type):
-    data = {}
-    
-    def format_numeric(x):
-        try:
-            if isinstance(x, (int, float)):
-                return "{:,.2f}".format(x)
-            return x
-        except:
-            return x
+    """
+    Columnar JSON preview of one result table of a pipeline.
+
+    Query parameters: sheet (default: first table), offset, limit and
+    columns (comma separated). Tables are read from the data store and
+    cached in memory until a task writes a new version.
+    """
+    if type not in UPLOAD_FOLDERS:
+        return jsonify({'error': 'Invalid type'}), 400
+
+    if not store.exists(type):
+        return jsonify({'error': 'Results not generated yet'}), 404
 
     try:
-        if type == 'hy':
-            filename = '化验月报汇总.xlsx'
-        elif type == 'cz':
-            filename = '称重月报汇总分类.xlsx'
-        else:
-            return jsonify({'error': 'Invalid type'}), 400
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', PREVIEW_PAGE_SIZE)), 1), PREVIEW_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    columns = request.args.get('columns')
+    columns = [c for c in columns.split(',') if c] if columns else None
 
-        if not os.path.exists(filename):
-            return jsonify({'error': 'Results not generated yet'}), 404
-        
-        try:
-            xls = pd.ExcelFile(filename)
-            for sheet_name in xls.sheet_names:
-                df = pd.read_excel(xls, sheet_name=sheet_name)
-                
-                # Apply formatting to all numeric columns
-                for col in df.select_dtypes(include=['number']).columns:
-                    if col == '序号':
-                        df[col] = df[col].apply(lambda x: str(int(x)) if pd.notnull(x) else "")
-                    else:
-                        df[col] = df[col].apply(format_numeric)
-                
-                # Convert to HTML table with styling classes
-                data[sheet_name] = df.to_html(classes='result-table', index=False, na_rep='', border=0)
-        except Exception as e:
-            return jsonify({'error': f"Error reading Excel file: {str(e)}"}), 500
+    import preview
+    try:
+        return jsonify(preview.page(type, request.args.get('sheet'), offset, limit, columns))
+    except KeyError as e:
+        return jsonify({'error': f"Unknown sheet or column: {e}"}), 404
+    except Exception as e:
+        return jsonify({'error': f"Error reading results: {str(e)}"}), 500
+
+@app.route('/api/query/<type>')
+def query_data(type):
+    """
+    Filter a consolidated dataset without downloading the workbook.
+
+    Query parameters: start / end (YYYY-MM, inclusive), supplier, company,
+    transport (repeatable for several values), offset, limit and columns.
+    Only the matching page of rows is returned, as columnar JSON.
+
+    With rollup=total|month|supplier|month,supplier the date range is
+    aggregated instead (weight sum, weighted means, count, mean, min, max)
+    by merging the stored monthly partials; only supplier filters apply.
+    """
+    if type not in QUERY_SOURCES:
+        return jsonify({'error': 'Invalid type'}), 400
 
-        return jsonify(data)
+    source = QUERY_SOURCES[type]
+    if not store.exists(type):
+        return jsonify({'error': 'Results not generated yet'}), 404
+
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', PREVIEW_PAGE_SIZE)), 1), PREVIEW_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    columns = request.args.get('columns')
+    columns = [c for c in columns.split(',') if c] if columns else None
+
+    filters = {}
+    for param, column in source['filters'].items():
+        values = request.args.getlist(param)
+        if values:
+            filters[column] = values
+
+    rollup = request.args.get('rollup')
+    if rollup is not None and rollup not in ROLLUP_GROUPS:
+        return jsonify({'error': f"rollup must be one of: {', '.join(ROLLUP_GROUPS)}"}), 400
+
+    import query
+    try:
+        if rollup is not None:
+            return jsonify(query.rollup(type, ROLLUP_GROUPS[rollup], request.args.get('start'),
+                                        request.args.get('end'), filters, offset, limit))
+        dataset = query.get_dataset(type, source)
+        return jsonify(dataset.query(request.args.get('start'), request.args.get('end'),
+                                     filters, offset, limit, columns))
+    except KeyError as e:
+        return jsonify({'error': f"Unknown column: {e}"}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -172,5 +446,9 @@ if __name__ == '__main__':
     log = logging.getLogger('werkzeug')
     log.setLevel(logging.ERROR)
     
+    # With the debug reloader only the serving child process watches the folders
+    if WATCH_FOLDERS and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_watcher()
+
     print("Web Server Starting on http://0.0.0.0:5000 (LAN access enabled)")
     app.run(host='0.0.0.0', port=5000, debug=True)
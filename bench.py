@@ -0,0 +1,167 @@
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+
+import synth
+
+# 基准测试数据和结果的默认位置
+DATA_DIR = 'bench_data'
+RESULTS_FILE = 'bench_results.jsonl'
+# 输入月报的来源：实际 .xls 月报的副本、生成的 .xlsx 模拟月报
+INPUTS = ('xls', 'xlsx')
+
+
+def run_pipeline(name, func, folder, workers):
+    """冷启动（不使用解析缓存）运行一次流水线，返回其内置统计的各阶段耗时和内存峰值"""
+    import metrics
+
+    messages = []
+    func(folder_path=folder, log_callback=messages.append, use_cache=False, workers=workers)
+    errors = [m for m in messages if '出错' in m or m.startswith('错误')]
+    if errors:
+        raise RuntimeError(errors[0])
+    run = metrics.history(name)[-1]
+    return {
+        'stages': {stage['stage']: stage['seconds'] for stage in run['stages']},
+        'total': run['seconds'],
+        'peak_mb': run['peak_mb'],
+        'alloc_peak_mb': run.get('alloc_peak_mb'),
+    }
+
+
+def time_preview(name):
+    """首次预览每张表第一页的耗时（数据仓刚更新，预览缓存为冷缓存）"""
+    import preview
+    import store
+
+    start = time.perf_counter()
+    for table in store.list_tables(name):
+        preview.page(name, table)
+    return round(time.perf_counter() - start, 4)
+
+
+def run_scale(scale, data_dir, months, workers, inputs='xlsx'):
+    """
+    在独立目录中准备数据并运行化验、称重流水线，返回本次的计时结果。
+    inputs 为 'xlsx' 时按倍数生成模拟月报（openpyxl 读取）；为 'xls' 时把实际月报
+    复制为 scale 倍的月份数（xlrd 读取，与生产环境相同），此时 months 不起作用。
+    """
+    import cz
+    import hy
+    import store
+
+    if inputs == 'xls':
+        work_dir = os.path.abspath(os.path.join(data_dir, f"xls-x{scale}"))
+        hy_dir, cz_dir = synth.replicate_samples(work_dir, scale)
+    else:
+        work_dir = os.path.abspath(os.path.join(data_dir, f"x{scale}"))
+        hy_dir, cz_dir = synth.generate_scaled(work_dir, scale, months)
+
+    # 输出文件、数据仓均写入工作目录，不影响正式结果
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        result = {
+            'hy': run_pipeline('hy', hy.run_analysis, hy_dir, workers),
+            'cz': run_pipeline('cz', cz.run_weight_processing, cz_dir, workers),
+        }
+        result['preview'] = {'hy': time_preview('hy'), 'cz': time_preview('cz')}
+        result['rows'] = {
+            'hy': len(store.load_table('hy', '原始数据')),
+            'cz': len(store.load_table('cz', '合并数据')),
+        }
+    finally:
+        os.chdir(cwd)
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _change(current, previous):
+    if not previous:
+        return ''
+    return f" ({(current - previous) / previous:+.0%})"
+
+
+def report(record, previous):
+    """打印一次结果，并与相同倍数、相同进程数的上一次结果对比"""
+    print(f"{record['inputs']} x{record['scale']}  化验 {record['rows']['hy']} 行 / 称重 {record['rows']['cz']} 行")
+    for name in ('hy', 'cz'):
+        run = record[name]
+        old = previous[name] if previous else {}
+        old_stages = old.get('stages', {})
+        parts = [f"{stage} {seconds:.3f}s{_change(seconds, old_stages.get(stage))}"
+                 for stage, seconds in run['stages'].items()]
+        parts.append(f"合计 {run['total']:.3f}s{_change(run['total'], old.get('total'))}")
+        old_preview = previous['preview'][name] if previous else None
+        parts.append(f"预览 {record['preview'][name]:.3f}s{_change(record['preview'][name], old_preview)}")
+        if run['peak_mb'] is not None:
+            parts.append(f"内存峰值 {run['peak_mb']:.1f}MB")
+        if run.get('alloc_peak_mb') is not None:
+            parts.append(f"Python 分配峰值 {run['alloc_peak_mb']:.1f}MB")
+        print(f"  {name}: " + ', '.join(parts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='化验/称重流水线基准测试')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='数据量倍数（相对当前实际数据量）')
+    parser.add_argument('--months', type=int, default=synth.BASE_MONTHS, help='模拟月报的月份数')
+    parser.add_argument('--inputs', nargs='+', choices=INPUTS, default=list(INPUTS),
+                        help='xls: 复制实际月报（xlrd，与生产环境相同）；xlsx: 生成的模拟月报（openpyxl）')
+    parser.add_argument('--workers', type=int, default=1, help='月报解析进程数')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--output', default=RESULTS_FILE, help='结果追加写入的 JSON Lines 文件')
+    parser.add_argument('--memory', action='store_true', help='同时统计 Python 分配的内存峰值（tracemalloc 会使运行慢数倍）')
+    args = parser.parse_args(argv)
+
+    import metrics
+    metrics.TRACE_MEMORY = args.memory
+
+    history = load_results(args.output)
+    commit = _commit()
+    for inputs in args.inputs:
+        for scale in args.scales:
+            record = {
+                'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                'commit': commit,
+                'inputs': inputs,
+                'scale': scale,
+                'months': args.months if inputs == 'xlsx' else None,
+                'workers': args.workers,
+                'memory': args.memory,
+                'python': sys.version.split()[0],
+            }
+            record.update(run_scale(scale, args.data_dir, args.months, args.workers, inputs))
+
+            # 较早的结果没有 inputs，均为模拟的 .xlsx 月报
+            previous = next((r for r in reversed(history)
+                             if r.get('inputs', 'xlsx') == inputs and r['scale'] == scale
+                             and r['months'] == record['months'] and r['workers'] == args.workers
+                             and r.get('memory') == args.memory), None)
+            report(record, previous)
+
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            history.append(record)
+
+
+if __name__ == "__main__":
+    main()
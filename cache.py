@@ -0,0 +1,87 @@
+import os
+import hashlib
+import tempfile
+
+# 解析缓存目录，可通过环境变量 RM_CACHE_DIR 修改
+CACHE_DIR = os.environ.get('RM_CACHE_DIR', '.cache')
+
+
+def _cache_key(file_path, version, stat_path=None):
+    """根据文件路径、大小和修改时间生成缓存键，文件变动后键随之变化"""
+    stat = os.stat(stat_path or file_path)
+    path_hash = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:12]
+    return path_hash, f"{path_hash}-{stat.st_size}-{stat.st_mtime_ns}-v{version}.pkl"
+
+
+def _kind_dir(kind, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, kind)
+
+
+def load(kind, file_path, version=1, cache_dir=None):
+    """读取某个月报文件的解析缓存，未命中时返回 None"""
+    # 只在读取时导入 pandas，runner 等只用到缓存目录的模块导入本模块时不加载它
+    import pandas as pd
+
+    try:
+        _, name = _cache_key(file_path, version)
+        cache_file = os.path.join(_kind_dir(kind, cache_dir), name)
+        if os.path.exists(cache_file):
+            return pd.read_pickle(cache_file)
+    except Exception:
+        # 缓存损坏时视为未命中，重新解析
+        pass
+    return None
+
+
+def exists(kind, file_path, version=1, cache_dir=None):
+    """某个月报文件当前内容的解析缓存是否存在"""
+    try:
+        _, name = _cache_key(file_path, version)
+    except OSError:
+        return False
+    return os.path.exists(os.path.join(_kind_dir(kind, cache_dir), name))
+
+
+def save(kind, file_path, df, version=1, cache_dir=None, stat_path=None):
+    """
+    保存某个月报文件的解析结果，并清理该文件的旧缓存。
+    stat_path 为尚未移动到 file_path 的文件时，按它的大小和修改时间生成缓存键
+    （os.replace 移动后二者不变），文件出现在 file_path 时缓存已经可用。
+    """
+    folder = _kind_dir(kind, cache_dir)
+    os.makedirs(folder, exist_ok=True)
+    path_hash, name = _cache_key(file_path, version, stat_path)
+
+    # 先写临时文件再替换，避免中断时留下半个缓存文件；临时文件名唯一，
+    # 同一进程的多个线程同时保存同一文件时互不影响
+    fd, tmp_file = tempfile.mkstemp(prefix=f"{name}.", suffix='.tmp', dir=folder)
+    os.close(fd)
+    try:
+        df.to_pickle(tmp_file)
+        os.replace(tmp_file, os.path.join(folder, name))
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    for old in os.listdir(folder):
+        if old.startswith(path_hash + '-') and old != name and old.endswith('.pkl'):
+            try:
+                os.remove(os.path.join(folder, old))
+            except OSError:
+                pass
+
+
+def clear(kind=None, cache_dir=None):
+    """清空缓存，kind 为空时清空全部"""
+    root = cache_dir or CACHE_DIR
+    if kind:
+        folders = [_kind_dir(kind, cache_dir)]
+    elif os.path.exists(root):
+        folders = [os.path.join(root, d) for d in os.listdir(root)]
+    else:
+        folders = []
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
@@ -0,0 +1,239 @@
+"""
+命令行工具，供计划任务（cron / Windows 任务计划程序）调用，无需启动 Web 服务或桌面程序。
+
+    python cli.py run [hy cz shc]          按依赖关系执行汇总，输入未变动的阶段跳过
+    python cli.py status                   各流水线的数据仓版本和输入月报情况
+    python cli.py list [hy cz shc]         列出输入文件夹中的月报
+    python cli.py export cz --start 2025-01 --end 2025-06 --format csv
+
+pandas 和 Excel 读写库只在需要它们的子命令中导入，--help、status、list 不加载它们。
+run 有阶段失败或未完成时返回码为 1。
+"""
+import argparse
+import datetime
+import os
+import sys
+
+# 流水线 -> (名称, 输入文件夹)
+PIPELINES = {
+    'hy': ('化验月报汇总', '无人值守化验月报'),
+    'cz': ('称重月报汇总', '无人值守称重月报'),
+    'shc': ('收耗存汇总', '收耗存数据'),
+}
+REPORT_EXTENSIONS = ('.xls', '.xlsx')
+EXPORT_FORMATS = ('xlsx', 'csv', 'json')
+# 按月份范围导出时依次查找的月份列（化验原始数据只有化验日期，月度统计为 统计月份）；
+# 无法解析为月份的行（如 年度累计）不在任何月份范围内
+MONTH_COLUMNS = ('报表月份', '统计月份', '化验日期', '日期')
+
+
+def _reports(folder):
+    """[(文件名, 大小, 修改时间)]，按文件名排序；跳过 Excel 打开时产生的 ~$ 锁文件"""
+    if not os.path.isdir(folder):
+        return []
+    files = []
+    for entry in os.scandir(folder):
+        if entry.name.startswith('~$') or not entry.name.lower().endswith(REPORT_EXTENSIONS):
+            continue
+        stat = entry.stat()
+        files.append((entry.name, stat.st_size, stat.st_mtime))
+    return sorted(files)
+
+
+def _time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _log(message):
+    print(f"[{datetime.datetime.now():%H:%M:%S}] {message}", flush=True)
+
+
+def cmd_run(args):
+    import runner
+
+    targets = [name for name in args.pipelines if name != 'all']
+    status = runner.run(targets or None, log=_log, workers=args.workers, force=args.force)
+    failed = [name for name, result in status.items() if result in ('failed', 'blocked')]
+    if failed:
+        _log(f"未完成的阶段: {'、'.join(failed)}")
+        return 1
+    return 0
+
+
+def cmd_status(args):
+    import store
+
+    for name, (label, folder) in PIPELINES.items():
+        reports = _reports(folder)
+        newest = max((mtime for _, _, mtime in reports), default=None)
+        print(f"{name}  {label}")
+        print(f"    输入: {folder}（{len(reports)} 个月报"
+              + (f"，最近修改 {_time(newest)}）" if newest else "）"))
+        try:
+            manifest = store.info(name)
+        except FileNotFoundError:
+            print("    数据仓: 尚未生成")
+            continue
+        print(f"    数据仓: 更新于 {_time(manifest['updated'])}，{len(manifest['tables'])} 张表，"
+              f"保留 {len(manifest.get('versions', []))} 个版本")
+        if newest and newest > manifest['updated']:
+            print("    有月报在上次汇总之后修改，需要重新执行")
+    return 0
+
+
+def cmd_list(args):
+    for name in args.pipelines or list(PIPELINES):
+        label, folder = PIPELINES[name]
+        reports = _reports(folder)
+        print(f"{name}  {folder}（{len(reports)} 个月报）")
+        for filename, size, mtime in reports:
+            print(f"    {filename}  {size / 1024:.0f} KB  {_time(mtime)}")
+    return 0
+
+
+def _month_column(df):
+    return next((col for col in MONTH_COLUMNS if col in df.columns), None)
+
+
+def _month(value):
+    """YYYY-MM 转换为整数月份键，无效时抛出 ValueError"""
+    import keys
+
+    month = keys.month_key([value])[0]
+    if month == keys.MISSING:
+        raise ValueError(f"无效的月份: {value}")
+    return month
+
+
+def _month_range(df, start, end):
+    """按月份列筛选 start 至 end（含）的行"""
+    import keys
+
+    months = keys.month_key(df[_month_column(df)])
+    keep = months != keys.MISSING
+    if start:
+        keep &= months >= _month(start)
+    if end:
+        keep &= months <= _month(end)
+    return df[keep]
+
+
+def cmd_export(args):
+    import schema
+    import store
+
+    name = args.pipeline
+    try:
+        # 只读取一次清单，导出的各表来自同一个版本
+        manifest = store.info(name)
+    except FileNotFoundError as e:
+        _log(str(e))
+        return 1
+    names = manifest['tables']
+    tables = args.table or names
+    unknown = [t for t in tables if t not in names]
+    if unknown:
+        _log(f"未知的表: {'、'.join(unknown)}（可选: {'、'.join(names)}）")
+        return 1
+
+    frames = {table: store.load_table(name, table, manifest) for table in tables}
+    if args.start or args.end:
+        undated = [table for table, df in frames.items() if _month_column(df) is None]
+        if undated and args.table:
+            _log(f"表 {'、'.join(undated)} 没有月份列，不能按月份范围导出")
+            return 1
+        if undated:
+            _log(f"跳过没有月份列的表: {'、'.join(undated)}")
+        try:
+            selected = {table: _month_range(df, args.start, args.end)
+                        for table, df in frames.items() if table not in undated}
+        except ValueError as e:
+            _log(str(e))
+            return 1
+        if not selected:
+            return 1
+    else:
+        selected = frames
+    display = {table: store.display(name, table, manifest) for table in tables}
+    os.makedirs(args.output_dir, exist_ok=True)
+    suffix = '-'.join(filter(None, [args.start, args.end]))
+    for fmt in args.format or ['xlsx']:
+        if fmt == 'xlsx':
+            import export
+
+            path = os.path.join(args.output_dir, f"{PIPELINES[name][0]}{'-' + suffix if suffix else ''}.xlsx")
+            export.write_workbook(path, selected, display=display)
+            _log(f"已导出 {path}")
+            continue
+        for table, df in selected.items():
+            path = os.path.join(args.output_dir, f"{name}-{table}{'-' + suffix if suffix else ''}.{fmt}")
+            df = schema.with_display(df, display[table])
+            if fmt == 'csv':
+                # 带 BOM，Excel 直接打开不会乱码
+                df.to_csv(path, index=False, encoding='utf-8-sig')
+            else:
+                import json
+                import preview
+
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(preview.to_columns(df), f, ensure_ascii=False)
+            _log(f"已导出 {path}（{len(df)} 行）")
+    return 0
+
+
+def _pipeline_names(*extra):
+    """位置参数的取值检查（nargs='*' 与 choices 同用时，不给参数会报错）"""
+    names = [*PIPELINES, *extra]
+
+    def check(value):
+        if value not in names:
+            raise argparse.ArgumentTypeError(f"可选: {', '.join(names)}")
+        return value
+    return check
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='燃料管理系统命令行工具（适合计划任务调用）')
+    parser.add_argument('--cache-dir', help='解析缓存目录（默认 .cache，同环境变量 RM_CACHE_DIR）')
+    parser.add_argument('--store-dir', help='数据仓目录（默认 store，同环境变量 RM_STORE_DIR）')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='按依赖关系执行汇总，跳过输入未变动的阶段')
+    run.add_argument('pipelines', nargs='*', type=_pipeline_names('all'), metavar='pipeline',
+                     help='要更新的流水线 hy/cz/shc（连同其依赖），默认全部')
+    run.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='月报解析进程数')
+    run.add_argument('--force', action='store_true', help='不跳过输入未变动的阶段')
+    run.set_defaults(func=cmd_run)
+
+    status = commands.add_parser('status', help='各流水线的数据仓版本和输入月报情况')
+    status.set_defaults(func=cmd_status)
+
+    listing = commands.add_parser('list', help='列出输入文件夹中的月报')
+    listing.add_argument('pipelines', nargs='*', type=_pipeline_names(), metavar='pipeline',
+                         help='hy/cz/shc，默认全部')
+    listing.set_defaults(func=cmd_list)
+
+    export = commands.add_parser('export', help='从数据仓导出汇总表，可按月份范围筛选')
+    export.add_argument('pipeline', choices=list(PIPELINES))
+    export.add_argument('--table', action='append', help='要导出的表（可重复），默认全部')
+    export.add_argument('--start', help='起始月份 YYYY-MM（含）')
+    export.add_argument('--end', help='结束月份 YYYY-MM（含）')
+    export.add_argument('--format', action='append', choices=EXPORT_FORMATS,
+                        help='输出格式（可重复），默认 xlsx；csv、json 每张表一个文件')
+    export.add_argument('--output-dir', default='.', help='输出目录')
+    export.set_defaults(func=cmd_export)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # 缓存与数据仓目录在模块导入时读取，须在导入流水线模块之前设置
+    if args.cache_dir:
+        os.environ['RM_CACHE_DIR'] = args.cache_dir
+    if args.store_dir:
+        os.environ['RM_STORE_DIR'] = args.store_dir
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,87 @@
+import numpy as np
 import pandas as pd
 import os
-import re
 
-def run_weight_processing(folder_path="无人值守称重月报", log_callback=None):
+import aggregate
+import export
+import ingest
+import keys
+import metrics
+import schema
+import store
+import suppliers
+
+# 称重月报中需要读取的列及其重命名
+source_columns = ['序号', '供应单位', '运输单位', '车数', '到厂重量（t）']
+source_names = ['序号', '供应单位', '运输单位', '车数', '重量']
+
+# 从化验数据关联到称重数据的指标，发热量排在最前以保持原有列的位置
+lab_columns = ['发热量', '全水Mt', '全硫', '灰分空干基Aad', '挥发份Vdaf']
+
+# 日志中最多列出的未匹配键个数
+MAX_LISTED_KEYS = 10
+
+# 以分类类型保存的名称列
+category_columns = ['供应单位', '运输单位']
+
+# 导出、预览时才生成的显示列：报表月份供应商 = 报表月份-供应单位
+display_columns = {
+    'Sheet1': [schema.month_label('报表月份供应商', 4, '报表月份', '供应单位')],
+    '合并数据': [schema.month_label('报表月份供应商', 4, '报表月份', '供应单位')],
+}
+
+# 解析逻辑版本号，修改 parse_report 后需加一以使旧缓存失效
+PARSE_VERSION = 7
+
+def parse_report(file_path):
+    """解析单个称重月报文件，返回整理后的数据框"""
+    file = os.path.basename(file_path)
+    
+    # 单次读取文件，只取需要的列，并将"到厂重量（t）"列重命名为"重量"
+    df = ingest.read_report(file_path, source_columns, source_names)
+    
+    # 添加月份信息列（文件名为 YYYY-MM，以 Period 保存）
+    df['报表月份'] = pd.Series(pd.Period(os.path.splitext(file)[0], freq='M'), index=df.index)
+    return schema.categorize(df, category_columns)
+
+def join_lab_metrics(df, lab_df, log=print):
+    """
+    按整数键 (月份, 供应单位编码) 一次关联化验汇总的各项指标，返回与 df 行对应的指标数据框。
+    称重月份取报表月份，化验月份取化验日期，供应单位与化验的公司名称共用一套编码；
+    同一键有多条化验记录时取平均。双方未匹配的键通过 log 报告。
+    """
+    columns = [col for col in lab_columns if col in lab_df.columns]
+    units, (lab_codes, weight_codes) = keys.shared_codes(lab_df['公司名称'], df['供应单位'])
+    lab_keys = keys.combine(keys.month_key(lab_df['化验日期']), lab_codes, len(units))
+    weight_keys = keys.combine(keys.month_key(df['报表月份']), weight_codes, len(units))
+
+    lab = lab_df[columns].groupby(lab_keys).mean()
+    lab = lab[lab.index != keys.MISSING]
+    matched = lab.reindex(weight_keys)
+    matched.index = df.index
+
+    # 报告称重数据中没有化验记录的 月份-供应单位
+    unmatched = ~np.isin(weight_keys, lab.index)
+    if unmatched.any():
+        pairs = df.loc[unmatched, ['报表月份', '供应单位']].drop_duplicates()
+        names = [f"{month}-{unit}" for month, unit in pairs.itertuples(index=False)]
+        log(f"警告：{int(unmatched.sum())} 条称重记录（{len(names)} 个 月份-供应单位）未找到化验数据: "
+            + '、'.join(names[:MAX_LISTED_KEYS]) + ('等' if len(names) > MAX_LISTED_KEYS else ''))
+
+    # 报告化验数据中没有称重记录的 月份-公司名称
+    unused = lab.index[~np.isin(lab.index, weight_keys)]
+    if len(unused):
+        months, codes = keys.split(unused, len(units))
+        names = [f"{month}-{units[code]}" for month, code
+                 in zip(keys.month_label(months), codes)]
+        log(f"提示：{len(names)} 个 月份-公司名称 的化验数据没有对应的称重记录: "
+            + '、'.join(names[:MAX_LISTED_KEYS]) + ('等' if len(names) > MAX_LISTED_KEYS else ''))
+    return matched
+
+
+@metrics.instrumented('cz')
+def run_weight_processing(folder_path="无人值守称重月报", log_callback=None, use_cache=True, workers=1,
+                          progress_callback=None, cancel_event=None, run_metrics=None):
     def log(message):
         if log_callback:
             log_callback(message)
@@ -14,149 +93,118 @@ def run_weight_processing(folder_path="无人值守称重月报", log_callback=N
         log(f"错误: 文件夹 '{folder_path}' 不存在")
         return
 
-    excel_files = [f for f in os.listdir(folder_path) if f.endswith('.xls')]
+    # 读取所有月报（未变动的文件从缓存读取，其余可并行解析）
+    reports = ingest.load_reports('cz', folder_path, parse_report, log,
+                                  workers=workers, use_cache=use_cache, version=PARSE_VERSION,
+                                  run_metrics=run_metrics, progress=progress_callback,
+                                  cancel=cancel_event)
+    dfs = [df for _, df in reports]
+    run_metrics.lap('读取月报', sum(len(df) for df in dfs))
 
-    # 创建一个空的DataFrame列表
-    dfs = []
-
-    # 读取每个xls文件并添加到列表中
-    for file in excel_files:
-        file_path = os.path.join(folder_path, file)
-        try:
-            # 首先读取Excel文件以获取总行数
-            temp_df = pd.read_excel(file_path)
-            total_rows = len(temp_df)
-            
-            # 重新读取文件，跳过前两行，不读取最后一行
-            df = pd.read_excel(file_path, 
-                              skiprows=2,           # 跳过前两行
-                              nrows=total_rows-3)   # 总行数减去前两行和最后一行
-            
-            # 添加月份信息列
-            df['报表月份'] = file.replace('.xls', '')
-            
-            # 重命名"到厂重量（t）"列为"重量"
-            if '到厂重量（t）' in df.columns:
-                df = df.rename(columns={'到厂重量（t）': '重量'})
-                
-            # 添加供应商列（提取供应单位中括号前的部分，并清除右侧数字）
-            df['供应商全称'] = df['供应单位'].apply(lambda x: 
-                re.sub(r'\d+$', '', str(x).split('（')[0].split('(')[0]).strip() if pd.notnull(x) else '')
-            #添加报表月份和供应商列
-            df['报表月份供应商'] = df['报表月份'] + '-' + df['供应单位']
-            
-            dfs.append(df)
-            log(f"成功处理文件: {file}")
-        except Exception as e:
-            log(f"处理文件 {file} 时出错: {str(e)}")
-
-    # 合并所有DataFrame
+    # 合并所有DataFrame（先统一名称分类，合并后仍为分类类型）
     if dfs:
+        for column in category_columns:
+            suppliers.unify(dfs, column)
         combined_df = pd.concat(dfs, ignore_index=True)
+        # 取消时保留上一次的结果，不再导出
+        ingest.check_cancelled(cancel_event)
         
         try:
-            # 选择并重排列顺序，加入供应商列
-            selected_columns = ['序号', '报表月份', '供应单位', '供应商全称','报表月份供应商', '运输单位', '车数', '重量']
-            combined_df = combined_df[selected_columns]
+            # 选择并重排列顺序（报表月份供应商在导出时生成）
+            selected_columns = ['序号', '报表月份', '供应单位', '运输单位', '车数', '重量']
+            combined_df = schema.downcast(combined_df[selected_columns])
+            run_metrics.lap('合并数据', len(combined_df))
+            
+            # 添加供应商列（提取供应单位中括号前的部分，并清除右侧数字）。在合并后的数据上提取，
+            # 并行解析时每个不同的名称也只处理一次，结果为分类类型
+            combined_df.insert(3, '供应商全称', suppliers.normalize(combined_df['供应单位'], strip_digits=True, na_value=''))
+            run_metrics.lap('供应商名称', len(combined_df))
             
-            # 尝试从化验月报汇总中读取发热量数据
+            # 尝试从数据仓中读取化验汇总数据，关联发热量等全部化验指标
             try:
-                # 读取化验月报汇总文件
-                hy_df = pd.read_excel("化验月报汇总.xlsx", sheet_name='原始数据')
-                
-                # 创建发热量查找字典，基于"报表月份供应商"字段
-                heat_lookup = hy_df.groupby('报表月份供应商')['发热量'].mean().to_dict()
-                
-                # 在称重数据中添加发热量字段
-                combined_df['发热量'] = combined_df['报表月份供应商'].map(heat_lookup)
+                # 读取化验汇总的原始数据表
+                hy_df = store.load_table('hy', '原始数据')
                 
-                # 更新列顺序，将发热量字段添加进去
-                selected_columns = ['序号', '报表月份', '供应单位', '供应商全称','报表月份供应商', '运输单位', '车数', '重量', '发热量']
-                combined_df = combined_df[selected_columns]
+                # 按 月份+供应单位 的整数键一次关联，指标列追加在重量之后
+                lab_metrics = join_lab_metrics(combined_df, hy_df, log)
+                combined_df = pd.concat([combined_df, lab_metrics], axis=1)
                 
-                log("成功关联发热量数据")
+                log(f"成功关联化验数据: {'、'.join(lab_metrics.columns)}")
             except FileNotFoundError:
-                log("警告：未找到化验月报汇总.xlsx文件，无法关联发热量数据")
+                log("警告：数据仓中未找到化验汇总数据，请先执行化验月报汇总，无法关联发热量数据")
             except Exception as e:
-                log(f"关联发热量数据时出错: {str(e)}")
+                log(f"关联化验数据时出错: {str(e)}")
+            if '发热量' not in combined_df.columns:
+                # 没有化验数据时照常汇总重量，发热量相关的汇总列为空
+                combined_df['发热量'] = np.nan
+            run_metrics.lap('关联化验数据', len(combined_df))
             
             # 保存合并后的文件
             output_file = "称重月报汇总.xlsx"
-            combined_df.to_excel(output_file, index=False)
+            export.write_workbook(output_file, {'Sheet1': combined_df}, display=display_columns)
             log(f"文件已合并并保存为: {output_file}")
+            run_metrics.lap('导出合并数据', len(combined_df))
             
             # 对不同供应商全称按月及按年进行分类汇总
-            # 首先，确保'报表月份'列的格式为'YYYY-MM'
-            combined_df['报表月份'] = pd.to_datetime(combined_df['报表月份']).dt.strftime('%Y-%m')
-            
-            # 定义加权平均函数
-            def weighted_average(values):
-                # 获取对应的重量数据
-                weights = combined_df.loc[values.index, '重量']
-                # 过滤掉NaN值
-                valid_mask = ~(values.isna() | weights.isna())
-                if valid_mask.sum() == 0:
-                    return None
-                return (values[valid_mask] * weights[valid_mask]).sum() / weights[valid_mask].sum()
-            
-            # 对'报表月份'列进行分组，计算每个月份的供应量和加权平均发热量
-            monthly_supply = combined_df.groupby(['报表月份', '供应商全称']).agg({
-                '重量': 'sum',
-                '发热量': weighted_average
-            }).reset_index()
-            monthly_supply.columns = ['报表月份', '供应商全称', '重量', '加权平均发热量']
+            # 对'报表月份'和'供应商全称'列只分组一次，得到可合并的月度分项汇总（重量合计、
+            # 重量×指标、记录数、最大/最小值），各汇总表及任意月份范围的汇总都由分项合并得到
+            metric_columns = [col for col in lab_columns if col in combined_df.columns]
+            partial_df = aggregate.partials(
+                combined_df, [combined_df['报表月份'], combined_df['供应商全称']], metric_columns, '重量')
+            stats = aggregate.merge_partials(
+                partial_df, [partial_df['报表月份'], partial_df['供应商全称']], metric_columns, '重量')
+            
+            def stats_sheet(columns, names):
+                sheet = stats[columns].copy()
+                sheet.columns = names
+                return sheet.reset_index()
+            
+            # 每个月份的供应量和加权平均发热量
+            monthly_supply = stats_sheet([('重量', 'sum'), ('发热量', 'weighted')], ['重量', '加权平均发热量'])
             
             # 对'供应商全称'列进行分组，计算每个供应商的累计供应量和加权平均发热量
-            cumulative_supply = combined_df.groupby('供应商全称').agg({
-                '重量': 'sum',
-                '发热量': weighted_average
-            }).reset_index()
+            cumulative_supply = aggregate.merge_partials(
+                partial_df, [partial_df['供应商全称']], metric_columns, '重量'
+            )[[('重量', 'sum'), ('发热量', 'weighted')]].reset_index()
             cumulative_supply.columns = ['供应商全称', '重量', '加权平均发热量']
             
-            # 对'报表月份'列进行分组，计算每个月份的平均供应量和平均发热量
-            average_supply = combined_df.groupby(['报表月份', '供应商全称']).agg({
-                '重量': 'mean',
-                '发热量': 'mean'
-            }).reset_index()
-            average_supply.columns = ['报表月份', '供应商全称', '平均重量', '平均发热量']
-            
-            # 对'报表月份'列进行分组，计算每个月份的最大供应量和最大发热量
-            max_supply = combined_df.groupby(['报表月份', '供应商全称']).agg({
-                '重量': 'max',
-                '发热量': 'max'
-            }).reset_index()
-            max_supply.columns = ['报表月份', '供应商全称', '最大重量', '最大发热量']
-            
-            # 对'报表月份'列进行分组，计算每个月份的最小供应量和最小发热量
-            min_supply = combined_df.groupby(['报表月份', '供应商全称']).agg({
-                '重量': 'min',
-                '发热量': 'min'
-            }).reset_index()
-            min_supply.columns = ['报表月份', '供应商全称', '最小重量', '最小发热量']
-            
-            # 创建一个新的Excel文件，添加多个工作表
-            writer = pd.ExcelWriter("称重月报汇总分类.xlsx", engine='xlsxwriter')
-            
-            # 将合并后的数据写入第一个工作表
-            combined_df.to_excel(writer, sheet_name='合并数据', index=False)
-            
-            # 将月度供应量写入第二个工作表
-            monthly_supply.to_excel(writer, sheet_name='月度供应量', index=False)
-            
-            # 将累计年度供应量写入第三个工作表
-            cumulative_supply.to_excel(writer, sheet_name='累计年度供应量', index=False)
-            
-            # 将平均供应量写入第四个工作表
-            average_supply.to_excel(writer, sheet_name='平均供应量', index=False)
-            
-            # 将最大供应量写入第五个工作表
-            max_supply.to_excel(writer, sheet_name='最大供应量', index=False)
-            
-            # 将最小供应量写入第六个工作表
-            min_supply.to_excel(writer, sheet_name='最小供应量', index=False)
+            # 每个月份的平均供应量和平均发热量
+            average_supply = stats_sheet([('重量', 'mean'), ('发热量', 'mean')], ['平均重量', '平均发热量'])
+            
+            # 每个月份的最大供应量和最大发热量
+            max_supply = stats_sheet([('重量', 'max'), ('发热量', 'max')], ['最大重量', '最大发热量'])
+            
+            # 每个月份的最小供应量和最小发热量
+            min_supply = stats_sheet([('重量', 'min'), ('发热量', 'min')], ['最小重量', '最小发热量'])
+            
+            # 按工作表名整理全部汇总表
+            tables = {
+                '合并数据': combined_df,
+                '月度供应量': monthly_supply,
+                '累计年度供应量': cumulative_supply,
+                '平均供应量': average_supply,
+                '最大供应量': max_supply,
+                '最小供应量': min_supply
+            }
+            run_metrics.lap('分组汇总', len(combined_df))
+            
+            # 先写入数据仓，预览和查询直接从数据仓读取，Excel 仅作为导出格式；
+            # 月度分项汇总只保存在数据仓中，供按月份范围汇总
+            # 写入失败时 snapshot 为空，工作簿只导出、不归档
+            snapshot = None
+            try:
+                snapshot = 'cz', store.save_tables('cz', tables, display=display_columns,
+                                                   internal={aggregate.PARTIALS_TABLE: partial_df})
+                # 合并数据工作簿在写入数据仓之前已导出，归入本次的快照
+                store.add_export('cz', output_file, snapshot[1])
+                log("汇总数据已写入数据仓")
+            except Exception as e:
+                log(f"写入数据仓时出错: {str(e)}")
+            run_metrics.lap('写入数据仓')
             
-            # 保存文件并关闭
-            writer.close()
+            # 逐行一次写出合并数据及各汇总工作表
+            export.write_workbook("称重月报汇总分类.xlsx", tables, display=display_columns, snapshot=snapshot)
+            run_metrics.lap('导出分类', sum(len(t) for t in tables.values()))
             log("分类汇总文件已保存为: 称重月报汇总分类.xlsx")
         except KeyError as e:
             log(f"错误：找不到列 {e}")
@@ -0,0 +1,90 @@
+import os
+import tempfile
+
+import pandas as pd
+
+import schema
+import store
+
+# 与 pandas to_excel 默认一致的日期格式
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+# 表头样式，与以前 pandas to_excel 导出的工作簿一致：加粗、细边框、水平居中、顶端对齐
+HEADER_FORMAT = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+
+
+def write_workbook(path, tables, number_formats=None, display=None, snapshot=None):
+    """
+    一次写出整个工作簿的所有工作表。先写入临时文件，完成后再替换 path，
+    读取方不会读到写了一半的文件。snapshot 为 (流水线名称, 版本号) 时，同时把工作簿
+    加入数据仓中该版本的快照（版本号为 store.save_tables 的返回值，见 store.add_export），
+    下载从快照读取；数据仓写入失败时传 None，只导出文件。
+
+    tables 为 {工作表名: 数据框}；number_formats 为 {工作表名: {列序号: 数字格式}}，
+    例如 {'月度统计': {2: '0.00'}}。display 为 {工作表名: 显示列定义}，
+    显示列在写入时才生成；月份（Period）列写为 'YYYY-MM'。
+    使用 xlsxwriter 的 constant_memory 模式逐行写入，
+    大表（原始数据/合并数据）不会在内存中再保留一份单元格副本。
+    """
+    import xlsxwriter
+
+    number_formats = number_formats or {}
+    display = display or {}
+    root, ext = os.path.splitext(path)
+    fd, tmp_file = tempfile.mkstemp(prefix=f"{os.path.basename(root)}.", suffix=f".tmp{ext}",
+                                    dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    try:
+        _write_sheets(xlsxwriter.Workbook(tmp_file, {'constant_memory': True}),
+                      tables, number_formats, display)
+        os.chmod(tmp_file, store.FILE_MODE)
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    if snapshot:
+        name, version = snapshot
+        store.add_export(name, path, version)
+
+
+def _write_sheets(workbook, tables, number_formats, display):
+    """逐个工作表按行写入，最后关闭工作簿"""
+    try:
+        datetime_format = workbook.add_format({'num_format': DATETIME_FORMAT})
+        header_format = workbook.add_format(HEADER_FORMAT)
+        cached_formats = {}
+
+        for sheet_name, df in tables.items():
+            worksheet = workbook.add_worksheet(sheet_name)
+            df = schema.with_display(df, display.get(sheet_name))
+
+            # 每列的单元格格式：指定的数字格式或日期格式
+            formats = []
+            for i, col in enumerate(df.columns):
+                num_format = number_formats.get(sheet_name, {}).get(i)
+                if num_format:
+                    if num_format not in cached_formats:
+                        cached_formats[num_format] = workbook.add_format({'num_format': num_format})
+                    formats.append(cached_formats[num_format])
+                elif pd.api.types.is_datetime64_any_dtype(df[col]):
+                    formats.append(datetime_format)
+                else:
+                    formats.append(None)
+
+            # constant_memory 模式要求按行顺序写入
+            for i, col in enumerate(df.columns):
+                worksheet.write_string(0, i, str(col), header_format)
+
+            columns = [
+                (schema.month_text(df[col]) if isinstance(df[col].dtype, pd.PeriodDtype) else df[col]).tolist()
+                for col in df.columns
+            ]
+            for r in range(len(df)):
+                row = r + 1
+                for c, values in enumerate(columns):
+                    value = values[r]
+                    # 空值保持空白单元格
+                    if value is None or value != value:
+                        continue
+                    worksheet.write(row, c, value, formats[c])
+    finally:
+        workbook.close()
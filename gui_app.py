@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 import sys
+import queue
 import threading
 from datetime import datetime
 import os
@@ -12,27 +13,49 @@ sys.path.append(os.getcwd())
 try:
     import hy
     import cz
+    import ingest
+    import runner
+    import watch
 except ImportError as e:
     print(f"Error importing modules: {e}")
     # We will handle this in the GUI if modules are missing, but for now let's assume they are there
     pass
 
 class PrintLogger:
-    def __init__(self, text_widget):
-        self.text_widget = text_widget
+    # Writes may come from any thread; the Tk main loop drains the queue
+    def __init__(self, log_queue):
+        self.log_queue = log_queue
 
     def write(self, message):
-        self.text_widget.configure(state='normal')
-        self.text_widget.insert(tk.END, message)
-        self.text_widget.see(tk.END)
-        self.text_widget.configure(state='disabled')
+        self.log_queue.put(message)
 
     def flush(self):
         pass
 
+# The log queue is drained every LOG_POLL_MS, at most LOG_BATCH messages per
+# widget update; older lines are dropped beyond MAX_LOG_LINES
+LOG_POLL_MS = 100
+LOG_BATCH = 1000
+MAX_LOG_LINES = 5000
+
+# Input folder of each task, watched when automatic processing is on
+TASK_FOLDERS = {
+    'hy': '无人值守化验月报',
+    'cz': '无人值守称重月报',
+    'shc': '收耗存数据'
+}
+
 class FuelManagementApp:
     def __init__(self, root):
         self.root = root
+        self.busy = False
+        self.watcher = None
+        self.log_queue = queue.SimpleQueue()
+        # Latest (done, total, filename) reported by the running task
+        self.progress = None
+        self.cancel_event = None
+        # A folder changed while a task was running: update everything afterwards
+        self.rerun_pending = False
         self.root.title("燃料管理系统数据处理助手")
         self.root.geometry("800x600")
         
@@ -62,6 +85,7 @@ class FuelManagementApp:
         # Grid layout for buttons
         btn_frame.columnconfigure(0, weight=1)
         btn_frame.columnconfigure(1, weight=1)
+        btn_frame.columnconfigure(2, weight=1)
 
         # Analysis Button
         self.btn_hy = ttk.Button(
@@ -79,14 +103,47 @@ class FuelManagementApp:
         )
         self.btn_cz.grid(row=0, column=1, padx=10, pady=10, ipady=10, sticky="ew")
 
+        # Run-all Button: only stages whose inputs changed are rerun
+        self.btn_all = ttk.Button(
+            btn_frame,
+            text="③ 全部执行（跳过未变动）",
+            command=self.start_all_task
+        )
+        self.btn_all.grid(row=0, column=2, padx=10, pady=10, ipady=10, sticky="ew")
+
         # Description Label
         desc_label = ttk.Label(
             btn_frame, 
-            text="说明：请确保相关Excel报表已放入对应的文件夹中（无人值守化验月报 / 无人值守称重月报）",
+            text="说明：请确保相关Excel报表已放入对应的文件夹中（无人值守化验月报 / 无人值守称重月报 / 收耗存数据）",
             font=("Microsoft YaHei UI", 9),
             foreground="#666666"
         )
-        desc_label.grid(row=1, column=0, columnspan=2, pady=(10, 0))
+        desc_label.grid(row=1, column=0, columnspan=3, pady=(10, 0))
+
+        # Watch toggle: rerun a task automatically when its folder changes
+        self.watch_var = tk.BooleanVar(value=False)
+        watch_check = ttk.Checkbutton(
+            btn_frame,
+            text="监视文件夹，报表变动后自动汇总",
+            variable=self.watch_var,
+            command=self.toggle_watch
+        )
+        watch_check.grid(row=2, column=0, columnspan=3, pady=(10, 0))
+
+        # Progress of the running task: files read so far out of all files
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.pack(fill=tk.X, pady=(0, 10))
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate')
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.progress_var = tk.StringVar()
+        ttk.Label(progress_frame, textvariable=self.progress_var, width=30).pack(side=tk.LEFT, padx=10)
+        self.btn_cancel = ttk.Button(
+            progress_frame,
+            text="取消",
+            command=self.cancel_task,
+            state='disabled'
+        )
+        self.btn_cancel.pack(side=tk.LEFT)
 
         # Log Area
         log_frame = ttk.LabelFrame(main_frame, text="处理日志", padding="10")
@@ -113,14 +170,71 @@ class FuelManagementApp:
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
         # Redirect stdout
-        sys.stdout = PrintLogger(self.log_area)
-        sys.stderr = PrintLogger(self.log_area)
+        sys.stdout = PrintLogger(self.log_queue)
+        sys.stderr = PrintLogger(self.log_queue)
 
         self.log("系统启动完成。")
+        self.drain_log()
 
     def log(self, message):
+        # Safe to call from worker threads: only the queue is touched here
         timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"[{timestamp}] {message}")
+        self.log_queue.put(f"[{timestamp}] {message}\n")
+
+    def on_progress(self, done, total, filename):
+        # Called on the worker thread; picked up by drain_log
+        self.progress = (done, total, filename)
+
+    def drain_log(self):
+        messages = []
+        while len(messages) < LOG_BATCH:
+            try:
+                messages.append(self.log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if messages:
+            self.log_area.configure(state='normal')
+            self.log_area.insert(tk.END, ''.join(messages))
+            lines = int(self.log_area.index('end-1c').split('.')[0])
+            if lines > MAX_LOG_LINES:
+                self.log_area.delete('1.0', f'{lines - MAX_LOG_LINES + 1}.0')
+            self.log_area.see(tk.END)
+            self.log_area.configure(state='disabled')
+
+        progress = self.progress
+        if progress:
+            done, total, filename = progress
+            self.progress_bar.configure(maximum=max(total, 1), value=done)
+            self.progress_var.set(f"{done}/{total} {filename}")
+        self.root.after(LOG_POLL_MS, self.drain_log)
+
+    def cancel_task(self):
+        if self.cancel_event:
+            self.cancel_event.set()
+            self.btn_cancel.config(state='disabled')
+            self.log("正在取消，当前文件处理完后停止...")
+
+    def toggle_watch(self):
+        if self.watch_var.get():
+            self.watcher = watch.FolderWatcher(TASK_FOLDERS, self.on_folder_change, log=self.log).start()
+            mode = "文件系统事件" if self.watcher.mode == 'events' else "定时扫描"
+            self.log(f"已开启文件夹监视（{mode}）。")
+        elif self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+            self.log("已关闭文件夹监视。")
+
+    def on_folder_change(self, task, files):
+        # Called on the watcher thread; hand over to the Tk main loop
+        self.log(f"检测到 {TASK_FOLDERS[task]} 中的文件变动: {'、'.join(files)}")
+        self.root.after(0, self.auto_run)
+
+    def auto_run(self):
+        # The runner reruns the changed pipeline and the ones that depend on it
+        if self.busy:
+            self.rerun_pending = True
+        else:
+            self.start_all_task()
 
     def start_hy_task(self):
         self.disable_buttons()
@@ -134,33 +248,76 @@ class FuelManagementApp:
         self.log(">>> 开始执行称重月报汇总任务...")
         threading.Thread(target=self.run_cz_task, daemon=True).start()
 
+    def start_all_task(self):
+        self.disable_buttons()
+        self.status_var.set("正在执行全部汇总...")
+        self.log(">>> 开始执行全部汇总任务（跳过输入未变动的阶段）...")
+        threading.Thread(target=self.run_all_task, daemon=True).start()
+
+    def run_all_task(self):
+        try:
+            status = runner.run(log=self.log, progress=self.on_progress, cancel=self.cancel_event)
+            failed = [name for name, result in status.items() if result in ('failed', 'blocked')]
+            if 'cancelled' in status.values():
+                self.log("<<< 全部汇总任务已取消，数据仓保留上一次的结果。")
+            elif failed:
+                self.log(f"<<< 全部汇总任务结束，未完成的阶段: {'、'.join(failed)}")
+            else:
+                self.log("<<< 全部汇总任务完成。")
+        except Exception as e:
+            self.log(f"!!! 任务出错: {e}")
+        finally:
+            self.root.after(0, lambda: self.status_var.set("就绪"))
+            self.root.after(0, self.enable_buttons)
+
     def run_hy_task(self):
         try:
-            hy.run_analysis()
+            hy.run_analysis(log_callback=self.log, progress_callback=self.on_progress,
+                            cancel_event=self.cancel_event)
             self.log("<<< 化验汇总任务完成。")
+        except ingest.Cancelled:
+            self.log("<<< 化验汇总任务已取消，保留上一次的结果。")
         except Exception as e:
             self.log(f"!!! 任务出错: {e}")
         finally:
-            self.root.after(0, self.enable_buttons)
             self.root.after(0, lambda: self.status_var.set("就绪"))
+            self.root.after(0, self.enable_buttons)
 
     def run_cz_task(self):
         try:
-            cz.run_weight_processing()
+            cz.run_weight_processing(log_callback=self.log, progress_callback=self.on_progress,
+                                     cancel_event=self.cancel_event)
             self.log("<<< 称重汇总任务完成。")
+        except ingest.Cancelled:
+            self.log("<<< 称重汇总任务已取消，保留上一次的结果。")
         except Exception as e:
             self.log(f"!!! 任务出错: {e}")
         finally:
-            self.root.after(0, self.enable_buttons)
             self.root.after(0, lambda: self.status_var.set("就绪"))
+            self.root.after(0, self.enable_buttons)
 
     def disable_buttons(self):
+        # Called when a task starts: fresh cancel flag and an empty progress bar
+        self.busy = True
+        self.cancel_event = threading.Event()
+        self.progress = None
+        self.progress_bar.configure(value=0)
+        self.progress_var.set("")
         self.btn_hy.config(state='disabled')
         self.btn_cz.config(state='disabled')
+        self.btn_all.config(state='disabled')
+        self.btn_cancel.config(state='normal')
 
     def enable_buttons(self):
+        self.busy = False
         self.btn_hy.config(state='normal')
         self.btn_cz.config(state='normal')
+        self.btn_all.config(state='normal')
+        self.btn_cancel.config(state='disabled')
+        # Catch up on folder changes seen during the last task
+        if self.rerun_pending:
+            self.rerun_pending = False
+            self.start_all_task()
 
 if __name__ == "__main__":
     root = tk.Tk()
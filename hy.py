@@ -1,7 +1,64 @@
 import pandas as pd
 import os
 
-def run_analysis(folder_path="无人值守化验月报", log_callback=None):
+import aggregate
+import export
+import ingest
+import metrics
+import schema
+import store
+import suppliers
+
+# 需要保留的列索引
+columns_to_keep = [0, 1, 2, 3, 4, 6, 9, 10, 11, 13]
+
+# 新的列名
+new_column_names = [
+    '序号', '公司名称', '来煤量', '化验日期', '全水Mt', 
+    '灰分空干基Aad', '挥发份Vdaf', '固定碳', '全硫', '发热量'
+]
+
+# 需要计算加权平均的全部化验指标
+quality_columns = ['全水Mt', '全硫', '发热量', '挥发份Vdaf', '灰分空干基Aad']
+
+# 分类汇总中各指标对应的工作表（列名与工作表名相同）
+monthly_sheets = [
+    ('发热量', '加权平均发热量'),
+    ('全水Mt', '加权平均全水Mt'),
+    ('全硫', '加权平均全硫'),
+    ('挥发份Vdaf', '加权平均挥发份'),
+    ('灰分空干基Aad', '加权平均灰份'),
+]
+cumulative_sheets = [
+    ('发热量', '累计加权平均发热量'),
+    ('全水Mt', '累计加权平均全水Mt'),
+    ('全硫', '累计加权平均全硫'),
+    ('挥发份Vdaf', '累计加权平均挥发份'),
+]
+
+# 导出、预览时才生成的显示列：报表月份供应商 = 化验月份-公司名称
+display_columns = {
+    '原始数据': [schema.month_label('报表月份供应商', 2, '化验日期', '公司名称')],
+}
+
+# 解析逻辑版本号，修改 parse_report 后需加一以使旧缓存失效
+PARSE_VERSION = 6
+
+def parse_report(file_path):
+    """解析单个化验月报文件，返回整理后的数据框"""
+    # 单次读取文件，只取需要的列并去掉表头和末尾的加权平均行
+    df = ingest.read_report(file_path, columns_to_keep, new_column_names)
+    
+    # 确保公司名称列为字符串类型，并以分类类型保存（供应商全称在合并全部月报后统一提取）
+    df['公司名称'] = df['公司名称'].astype(str).astype('category')
+    
+    #将化验日期转换为日期型,格式为'yyyy-mm-dd'
+    df['化验日期'] = pd.to_datetime(df['化验日期'], format='%Y-%m-%d', errors='coerce')
+    return df
+
+@metrics.instrumented('hy')
+def run_analysis(folder_path="无人值守化验月报", log_callback=None, use_cache=True, workers=1,
+                 progress_callback=None, cancel_event=None, run_metrics=None):
     def log(message):
         if log_callback:
             log_callback(message)
@@ -11,245 +68,143 @@ def run_analysis(folder_path="无人值守化验月报", log_callback=None):
     # 创建空列表存储所有数据框
     all_dfs = []
 
-    # 需要保留的列索引
-    columns_to_keep = [0, 1, 2, 3, 4, 6, 9, 10, 11, 13]
-
-    # 新的列名
-    new_column_names = [
-        '序号', '公司名称', '来煤量', '化验日期', '全水Mt', 
-        '灰分空干基Aad', '挥发份Vdaf', '固定碳', '全硫', '发热量'
-    ]
-
     if not os.path.exists(folder_path):
         log(f"错误: 文件夹 '{folder_path}' 不存在")
         return
 
-    # 遍历文件夹中的所有xls文件
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.xls') or filename.endswith('.xlsx'):
-            file_path = os.path.join(folder_path, filename)
-            
-            try:
-                # 读取文件，跳过前两行，使用第三行作为列名
-                df = pd.read_excel(file_path, skiprows=2)
-                log(f"正在处理文件: {filename}")
-                
-                # 删除最后一行
-                df = df.iloc[:-1]
-                
-                # 选择指定的列
-                df = df.iloc[:, columns_to_keep]
-                
-                # 重命名列
-                df.columns = new_column_names
-                
-                # 确保公司名称列为字符串类型
-                df['公司名称'] = df['公司名称'].astype(str)
-                
-                # 在处理之前打印数据类型信息
-                #print("公司名称列的数据类型：", df['公司名称'].dtypes)
-                #print("公司名称列的前几行数据：", df['公司名称'].head())
-                
-                # 添加供应商列（提取公司名称中括号前的部分）
-                df['供应商全称'] = df['公司名称'].str.split('（').str[0]  # 处理中文括号
-                df['供应商全称'] = df['供应商全称'].str.split('(').str[0]  # 处理英文括号
-                #将化验日期转换为日期型,格式为'yyyy-mm-dd'
-                df['化验日期'] = pd.to_datetime(df['化验日期'], format='%Y-%m-%d', errors='coerce')
-                #添加报表月份和供应商列，将化验日期和供应单位合并
-                df['报表月份供应商'] = df['化验日期'].dt.strftime('%Y-%m') + '-' + df['公司名称']
-                #df['报表月份供应商'] = df['化验日期'] + '-' + df['供应商全称']
-                # 检查数据是否为空
-                if df.empty:
-                    log(f"警告：处理后的数据为空 {filename}")
-                    continue
-                    
-                # 将处理后的数据框添加到列表中
-                all_dfs.append(df)
-                
-            except Exception as e:
-                log(f"处理文件 {filename} 时出错: {str(e)}")
+    # 读取文件夹中的所有月报（未变动的文件从缓存读取，其余可并行解析）
+    reports = ingest.load_reports('hy', folder_path, parse_report, log,
+                                  workers=workers, use_cache=use_cache, version=PARSE_VERSION,
+                                  run_metrics=run_metrics, progress=progress_callback,
+                                  cancel=cancel_event)
+    run_metrics.lap('读取月报', sum(len(df) for _, df in reports))
+    for filename, df in reports:
+        # 检查数据是否为空
+        if df.empty:
+            log(f"警告：处理后的数据为空 {filename}")
+            continue
+            
+        # 将处理后的数据框添加到列表中
+        all_dfs.append(df)
 
-    # 合并所有数据框
+    # 合并所有数据框（先统一名称分类，合并后仍为分类类型）
     if all_dfs:
+        suppliers.unify(all_dfs, '公司名称')
         final_df = pd.concat(all_dfs, ignore_index=True)
         log(f"最终汇总数据行数: {len(final_df)}")
         
-        # 重新排列列顺序，将供应商列放在公司名称后面
+        # 重新排列列顺序（报表月份供应商在导出时生成）
         column_order = [
-            '序号', '公司名称', '报表月份供应商','供应商全称', '来煤量', '化验日期', '全水Mt', 
+            '序号', '公司名称', '来煤量', '化验日期', '全水Mt', 
             '灰分空干基Aad', '挥发份Vdaf', '固定碳', '全硫', '发热量'
         ]
-        final_df = final_df[column_order]
+        final_df = schema.downcast(final_df[column_order])
+        run_metrics.lap('合并数据', len(final_df))
+        
+        # 添加供应商列，放在公司名称后面（提取公司名称中括号前的部分）。在合并后的数据上提取，
+        # 并行解析时每个不同的名称也只处理一次，结果为分类类型
+        final_df.insert(2, '供应商全称', suppliers.normalize(final_df['公司名称']))
+        run_metrics.lap('供应商名称', len(final_df))
         
-        # 添加年月字段，用于分组统计
-        final_df['统计月份'] = pd.to_datetime(final_df['化验日期']).dt.strftime('%Y-%m')
+        # 化验月份（Period），用于分组统计
+        month = final_df['化验日期'].dt.to_period('M')
         
         # 定义需要计算加权平均的指标
         weighted_columns = ['全水Mt', '全硫', '发热量', '挥发份Vdaf']
         
-        # 创建月度加权平均统计函数
-        def weighted_average(group, value_column):
-            weights = group['来煤量']
-            values = group[value_column]
-            return (values * weights).sum() / weights.sum()
+        # 一次性计算 来煤量×指标 的乘积，之后各种分组的加权平均都只需分组求和
+        sums = aggregate.weighted_sums(final_df, quality_columns, '来煤量')
         
-        # 计算月度加权平均
-        monthly_stats = []
-        for month in sorted(final_df['统计月份'].unique()):
-            month_data = final_df[final_df['统计月份'] == month]
-            stats = {'统计月份': month, '月度来煤量': month_data['来煤量'].sum()}
-            
-            # 计算每个指标的加权平均
-            for col in weighted_columns:
-                stats[f'{col}_加权平均'] = weighted_average(month_data, col)
-            
-            monthly_stats.append(stats)
-        
-        # 转换为DataFrame
-        monthly_stats_df = pd.DataFrame(monthly_stats)
-        
-        # 计算年度累计加权平均
-        total_stats = {
-            '统计月份': '年度累计',
-            '月度来煤量': final_df['来煤量'].sum()
-        }
+        # 按'报表月份'（即化验月份）和'供应商全称'计算可合并的月度分项汇总，
+        # 按月、按供应商及年度累计的加权平均都由分项合并得到，不再重复扫描明细
+        partial_df = aggregate.partials(
+            final_df, [month.rename('报表月份'), final_df['供应商全称']], quality_columns, '来煤量')
         
-        # 计算年度各指标加权平均
-        for col in weighted_columns:
-            total_stats[f'{col}_加权平均'] = weighted_average(final_df, col)
+        def merged_means(keys, columns):
+            merged = aggregate.merge_partials(partial_df, keys, columns, '来煤量')
+            return merged[[('来煤量', 'sum')] + [(col, 'weighted') for col in columns]].droplevel(1, axis=1)
         
-        # 将年度统计添加到月度统计中
-        monthly_stats_df = pd.concat([monthly_stats_df, pd.DataFrame([total_stats])], ignore_index=True)
+        # 计算月度加权平均，并追加年度累计加权平均
+        monthly_stats_df = merged_means([partial_df['报表月份']], weighted_columns)
+        monthly_stats_df.index = monthly_stats_df.index.strftime('%Y-%m')
+        monthly_stats_df = pd.concat([
+            monthly_stats_df,
+            merged_means([], weighted_columns).set_axis(['年度累计'])
+        ])
+        monthly_stats_df = monthly_stats_df.rename_axis('统计月份').reset_index()
+        monthly_stats_df = monthly_stats_df.rename(
+            columns={'来煤量': '月度来煤量', **{col: f'{col}_加权平均' for col in weighted_columns}})
         
         # 设置列的显示顺序
         stats_columns = ['统计月份', '月度来煤量'] + [f'{col}_加权平均' for col in weighted_columns]
         monthly_stats_df = monthly_stats_df[stats_columns]
         
         # 计算按公司名称的发热量加权平均
-        company_weighted_heat = final_df.groupby('公司名称').agg(
-            来煤总量=('来煤量', 'sum'),
-            加权平均发热量=('发热量', lambda x: weighted_average(final_df.loc[x.index], '发热量'))
-        ).reset_index()
+        company_weighted_heat = aggregate.weighted_means(
+            sums, [final_df['公司名称']], ['发热量'], '来煤量'
+        ).reset_index().rename(columns={'来煤量': '来煤总量', '发热量': '加权平均发热量'})
+        
+        # 对同一供应商全称按照月度和年度，对发热量进行加权平均
+        # 每个月份和供应商所有指标的加权平均
+        monthly_weighted = merged_means(
+            [partial_df['报表月份'], partial_df['供应商全称']], quality_columns).reset_index()
         
-        # 创建Excel写入器
+        # 每个供应商所有指标的累计加权平均
+        cumulative_weighted = merged_means([partial_df['供应商全称']], quality_columns).reset_index()
+        
+        # 按工作表名整理全部汇总表
+        summary_tables = {
+            '原始数据': final_df,
+            '月度统计': monthly_stats_df,
+            '公司发热量加权平均': company_weighted_heat
+        }
+        classified_tables = {
+            label: monthly_weighted[['报表月份', '供应商全称', col]].rename(columns={col: label})
+            for col, label in monthly_sheets
+        }
+        cumulative_tables = {
+            label: cumulative_weighted[['供应商全称', col]].rename(columns={col: label})
+            for col, label in cumulative_sheets
+        }
+        run_metrics.lap('分组汇总', len(final_df))
+        # 取消时保留上一次的结果，不写入
+        ingest.check_cancelled(cancel_event)
+        
+        # 先写入数据仓，称重汇总、预览和查询直接从数据仓读取，Excel 仅作为导出格式；
+        # 月度分项汇总只保存在数据仓中，供按月份范围汇总。
+        # 导出的工作簿归入本次写入的快照；写入失败时只导出文件，不归入旧快照
+        snapshot = None
         try:
-            writer = pd.ExcelWriter("化验月报汇总.xlsx", engine='xlsxwriter')
-            
-            # 写入原始数据
-            final_df[column_order].to_excel(writer, index=False, sheet_name='原始数据')
-            
-            # 写入统计数据
-            monthly_stats_df.to_excel(writer, index=False, sheet_name='月度统计')
-            
-            # 写入公司发热量加权平均数据
-            company_weighted_heat.to_excel(writer, index=False, sheet_name='公司发热量加权平均')
-            
-            # 获取workbook和worksheet对象
-            workbook = writer.book
-            worksheet_stats = writer.sheets['月度统计']
-            worksheet_company = writer.sheets['公司发热量加权平均']
-            
-            # 设置数字格式
-            num_format = workbook.add_format({'num_format': '0.00'})
-            
-            # 为统计数据添加数字格式
-            for col in range(2, len(stats_columns)):  # 跳过'统计月份'和'月度来煤量'列
-                worksheet_stats.set_column(col, col, None, num_format)
-            
-            # 为公司发热量加权平均数据添加数字格式
-            worksheet_company.set_column(2, 2, None, num_format)  # 加权平均发热量列
-            
-            # 保存文件
-            writer.close()
+            snapshot = 'hy', store.save_tables('hy', {**summary_tables, **classified_tables, **cumulative_tables},
+                                               display=display_columns,
+                                               internal={aggregate.PARTIALS_TABLE: partial_df})
+            log("汇总数据已写入数据仓")
+        except Exception as e:
+            log(f"写入数据仓时出错: {str(e)}")
+        run_metrics.lap('写入数据仓')
+        
+        # 逐行一次写出全部工作表，保持统计列的两位小数格式
+        try:
+            num_formats = {
+                # 跳过'统计月份'和'月度来煤量'列
+                '月度统计': {col: '0.00' for col in range(2, len(stats_columns))},
+                # 加权平均发热量列
+                '公司发热量加权平均': {2: '0.00'},
+            }
+            export.write_workbook("化验月报汇总.xlsx", summary_tables, num_formats, display=display_columns,
+                                  snapshot=snapshot)
+            run_metrics.lap('导出汇总', len(final_df))
             log("汇总完成！文件已保存为'化验月报汇总.xlsx'")
         except Exception as e:
             log(f"保存汇总文件时出错: {str(e)}")
             return
 
-        # 对同一供应商全称按照月度和年度，对发热量进行加权平均
-        # 首先，确保'化验日期'列的格式为'YYYY-MM'，并将其重命名为'报表月份'
-        final_df['报表月份'] = pd.to_datetime(final_df['化验日期']).dt.strftime('%Y-%m')
-        
         try:
-            # 创建一个新的Excel文件，添加多个工作表
-            writer = pd.ExcelWriter("化验月报汇总分类.xlsx", engine='xlsxwriter')
-            
-            # 对'报表月份'和'供应商全称'列进行分组，计算每个月份和供应商的加权平均发热量
-            def weighted_avg(group, value_col, weight_col='来煤量'):
-                return (group[value_col] * group[weight_col]).sum() / group[weight_col].sum()
-            
-            weighted_average_heat = final_df.groupby(['报表月份', '供应商全称']).agg(
-                加权平均发热量=('发热量', lambda x: weighted_avg(final_df.loc[x.index], '发热量'))
-            ).reset_index()
-            # 将加权平均发热量结果写入新的Excel工作表
-            weighted_average_heat.to_excel(writer, sheet_name='加权平均发热量', index=False)
-            
-            # 对'报表月份'和'供应商全称'列进行分组，计算每个月份和供应商的加权平均全水Mt
-            weighted_average_moisture = final_df.groupby(['报表月份', '供应商全称']).agg(
-                加权平均全水Mt=('全水Mt', lambda x: weighted_avg(final_df.loc[x.index], '全水Mt'))
-            ).reset_index()
-            # 将加权平均全水Mt结果写入新的Excel工作表
-            weighted_average_moisture.to_excel(writer, sheet_name='加权平均全水Mt', index=False)
-            
-            # 对'报表月份'和'供应商全称'列进行分组，计算每个月份和供应商的加权平均全硫
-            weighted_average_sulfur = final_df.groupby(['报表月份', '供应商全称']).agg(
-                加权平均全硫=('全硫', lambda x: weighted_avg(final_df.loc[x.index], '全硫'))
-            ).reset_index()
-            # 将加权平均全硫结果写入新的Excel工作表
-            weighted_average_sulfur.to_excel(writer, sheet_name='加权平均全硫', index=False)
-            
-            # 对'报表月份'和'供应商全称'列进行分组，计算每个月份和供应商的加权平均挥发份
-            weighted_average_volatile = final_df.groupby(['报表月份', '供应商全称']).agg(
-                加权平均挥发份=('挥发份Vdaf', lambda x: weighted_avg(final_df.loc[x.index], '挥发份Vdaf'))
-            ).reset_index()
-            # 将加权平均挥发份结果写入新的Excel工作表
-            weighted_average_volatile.to_excel(writer, sheet_name='加权平均挥发份', index=False)
-            
-            # 对'报表月份'和'供应商全称'列进行分组，计算每个月份和供应商的加权平均灰份
-            weighted_average_ash = final_df.groupby(['报表月份', '供应商全称']).agg(
-                加权平均灰份=('灰分空干基Aad', lambda x: weighted_avg(final_df.loc[x.index], '灰分空干基Aad'))
-            ).reset_index()
-            # 将加权平均灰份结果写入新的Excel工作表
-            weighted_average_ash.to_excel(writer, sheet_name='加权平均灰份', index=False)
-            
-            # 保存文件并关闭
-            writer.close()
+            # 月度加权平均与累计加权平均工作表一次写入同一个文件
+            export.write_workbook("化验月报汇总分类.xlsx", {**classified_tables, **cumulative_tables},
+                                  snapshot=snapshot)
+            run_metrics.lap('导出分类', len(monthly_weighted))
             log("分类汇总文件已保存为: 化验月报汇总分类.xlsx")
-            
-            # 打开现有的Excel文件
-            writer = pd.ExcelWriter("化验月报汇总分类.xlsx", engine='openpyxl', mode='a')
-            
-            # 对'供应商全称'列进行分组，计算累计加权平均发热量
-            cumulative_weighted_average_heat = final_df.groupby('供应商全称').agg(
-                累计加权平均发热量=('发热量', lambda x: weighted_avg(final_df.loc[x.index], '发热量'))
-            ).reset_index()
-            # 将累计加权平均发热量结果写入新的工作表
-            cumulative_weighted_average_heat.to_excel(writer, sheet_name='累计加权平均发热量', index=False)
-            
-            # 对'供应商全称'列进行分组，计算累计加权平均全水Mt
-            cumulative_weighted_average_moisture = final_df.groupby('供应商全称').agg(
-                累计加权平均全水Mt=('全水Mt', lambda x: weighted_avg(final_df.loc[x.index], '全水Mt'))
-            ).reset_index()
-            # 将累计加权平均全水Mt结果写入新的工作表
-            cumulative_weighted_average_moisture.to_excel(writer, sheet_name='累计加权平均全水Mt', index=False)
-            
-            # 对'供应商全称'列进行分组，计算累计加权平均全硫
-            cumulative_weighted_average_sulfur = final_df.groupby('供应商全称').agg(
-                累计加权平均全硫=('全硫', lambda x: weighted_avg(final_df.loc[x.index], '全硫'))
-            ).reset_index()
-            # 将累计加权平均全硫结果写入新的工作表
-            cumulative_weighted_average_sulfur.to_excel(writer, sheet_name='累计加权平均全硫', index=False)
-            
-            # 对'供应商全称'列进行分组，计算累计加权平均挥发份
-            cumulative_weighted_average_volatile = final_df.groupby('供应商全称').agg(
-                累计加权平均挥发份=('挥发份Vdaf', lambda x: weighted_avg(final_df.loc[x.index], '挥发份Vdaf'))
-            ).reset_index()
-            # 将累计加权平均挥发份结果写入新的工作表
-            cumulative_weighted_average_volatile.to_excel(writer, sheet_name='累计加权平均挥发份', index=False)
-            
-            # 保存文件并关闭
-            writer.close()
-            log("累计加权平均值已添加到: 化验月报汇总分类.xlsx")
         except Exception as e:
             log(f"保存分类文件时出错: {str(e)}")
 
@@ -0,0 +1,272 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import cache
+import metrics
+
+def _read_rows(file_path, max_columns=None):
+    """只打开一次工作簿，返回第一个工作表的所有行（最多 max_columns 列）及日期模式"""
+    if file_path.lower().endswith('.xls'):
+        import xlrd
+        book = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            rows = [sheet.row_slice(r, 0, max_columns) for r in range(sheet.nrows)]
+        finally:
+            book.release_resources()
+        return rows, book.datemode
+
+    import openpyxl
+    book = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = [list(row) for row in book.worksheets[0].iter_rows(max_col=max_columns, values_only=True)]
+    finally:
+        book.close()
+    return rows, None
+
+
+def _convert(cell, datemode):
+    """将单元格转换为与 pd.read_excel 一致的 Python 值"""
+    if datemode is not None:
+        import xlrd
+        ctype, value = cell.ctype, cell.value
+        if ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+            return np.nan
+        if ctype == xlrd.XL_CELL_DATE:
+            return xlrd.xldate.xldate_as_datetime(value, datemode)
+        if ctype == xlrd.XL_CELL_BOOLEAN:
+            return bool(value)
+    else:
+        value = cell
+
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return np.nan
+    # 整数值的浮点数按整数返回，与 pandas 行为保持一致
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _is_number(cell, datemode):
+    value = _convert(cell, datemode)
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and not pd.isna(value)
+
+
+def _is_blank(row, indexes, datemode):
+    """indexes 列（不存在的列视为空）是否全部为空"""
+    return all(i >= len(row) or pd.isna(_convert(row[i], datemode)) for i in indexes)
+
+
+def read_report(file_path, columns, names=None, key_column=0, key_label='序号'):
+    """
+    单次读取月报工作簿，定位表头行与末尾合计行，只提取需要的列。
+
+    columns 可以是列索引列表，也可以是表头中的列名列表；names 为输出列名，
+    默认与 columns 相同。表头行为 key_column 列等于 key_label 的第一行，
+    数据区从其后第一条序号为数字的行开始，末尾序号为空的合计行会被去掉。
+    只检查和转换 key_column 与所需列的单元格；columns 为列索引时，右侧多余的列不读取。
+    """
+    by_index = all(isinstance(c, int) for c in columns)
+    max_columns = max([*columns, key_column]) + 1 if by_index else None
+    rows, datemode = _read_rows(file_path, max_columns)
+    names = list(names or columns)
+
+    # 定位表头行
+    header = None
+    for r, row in enumerate(rows):
+        if len(row) > key_column and _convert(row[key_column], datemode) == key_label:
+            header = r
+            break
+    if header is None:
+        raise ValueError(f"未找到表头行（{key_label}）: {os.path.basename(file_path)}")
+
+    # 定位需要的列
+    if by_index:
+        indexes = list(columns)
+    else:
+        header_values = [_convert(cell, datemode) for cell in rows[header]]
+        indexes = []
+        for col in columns:
+            if col not in header_values:
+                raise KeyError(col)
+            indexes.append(header_values.index(col))
+
+    # 跳过多行表头，从第一条序号为数字的行开始
+    start = header + 1
+    while start < len(rows) and not _is_number(rows[start][key_column], datemode):
+        start += 1
+
+    # 只按序号列和所需列判断空行，其他列的内容不转换
+    probe = sorted({key_column, *indexes})
+    body = [row for row in rows[start:] if not _is_blank(row, probe, datemode)]
+
+    # 去掉末尾的合计/加权平均行
+    if body and not _is_number(body[-1][key_column], datemode):
+        body = body[:-1]
+
+    data = {
+        name: [_convert(row[i], datemode) if i < len(row) else np.nan for row in body]
+        for name, i in zip(names, indexes)
+    }
+    return pd.DataFrame(data, columns=names)
+
+
+def read_rows(file_path, max_columns=None):
+    """
+    单次读取工作簿第一个工作表，返回转换后的各行数据（空单元格为 NaN），
+    用于列不固定、不能按列名提取的报表。有些工作簿带有上万个空列，可用 max_columns 限制读取的列数。
+    """
+    rows, datemode = _read_rows(file_path, max_columns)
+    return [[_convert(cell, datemode) for cell in row] for row in rows]
+
+
+class Cancelled(Exception):
+    """运行被取消（cancel 事件已设置）"""
+
+
+def check_cancelled(cancel):
+    """cancel（threading.Event）已设置时抛出 Cancelled；在每个文件之间和写入结果之前调用"""
+    if cancel is not None and cancel.is_set():
+        raise Cancelled("运行已取消")
+
+
+def _counter(progress, total):
+    """返回每处理完一个文件调用一次的函数，向 progress(已完成数, 总数, 文件名) 报告进度"""
+    done = 0
+
+    def step(filename):
+        nonlocal done
+        done += 1
+        if progress:
+            progress(done, total, filename)
+    return step
+
+
+def list_reports(folder_path, extensions=('.xls', '.xlsx')):
+    """按文件名（即报表月份）排序列出文件夹中的月报"""
+    return sorted(f for f in os.listdir(folder_path) if f.lower().endswith(extensions))
+
+
+def _parse_measured(parser, file_path):
+    """解析单个月报并测量耗时和内存峰值（在子进程中调用时统计子进程的内存）"""
+    with metrics.measure() as m:
+        df = parser(file_path)
+    return df, m
+
+
+def _parse_reports(kind, folder_path, filenames, parser, log, workers=1, use_cache=True, version=1,
+                   run_metrics=None, step=None, cancel=None):
+    """
+    解析 filenames 中的月报（workers > 1 时用进程池并行），返回 {文件名: 数据框}；解析失败的文件跳过。
+    每个文件处理完（无论成功与否）调用 step(文件名)；cancel 设置后不再开始新的文件并抛出 Cancelled。
+    """
+    results = {}
+    step = step or (lambda filename: None)
+
+    def finish(filename, df, m):
+        results[filename] = df
+        if use_cache:
+            # 缓存写入失败不影响本次结果，下次重新解析即可
+            try:
+                cache.save(kind, os.path.join(folder_path, filename), df, version)
+            except Exception as e:
+                log(f"写入解析缓存失败: {filename}: {str(e)}")
+        log(f"成功处理文件: {filename}（{m.seconds:.3f} 秒，{len(df)} 行）")
+        if run_metrics:
+            run_metrics.add_file(filename, 'parse', m, len(df))
+
+    if workers and workers > 1 and len(filenames) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(filenames))) as executor:
+            futures = {
+                executor.submit(_parse_measured, parser, os.path.join(folder_path, filename)): filename
+                for filename in filenames
+            }
+            # 按完成顺序输出日志，最终结果仍按月份排序
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    finish(filename, *future.result())
+                except Exception as e:
+                    log(f"处理文件 {filename} 时出错: {str(e)}")
+                step(filename)
+                if cancel is not None and cancel.is_set():
+                    # 尚未开始的文件不再解析，正在解析的文件等其完成
+                    for pending in futures:
+                        pending.cancel()
+                    check_cancelled(cancel)
+    else:
+        for filename in filenames:
+            check_cancelled(cancel)
+            try:
+                finish(filename, *_parse_measured(parser, os.path.join(folder_path, filename)))
+            except Exception as e:
+                log(f"处理文件 {filename} 时出错: {str(e)}")
+            step(filename)
+    return results
+
+
+def load_reports(kind, folder_path, parser, log, workers=1, use_cache=True, version=1, run_metrics=None,
+                 progress=None, cancel=None):
+    """
+    读取文件夹中的全部月报，返回按月份排序的 [(文件名, 数据框)] 列表。
+
+    已缓存且未变动的文件直接从缓存读取；其余文件在 workers > 1 时
+    交给进程池并行解析。parser 必须是模块级函数，以便在子进程中调用。
+    每个文件的处理结果通过 log 输出，解析失败的文件会被跳过。
+    传入 run_metrics 时记录每个文件的耗时、行数和内存峰值。
+    每读取完一个文件调用 progress(已完成数, 总数, 文件名)；
+    cancel（threading.Event）设置后在文件之间停止，抛出 Cancelled。
+    """
+    results = {}
+    pending = []
+    filenames = list_reports(folder_path)
+    step = _counter(progress, len(filenames))
+    for filename in filenames:
+        check_cancelled(cancel)
+        file_path = os.path.join(folder_path, filename)
+        with metrics.measure() as m:
+            df = cache.load(kind, file_path, version) if use_cache else None
+        if df is not None:
+            log(f"从缓存读取文件: {filename}（{m.seconds:.3f} 秒，{len(df)} 行）")
+            results[filename] = df
+            if run_metrics:
+                run_metrics.add_file(filename, 'cache', m, len(df))
+            step(filename)
+        else:
+            pending.append(filename)
+
+    results.update(_parse_reports(kind, folder_path, pending, parser, log, workers, use_cache, version,
+                                  run_metrics, step, cancel))
+    check_cancelled(cancel)
+    return [(filename, results[filename]) for filename in sorted(results)]
+
+
+def warm_cache(kind, folder_path, parser, log, workers=1, version=1, progress=None, cancel=None):
+    """
+    只解析尚未缓存（新增或变动）的月报并写入解析缓存，已缓存的文件不读取。
+    之后的 load_reports 全部从缓存读取。返回成功解析的文件数。
+    progress 和 cancel 同 load_reports，进度只计需要解析的文件。
+    """
+    pending = []
+    for filename in list_reports(folder_path):
+        if not cache.exists(kind, os.path.join(folder_path, filename), version):
+            pending.append(filename)
+    return len(_parse_reports(kind, folder_path, pending, parser, log, workers, True, version,
+                              step=_counter(progress, len(pending)), cancel=cancel))
+
+
+def preload(kind, file_path, parser, version=1, target=None, log=print):
+    """
+    解析单个月报并写入解析缓存，返回数据行数；文件无法解析时抛出异常。
+    上传时 file_path 为临时文件，target 为它随后替换到的输入文件夹路径：缓存按 target 保存，
+    月报出现在输入文件夹时缓存已经就绪，任何进程中的运行都直接读取，不会重复解析。
+    """
+    df = parser(file_path)
+    try:
+        cache.save(kind, target or file_path, df, version, stat_path=file_path)
+    except Exception as e:
+        log(f"写入解析缓存失败: {os.path.basename(target or file_path)}: {str(e)}")
+    return len(df)
@@ -0,0 +1,312 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import statedb
+
+
+def _conflicts(job_type, others, exclusive):
+    """Whether job_type may not run alongside any of the other job types."""
+    return any(job_type == other or job_type in exclusive or other in exclusive for other in others)
+
+
+class Job:
+    def __init__(self, job_type):
+        self.id = uuid.uuid4().hex[:12]
+        self.type = job_type
+        self.status = 'queued'
+        self.requests = 1
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @classmethod
+    def from_row(cls, row):
+        job = cls.__new__(cls)
+        (job.id, job.type, job.status, job.requests, job.created,
+         job.started, job.finished, job.error) = row
+        return job
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'type': self.type,
+            'status': self.status,
+            'requests': self.requests,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'wait_seconds': round((self.started or now) - self.created, 3),
+            'run_seconds': round((self.finished or now) - self.started, 3) if self.started else None,
+            'error': self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs pipeline tasks on a bounded thread pool.
+
+    At most one job per task type runs at a time, since runs of the same
+    type write the same output files. Types listed in exclusive (e.g. a
+    run of every pipeline) write the outputs of all the others, so they
+    never run alongside any other job. While a job of a type is pending,
+    further requests for that type are coalesced into it instead of
+    queueing another run. Pending jobs start in the order they were
+    submitted.
+    """
+
+    def __init__(self, runners, max_workers=2, history=100, on_error=None, exclusive=()):
+        self._runners = runners
+        self._exclusive = frozenset(exclusive)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._history = history
+        self._on_error = on_error
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._running = {}
+        self._pending = {}
+
+    def submit(self, job_type):
+        """Queue a run of job_type; returns (job, coalesced)."""
+        if job_type not in self._runners:
+            raise KeyError(job_type)
+        with self._lock:
+            pending = self._pending.get(job_type)
+            if pending:
+                pending.requests += 1
+                return pending, True
+
+            job = Job(job_type)
+            self._jobs[job.id] = job
+            self._trim()
+            if _conflicts(job_type, [*self._running, *self._pending], self._exclusive):
+                # Starts when the conflicting runs (and the jobs pending before it) finish
+                job.status = 'pending'
+                self._pending[job_type] = job
+            else:
+                self._dispatch(job)
+            return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _dispatch(self, job):
+        # Called with the lock held
+        job.status = 'queued'
+        self._running[job.type] = job
+        self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        job.status = 'running'
+        job.started = time.time()
+        try:
+            self._runners[job.type]()
+            job.status = 'succeeded'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            if self._on_error:
+                self._on_error(job, e)
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                del self._running[job.type]
+                # Pending jobs in submission order; one that still conflicts
+                # also holds back the later jobs that conflict with it
+                waiting = []
+                for pending in list(self._pending.values()):
+                    if _conflicts(pending.type, [*self._running, *waiting], self._exclusive):
+                        waiting.append(pending.type)
+                    else:
+                        del self._pending[pending.type]
+                        self._dispatch(pending)
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond the history size
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(self._jobs) - self._history, 0)]:
+            del self._jobs[job_id]
+
+
+class SqliteJobManager:
+    """
+    JobManager whose queue lives in a SQLite file, for a web server running
+    several worker processes. Any process can submit a job or report its
+    status; a dispatcher thread in each process claims queued jobs, so the
+    same rules hold across all processes: at most one running job per type,
+    exclusive types never alongside any other job, at most max_workers
+    running jobs in total, and repeated requests are coalesced into the
+    pending job of their type.
+
+    A running job refreshes its heartbeat; a job whose heartbeat stops (its
+    process died) is marked failed so its type is not blocked forever. The
+    dispatcher starts with the manager, so every process that constructs one
+    takes part in claiming jobs and recovering stale ones, whether or not it
+    ever submits.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            requests INTEGER NOT NULL,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL,
+            error TEXT,
+            owner INTEGER,
+            heartbeat REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)
+    """
+    COLUMNS = 'id, type, status, requests, created, started, finished, error'
+    POLL_INTERVAL = 0.5
+    HEARTBEAT_INTERVAL = 5
+    # Seconds without a heartbeat after which a running job is considered lost
+    STALE_AFTER = 30
+
+    def __init__(self, runners, path, max_workers=2, history=100, on_error=None, exclusive=()):
+        self._runners = runners
+        self._exclusive = frozenset(exclusive)
+        self._db = statedb.Database(path, self.SCHEMA)
+        self._max_workers = max_workers
+        self._history = history
+        self._on_error = on_error
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._local_jobs = set()
+        self._pid = None
+        self._executor = None
+        self._last_heartbeat = 0
+        self._ensure_dispatcher()
+
+    def _ensure_dispatcher(self):
+        # Started again in a forked child on its first submit, since threads do not survive a fork
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._local_jobs = set()
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='job')
+            threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True).start()
+
+    def submit(self, job_type):
+        """Queue a run of job_type; returns (job, coalesced)."""
+        if job_type not in self._runners:
+            raise KeyError(job_type)
+        self._ensure_dispatcher()
+        with self._db.transaction() as conn:
+            row = conn.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE type = ? AND status = 'pending'",
+                               (job_type,)).fetchone()
+            if row:
+                conn.execute('UPDATE jobs SET requests = requests + 1 WHERE id = ?', (row[0],))
+                job = Job.from_row(row)
+                job.requests += 1
+                return job, True
+
+            job = Job(job_type)
+            active = conn.execute("SELECT type FROM jobs WHERE status IN ('queued', 'running', 'pending')"
+                                  ).fetchall()
+            # Starts when the conflicting jobs finish
+            busy = _conflicts(job_type, [row[0] for row in active], self._exclusive)
+            job.status = 'pending' if busy else 'queued'
+            conn.execute(f'INSERT INTO jobs ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (job.id, job.type, job.status, job.requests, job.created, None, None, None))
+            self._trim(conn)
+        self._wake.set()
+        return job, False
+
+    def get(self, job_id):
+        row = self._db.execute(f'SELECT {self.COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def list(self):
+        rows = self._db.execute(f'SELECT {self.COLUMNS} FROM jobs ORDER BY created').fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def _dispatch_loop(self):
+        while True:
+            self._wake.wait(self.POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                if time.monotonic() - self._last_heartbeat >= self.HEARTBEAT_INTERVAL:
+                    self._heartbeat()
+                # Cheap read first, so idle processes do not take the write lock every round
+                while self._db.execute("SELECT 1 FROM jobs WHERE status IN ('queued', 'pending') "
+                                       "LIMIT 1").fetchone() and self._claim():
+                    pass
+            except Exception:
+                # e.g. the database is locked for longer than the timeout; retry next round
+                pass
+
+    def _heartbeat(self):
+        self._last_heartbeat = time.monotonic()
+        now = time.time()
+        with self._db.transaction() as conn:
+            for job_id in list(self._local_jobs):
+                conn.execute('UPDATE jobs SET heartbeat = ? WHERE id = ?', (now, job_id))
+            conn.execute("UPDATE jobs SET status = 'failed', finished = ?, error = 'worker process exited' "
+                         "WHERE status = 'running' AND heartbeat < ?", (now, now - self.STALE_AFTER))
+
+    def _claim(self):
+        """Start the oldest runnable job, if a slot is free; returns whether one was started."""
+        with self._db.transaction() as conn:
+            running = conn.execute("SELECT type FROM jobs WHERE status = 'running'").fetchall()
+            if len(running) >= self._max_workers:
+                return False
+            # Oldest job first; one that cannot start also holds back the later
+            # jobs that conflict with it
+            busy = [row[0] for row in running]
+            rows = conn.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE status IN ('queued', 'pending') "
+                                "ORDER BY created").fetchall()
+            job = None
+            for row in rows:
+                if not _conflicts(row[1], busy, self._exclusive):
+                    job = Job.from_row(row)
+                    break
+                busy.append(row[1])
+            if job is None:
+                return False
+            now = time.time()
+            conn.execute("UPDATE jobs SET status = 'running', started = ?, owner = ?, heartbeat = ? "
+                         "WHERE id = ?", (now, os.getpid(), now, job.id))
+            job.status, job.started = 'running', now
+        self._local_jobs.add(job.id)
+        self._executor.submit(self._run, job)
+        return True
+
+    def _run(self, job):
+        try:
+            self._runners[job.type]()
+            job.status = 'succeeded'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            if self._on_error:
+                self._on_error(job, e)
+        finally:
+            job.finished = time.time()
+            with self._db.transaction() as conn:
+                conn.execute('UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?',
+                             (job.status, job.finished, job.error, job.id))
+                # The pending job of this type can start now
+                conn.execute("UPDATE jobs SET status = 'queued' WHERE type = ? AND status = 'pending'",
+                             (job.type,))
+            self._local_jobs.discard(job.id)
+            self._wake.set()
+
+    def _trim(self, conn):
+        # Forget the oldest finished jobs beyond the history size
+        conn.execute("DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE finished IS NOT NULL "
+                     "ORDER BY created DESC LIMIT -1 OFFSET ?)", (self._history,))
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+# 无法解析的月份或名称对应的键
+MISSING = -1
+
+
+def month_key(values):
+    """
+    将 'YYYY-MM' 字符串、Period 或日期列转换为整数月份键 YYYYMM（int32），无法解析的为 -1。
+    字符串列只解析其中不同的值，每个月报文件的月份通常只有一个。
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.PeriodDtype) or pd.api.types.is_datetime64_any_dtype(values):
+        dates = values
+        codes = None
+    else:
+        codes, uniques = pd.factorize(values)
+        dates = pd.Series(pd.to_datetime(pd.Series(uniques, dtype=object).astype(str).str[:7],
+                                         format='%Y-%m', errors='coerce'))
+    months = (dates.dt.year * 100 + dates.dt.month).fillna(MISSING).to_numpy(dtype=np.int64)
+    if codes is not None:
+        months = np.where(codes == -1, MISSING, months[codes] if len(months) else MISSING)
+    return months.astype(np.int32)
+
+
+def month_label(keys):
+    """整数月份键转换回 'YYYY-MM' 字符串"""
+    return [f"{k // 100}-{k % 100:02d}" if k != MISSING else '' for k in keys]
+
+
+def shared_codes(*columns):
+    """
+    为多列名称建立同一套整数编码（例如化验的公司名称与称重的供应单位），
+    返回 (类别, 各列的编码数组)；空值编码为 -1。
+    """
+    uniques = [pd.unique(pd.Series(col).dropna()) for col in columns]
+    categories = pd.Index(pd.unique(np.concatenate(uniques)) if uniques else [], dtype=object)
+    return categories, [categories.get_indexer(pd.Series(col)).astype(np.int32) for col in columns]
+
+
+def combine(months, codes, size):
+    """把 (月份键, 名称编码) 合成一个 int64 键；任一部分缺失时为 -1"""
+    months = np.asarray(months, dtype=np.int64)
+    codes = np.asarray(codes, dtype=np.int64)
+    return np.where((months == MISSING) | (codes == MISSING), MISSING, months * max(size, 1) + codes)
+
+
+def split(keys, size):
+    """combine 的逆运算，返回 (月份键, 名称编码)"""
+    keys = np.asarray(keys, dtype=np.int64)
+    size = max(size, 1)
+    return keys // size, keys % size
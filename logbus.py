@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import deque
+
+import statedb
+
+
+class LogBus:
+    """
+    Publish/subscribe log stream shared by all clients.
+
+    Messages get increasing ids and are kept in a bounded ring buffer.
+    Subscribers only keep a cursor (the last id they have seen), so every
+    subscriber receives every message, a reconnecting client can catch up
+    from its last id, and memory stays bounded however many clients connect.
+    """
+
+    def __init__(self, maxlen=1000):
+        self._buffer = deque(maxlen=maxlen)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, message):
+        with self._cond:
+            self._last_id += 1
+            self._buffer.append((self._last_id, message))
+            self._cond.notify_all()
+            return self._last_id
+
+    def since(self, last_id):
+        """Return buffered (id, message) pairs newer than last_id."""
+        with self._cond:
+            if last_id >= self._last_id:
+                return []
+            # Ids in the buffer are consecutive, so the start offset is computed directly
+            first_id = self._buffer[0][0]
+            start = max(last_id + 1 - first_id, 0)
+            return [self._buffer[i] for i in range(start, len(self._buffer))]
+
+    def wait(self, last_id, timeout=None):
+        """Block until there are messages newer than last_id (or timeout) and return them."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id > last_id, timeout)
+        return self.since(last_id)
+
+
+class SqliteLogBus:
+    """
+    LogBus backed by a SQLite file, for a web server running several
+    worker processes: a message published by any process (e.g. the one
+    running a pipeline) reaches subscribers connected to every process.
+    Same interface and cursor semantics as LogBus.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message TEXT NOT NULL,
+            created REAL NOT NULL
+        )
+    """
+    # How often waiting subscribers look for messages from other processes
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, path, maxlen=1000):
+        self._db = statedb.Database(path, self.SCHEMA)
+        self._maxlen = maxlen
+        # Wakes subscribers of this process right away on a local publish
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self):
+        # AUTOINCREMENT ids are never reused, even after old rows are trimmed
+        row = self._db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'logs'").fetchone()
+        return row[0] if row else 0
+
+    def publish(self, message):
+        with self._db.transaction() as conn:
+            message_id = conn.execute('INSERT INTO logs (message, created) VALUES (?, ?)',
+                                      (message, time.time())).lastrowid
+            if message_id % 100 == 0:
+                conn.execute('DELETE FROM logs WHERE id <= ?', (message_id - self._maxlen,))
+        with self._cond:
+            self._cond.notify_all()
+        return message_id
+
+    def since(self, last_id):
+        """Return buffered (id, message) pairs newer than last_id."""
+        rows = self._db.execute(
+            'SELECT id, message FROM logs WHERE id > ? ORDER BY id DESC LIMIT ?',
+            (last_id, self._maxlen)).fetchall()
+        return [tuple(row) for row in reversed(rows)]
+
+    def wait(self, last_id, timeout=None):
+        """Block until there are messages newer than last_id (or timeout) and return them."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            events = self.since(last_id)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if events or (remaining is not None and remaining <= 0):
+                return events
+            with self._cond:
+                self._cond.wait(min(self.POLL_INTERVAL, remaining) if remaining is not None
+                                else self.POLL_INTERVAL)
@@ -0,0 +1,362 @@
+"""
+运行统计。流水线用 instrumented 装饰后，记录每个阶段和每个月报文件的耗时、行数和
+内存峰值，运行结束时输出到日志，并保留最近 RM_METRICS_HISTORY 次运行供 /api/metrics 查询。
+
+统计默认保存在进程内存中；多进程部署时 use_database 把它换为共享的 SQLite 表，
+任一工作进程都能返回其他进程中的运行。
+
+内存峰值（peak_mb）始终按进程常驻内存（RSS）采样统计，开销可以忽略；
+按 Python 分配统计的峰值（alloc_peak_mb，tracemalloc）会使运行慢数倍，
+只在排查内存问题时用 RM_TRACE_MEMORY=1 开启。
+"""
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+import statedb
+
+# 是否用 tracemalloc 统计 Python 分配的内存峰值。统计会使运行慢数倍，默认关闭，设 RM_TRACE_MEMORY=1 开启
+TRACE_MEMORY = os.environ.get('RM_TRACE_MEMORY', '0') == '1'
+
+# 有测量进行时，后台线程每隔多少秒采样一次进程常驻内存
+RSS_INTERVAL = 0.05
+
+# 保留最近多少次运行的统计结果
+HISTORY = int(os.environ.get('RM_METRICS_HISTORY', '20'))
+
+_lock = threading.RLock()
+# 正在进行的测量，重置内存峰值前需先把当前峰值记入这些测量
+_open = []
+_tracing = 0
+# 内存统计是否由本模块开启（外部已开启时不负责关闭）
+_owned = False
+# 常驻内存采样线程，没有进行中的测量时退出
+_sampler = None
+
+
+def _rss_reader():
+    """返回读取本进程当前常驻内存（字节）的函数，平台不支持时返回 None"""
+    if os.path.exists('/proc/self/statm'):
+        page_size = os.sysconf('SC_PAGE_SIZE')
+
+        def read():
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * page_size
+        return read
+
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                    'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                    'PagefileUsage', 'PeakPagefileUsage')]
+
+        get_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_process.restype = wintypes.HANDLE
+        get_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(Counters), wintypes.DWORD]
+
+        def read():
+            counters = Counters()
+            counters.cb = ctypes.sizeof(Counters)
+            get_info(get_process(), ctypes.byref(counters), counters.cb)
+            return counters.WorkingSetSize
+        return read
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # 其他系统只能取得进程启动以来的最大常驻内存（macOS 单位为字节，其余为 KB）
+    scale = 1 if sys.platform == 'darwin' else 1024
+
+    def read():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return read
+
+
+_read_rss = _rss_reader()
+
+
+def _sample_rss():
+    """把当前常驻内存计入所有进行中的测量（调用方持有 _lock）"""
+    rss = _read_rss()
+    for m in _open:
+        m.rss = max(m.rss or 0, rss)
+
+
+def _sample_loop():
+    global _sampler
+    while True:
+        with _lock:
+            if not _open:
+                _sampler = None
+                return
+            _sample_rss()
+        time.sleep(RSS_INTERVAL)
+
+
+def _after_fork():
+    # 进程池的子进程不继承父进程的测量和采样线程
+    global _lock, _open, _sampler
+    _lock = threading.RLock()
+    _open = []
+    _sampler = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class MemoryHistory:
+    """保存在本进程内存中的运行统计，单进程运行时使用"""
+
+    def __init__(self, maxlen=HISTORY):
+        self._runs = deque(maxlen=maxlen)
+
+    def append(self, result):
+        with _lock:
+            self._runs.append(result)
+
+    def list(self, pipeline=None):
+        with _lock:
+            return [r for r in self._runs if pipeline is None or r['pipeline'] == pipeline]
+
+
+class SqliteHistory:
+    """
+    保存在 SQLite 文件中的运行统计，供多进程的 Web 服务使用：
+    任一工作进程完成的运行，所有进程的 /api/metrics 都能看到。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pipeline TEXT NOT NULL,
+            result TEXT NOT NULL
+        )
+    """
+
+    def __init__(self, path, maxlen=HISTORY):
+        self._db = statedb.Database(path, self.SCHEMA)
+        self._maxlen = maxlen
+
+    def append(self, result):
+        with self._db.transaction() as conn:
+            conn.execute('INSERT INTO runs (pipeline, result) VALUES (?, ?)',
+                         (result['pipeline'], json.dumps(result, ensure_ascii=False)))
+            conn.execute('DELETE FROM runs WHERE id <= (SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                         (self._maxlen,))
+
+    def list(self, pipeline=None):
+        if pipeline is None:
+            rows = self._db.execute('SELECT result FROM runs ORDER BY id').fetchall()
+        else:
+            rows = self._db.execute('SELECT result FROM runs WHERE pipeline = ? ORDER BY id',
+                                    (pipeline,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+# 运行统计的保存位置，多进程部署时由 use_database 换为 SqliteHistory
+_history = MemoryHistory()
+
+
+def use_database(path):
+    """把运行统计改为保存在共享的 SQLite 文件中（见 statedb）"""
+    global _history
+    _history = SqliteHistory(path)
+
+
+class Measure:
+    """
+    一段代码的耗时（秒）、进程常驻内存峰值 rss 和 Python 内存分配峰值 peak
+    （字节；平台不支持或未开启 tracemalloc 时为 None）
+    """
+
+    def __init__(self):
+        self.seconds = None
+        self.rss = None
+        self.peak = None
+        self._start = None
+
+    @property
+    def peak_mb(self):
+        return round(self.rss / 1048576, 2) if self.rss is not None else None
+
+    @property
+    def alloc_peak_mb(self):
+        return round(self.peak / 1048576, 2) if self.peak is not None else None
+
+
+def _start(m):
+    global _tracing, _owned, _sampler
+    with _lock:
+        if TRACE_MEMORY:
+            if not _tracing:
+                _owned = not tracemalloc.is_tracing()
+                if _owned:
+                    tracemalloc.start()
+            _tracing += 1
+            peak = tracemalloc.get_traced_memory()[1]
+            for other in _open:
+                other.peak = max(other.peak or 0, peak)
+            tracemalloc.reset_peak()
+            m.peak = 0
+        _open.append(m)
+        if _read_rss:
+            _sample_rss()
+            if _sampler is None:
+                _sampler = threading.Thread(target=_sample_loop, name='metrics-rss', daemon=True)
+                _sampler.start()
+    m._start = time.perf_counter()
+
+
+def _stop(m):
+    global _tracing
+    m.seconds = time.perf_counter() - m._start
+    with _lock:
+        if _read_rss:
+            _sample_rss()
+        _open.remove(m)
+        if m.peak is not None:
+            m.peak = max(m.peak, tracemalloc.get_traced_memory()[1])
+            _tracing -= 1
+            if not _tracing and _owned:
+                tracemalloc.stop()
+
+
+@contextmanager
+def measure():
+    """
+    测量一段代码的耗时和内存峰值，可以嵌套使用。
+    内存按整个进程统计，同时运行的其他任务占用的内存也会计入；
+    常驻内存为采样值，短于采样间隔的尖峰可能漏计。
+    """
+    m = Measure()
+    _start(m)
+    try:
+        yield m
+    finally:
+        _stop(m)
+
+
+def _memory_text(record):
+    text = ''
+    if record['peak_mb'] is not None:
+        text += f", 内存峰值 {record['peak_mb']:.1f} MB"
+    if record['alloc_peak_mb'] is not None:
+        text += f", Python 分配峰值 {record['alloc_peak_mb']:.1f} MB"
+    return text
+
+
+class RunMetrics:
+    """
+    一次流水线运行的统计：依次调用 lap() 记录每个阶段（从上一阶段结束算起）的
+    耗时、处理行数和内存峰值（peak_mb 为常驻内存，alloc_peak_mb 为 Python 分配），add_file() 记录每个月报文件，finish() 保存到历史记录。
+    每个阶段和总结果都通过 log 输出。
+    """
+
+    def __init__(self, pipeline, log=None):
+        self.pipeline = pipeline
+        self.log = log
+        self.started = time.time()
+        self.stages = []
+        self.files = []
+        self._total = Measure()
+        self._stage = Measure()
+        _start(self._total)
+        _start(self._stage)
+
+    def lap(self, stage, rows=None):
+        _stop(self._stage)
+        record = {
+            'stage': stage,
+            'seconds': round(self._stage.seconds, 4),
+            'rows': rows,
+            'peak_mb': self._stage.peak_mb,
+            'alloc_peak_mb': self._stage.alloc_peak_mb,
+        }
+        self.stages.append(record)
+        if self.log:
+            self.log(f"阶段 {stage}: 用时 {record['seconds']:.3f} 秒"
+                     + (f", {rows} 行" if rows is not None else '')
+                     + _memory_text(record))
+        self._stage = Measure()
+        _start(self._stage)
+        return record
+
+    def add_file(self, filename, source, m, rows=None):
+        """source 为 'cache'（从缓存读取）或 'parse'（重新解析）"""
+        self.files.append({
+            'file': filename,
+            'source': source,
+            'seconds': round(m.seconds, 4),
+            'rows': rows,
+            'peak_mb': m.peak_mb,
+            'alloc_peak_mb': m.alloc_peak_mb,
+        })
+
+    def finish(self, status='succeeded'):
+        _stop(self._stage)
+        _stop(self._total)
+        result = {
+            'pipeline': self.pipeline,
+            'status': status,
+            'started': self.started,
+            'seconds': round(self._total.seconds, 4),
+            'peak_mb': self._total.peak_mb,
+            'alloc_peak_mb': self._total.alloc_peak_mb,
+            'stages': self.stages,
+            'files': self.files,
+        }
+        _history.append(result)
+        if self.log:
+            self.log(f"运行统计: 总用时 {result['seconds']:.3f} 秒" + _memory_text(result))
+        return result
+
+
+def instrumented(pipeline):
+    """
+    流水线函数的装饰器：为每次调用创建 RunMetrics，通过 run_metrics 参数传入，
+    并在函数返回或抛出异常后保存统计结果（被取消的运行记为 'cancelled'）。
+    日志输出到调用方的 log_callback。
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # ingest 导入了本模块，调用时再导入以免循环导入
+            import ingest
+
+            log_callback = signature.bind(*args, **kwargs).arguments.get('log_callback')
+            run = RunMetrics(pipeline, log_callback or print)
+            try:
+                result = func(*args, run_metrics=run, **kwargs)
+            except ingest.Cancelled:
+                run.finish('cancelled')
+                raise
+            except BaseException:
+                run.finish('failed')
+                raise
+            run.finish()
+            return result
+        return wrapper
+    return decorator
+
+
+def history(pipeline=None):
+    """返回最近的运行统计（从旧到新），可按流水线筛选"""
+    return _history.list(pipeline)
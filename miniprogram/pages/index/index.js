@@ -1,5 +1,33 @@
 const app = getApp()
 
+const PREVIEW_PAGE_SIZE = 50
+const LOG_POLL_INTERVAL = 2000
+const MAX_UPLOAD_FILES = 12
+const PREVIEW_DEFAULT_SHEETS = {
+    hy: '月度统计',
+    cz: '月度供应量'
+}
+
+function formatCell(column, value) {
+    if (value === null || value === undefined) return ''
+    if (typeof value === 'number') {
+        return column === '序号' ? String(Math.trunc(value)) : value.toFixed(2)
+    }
+    return String(value)
+}
+
+// Build a rich-text table from one columnar preview page
+function buildTableHtml(page) {
+    const cell = 'style="border:1px solid #ccc; padding:4px;"'
+    let html = '<table style="width:100%; border-collapse: collapse; border:1px solid #ccc;">'
+    html += '<tr>' + page.columns.map(col => `<th ${cell}>${col}</th>`).join('') + '</tr>'
+    const count = page.columns.length ? page.data[page.columns[0]].length : 0
+    for (let i = 0; i < count; i++) {
+        html += '<tr>' + page.columns.map(col => `<td ${cell}>${formatCell(col, page.data[col][i])}</td>`).join('') + '</tr>'
+    }
+    return html + '</table>'
+}
+
 Page({
     data: {
         serverUrl: 'http://127.0.0.1:5000', // Default, user should change
@@ -8,6 +36,9 @@ Page({
         running: false,
         logs: [],
         previewHtml: '',
+        previewSheets: [],
+        previewSheetIndex: 0,
+        previewInfo: '',
         scrollTop: 0
     },
 
@@ -18,6 +49,8 @@ Page({
             this.setData({ serverUrl: savedUrl })
         }
         this.addLog('欢迎使用燃料管理小程序。请先配置服务器地址。')
+        // Initialise the log cursor so only logs from now on are shown
+        this.pollLogs()
     },
 
     onServerUrlInput(e) {
@@ -53,33 +86,38 @@ Page({
     chooseAndUpload() {
         const that = this;
         wx.chooseMessageFile({
-            count: 1,
+            count: MAX_UPLOAD_FILES,
             type: 'file',
             extension: ['xls', 'xlsx'],
             success(res) {
-                const tempFile = res.tempFiles[0]
-                that.addLog(`准备上传: ${tempFile.name}`)
-
-                wx.uploadFile({
-                    url: `${that.data.serverUrl}/upload`,
-                    filePath: tempFile.path,
-                    name: 'file',
-                    formData: {
-                        'type': that.data.currentTab
-                    },
-                    success(uRes) {
-                        const data = JSON.parse(uRes.data)
-                        if (data.error) {
-                            that.addLog(`❌ 上传失败: ${data.error}`)
-                        } else {
-                            that.addLog(`✅ 上传成功`)
-                            wx.showToast({ title: '上传成功' })
-                        }
-                    },
-                    fail(err) {
-                        that.addLog(`❌ 上传请求失败: ${err.errMsg}`)
-                    }
-                })
+                // wx.uploadFile sends one file per request, so upload them one by one
+                res.tempFiles.forEach(tempFile => that.uploadOne(tempFile))
+            }
+        })
+    },
+
+    uploadOne(tempFile) {
+        const that = this
+        that.addLog(`准备上传: ${tempFile.name}`)
+
+        wx.uploadFile({
+            url: `${that.data.serverUrl}/upload`,
+            filePath: tempFile.path,
+            name: 'file',
+            formData: {
+                'type': that.data.currentTab
+            },
+            success(uRes) {
+                const data = JSON.parse(uRes.data)
+                if (data.error) {
+                    that.addLog(`❌ ${tempFile.name} 上传失败: ${data.error}`)
+                } else {
+                    that.addLog(`✅ ${tempFile.name} 上传成功`)
+                    wx.showToast({ title: '上传成功' })
+                }
+            },
+            fail(err) {
+                that.addLog(`❌ 上传请求失败: ${err.errMsg}`)
             }
         })
     },
@@ -88,7 +126,7 @@ Page({
         const that = this
         this.setData({ running: true, statusText: '运行中...' })
 
-        // Start Log Polling since SSE is hard
+        // Start Log Polling since SSE is hard in mini programs
         this.startLogPolling()
 
         wx.request({
@@ -105,46 +143,74 @@ Page({
         })
     },
 
-    // Simulated Log Polling (since real SSE needs Chunked support)
-    // Ideally backend should provide a polling endpoint, but let's try reading SSE...
-    // Or just assume logs will fail in this version and rely on final result.
-    // UPDATE: Let's simply poll `api/preview` to check if done? 
-    // Or just rely on user waiting.
-    // Actually I can implement a simple 'get last log' on backend if needed.
-    // For now, I won't poll logs continuously to avoid blocking, just show status.
+    // Poll the server log history (SSE needs chunked transfer support)
     startLogPolling() {
-        // Placeholder: In a real MP environment, use wx.request({ enableChunked: true }) for SSE
-        // Here we just warn user
-        this.addLog('Checking status...')
-
-        // Auto-refresh preview after 5s, 10s...
-        setTimeout(() => this.loadPreview(this.data.currentTab), 5000)
-        setTimeout(() => {
-            this.setData({ running: false, statusText: '就绪' })
-            this.loadPreview(this.data.currentTab)
-        }, 10000)
+        if (this.logTimer) return
+        this.pollLogs()
+        this.logTimer = setInterval(() => this.pollLogs(), LOG_POLL_INTERVAL)
     },
 
-    loadPreview(type) {
+    stopLogPolling() {
+        if (this.logTimer) {
+            clearInterval(this.logTimer)
+            this.logTimer = null
+        }
+    },
+
+    pollLogs() {
         const that = this
         wx.request({
-            url: `${that.data.serverUrl}/api/preview/${type}`,
+            url: `${that.data.serverUrl}/api/logs/history`,
+            data: { after: that.lastLogId || 0 },
             success(res) {
-                if (res.statusCode === 200 && !res.data.error) {
-                    // Combine all tables
-                    let html = ''
-                    for (const [sheet, table] of Object.entries(res.data)) {
-                        html += `<div class="sheet-title">${sheet}</div>` + table
+                if (res.statusCode !== 200 || res.data.error) return
+                const first = that.lastLogId === undefined
+                that.lastLogId = res.data.last_id
+                // The first poll only sets the cursor, older logs are not replayed
+                if (first) return
+                res.data.messages.forEach(item => {
+                    that.addLog(item.message)
+                    if (item.message.includes('汇总任务完成') || item.message.includes('任务出错')) {
+                        that.setData({ running: false, statusText: '就绪' })
+                        that.stopLogPolling()
+                        that.loadPreview(that.data.currentTab)
                     }
-                    // Replace class for styling
-                    html = html.replace(/class="result-table"/g, 'style="width:100%; border-collapse: collapse; border:1px solid #ccc;" border="1"')
+                })
+            }
+        })
+    },
 
-                    that.setData({ previewHtml: html })
+    loadPreview(type, sheet) {
+        const that = this
+        // Only request one page of one sheet; summary sheets are shown by default
+        const sheetName = sheet === undefined ? PREVIEW_DEFAULT_SHEETS[type] : sheet
+        const query = { offset: 0, limit: PREVIEW_PAGE_SIZE }
+        if (sheetName) query.sheet = sheetName
+        wx.request({
+            url: `${that.data.serverUrl}/api/preview/${type}`,
+            data: query,
+            success(res) {
+                if (res.statusCode === 200 && !res.data.error) {
+                    const page = res.data
+                    that.setData({
+                        previewHtml: buildTableHtml(page),
+                        previewSheets: page.sheets,
+                        previewSheetIndex: page.sheets.indexOf(page.sheet),
+                        previewInfo: `${page.sheet}：显示前 ${Math.min(page.limit, page.total)} / ${page.total} 行`
+                    })
+                } else if (res.statusCode === 404 && sheet === undefined) {
+                    // Fall back to the first sheet if the default one is missing
+                    that.loadPreview(type, '')
                 }
             }
         })
     },
 
+    onPreviewSheetChange(e) {
+        const sheet = this.data.previewSheets[e.detail.value]
+        this.loadPreview(this.data.currentTab, sheet)
+    },
+
     downloadResult() {
         const that = this
         const type = this.data.currentTab
@@ -0,0 +1,79 @@
+import threading
+
+import pandas as pd
+
+import schema
+import store
+
+# pipeline name -> (store version, {table_name: (compact DataFrame, display specs)})
+_cache = {}
+_lock = threading.Lock()
+
+
+def to_columns(df):
+    """Convert a table (usually one page of rows) to JSON-ready column lists."""
+    data = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime('%Y-%m-%d')
+        elif isinstance(series.dtype, pd.PeriodDtype):
+            series = schema.month_text(series)
+        data[str(col)] = series.astype(object).where(series.notna(), None).tolist()
+    return {'columns': [str(c) for c in df.columns], 'data': data, 'total': len(df)}
+
+
+def load_table(name, table, manifest=None):
+    """
+    Return one table of a pipeline's results from the data store and its
+    display column specs, kept in their compact form and read once per
+    store version. Raises FileNotFoundError when the pipeline has not been
+    run and KeyError for an unknown table. Pass the manifest (store.info)
+    already read by the caller so both come from the same version.
+    """
+    manifest = manifest or store.info(name)
+    version = manifest['version']
+    with _lock:
+        cached = _cache.get(name)
+        if not cached or cached[0] != version:
+            cached = (version, {})
+            _cache[name] = cached
+        tables = cached[1]
+        if table not in tables:
+            tables[table] = (store.load_table(name, table, manifest), store.display(name, table, manifest))
+        return tables[table]
+
+
+def page(name, sheet=None, offset=0, limit=100, columns=None):
+    """
+    Return one page of one table as columnar JSON.
+
+    Raises KeyError for an unknown sheet or column.
+    """
+    # One manifest read per request, so the sheet list and the rows come from one version
+    manifest = store.info(name)
+    names = manifest['tables']
+    if sheet is None:
+        sheet = names[0]
+    if sheet not in names:
+        raise KeyError(sheet)
+
+    df, display = load_table(name, sheet, manifest)
+    all_columns = [str(c) for c in schema.display_columns(df.columns, display)]
+    selected = columns or all_columns
+    for col in selected:
+        if col not in all_columns:
+            raise KeyError(col)
+
+    # Only the requested rows are converted, display columns included
+    rows = schema.with_display(df.iloc[offset:offset + limit], display)
+    rows.columns = all_columns
+    return {
+        'sheets': names,
+        'sheet': sheet,
+        'columns': selected,
+        'data': to_columns(rows[selected])['data'],
+        'offset': offset,
+        'limit': limit,
+        'total': len(df),
+    }
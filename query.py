@@ -0,0 +1,148 @@
+"""
+In-memory query engine behind /api/query/<type>.
+
+Each pipeline's summary table is kept resident in its compact form and
+indexed by month and by the filterable name columns, so a request narrows
+rows with a binary search and set intersections instead of scanning the
+frame. Datasets are rebuilt only when the data store version changes.
+
+Rollups do not touch the detail rows: they merge the monthly partial
+aggregates saved by the pipeline, so totals and weighted means for any
+month range come from one small (month, supplier) table.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+import aggregate
+import keys
+import preview
+import schema
+import store
+
+MONTH_COLUMN = '报表月份'
+
+# pipeline name -> (store version, Dataset)
+_datasets = {}
+# pipeline name -> (store version, Dataset of monthly partial aggregates)
+_partials = {}
+_lock = threading.Lock()
+
+
+class Dataset:
+    """
+    A consolidated dataset kept in memory, sorted by month, with prebuilt
+    indexes so queries never scan the whole frame.
+    """
+
+    def __init__(self, df, index_columns, display=None):
+        # Sorted integer month keys (YYYYMM): a month range is a binary search, not a scan
+        months = keys.month_key(df[MONTH_COLUMN])
+        order = np.argsort(months, kind='stable')
+        self.df = df.take(order).reset_index(drop=True)
+        self.months = months[order]
+        self.display = display or []
+        # value -> sorted row positions for every filterable column
+        self.indexes = {
+            col: self.df.groupby(col, sort=False, observed=True).indices
+            for col in index_columns if col in self.df.columns
+        }
+
+    def select(self, start=None, end=None, filters=None):
+        """Return the sorted row positions matching a month range and exact-match filters."""
+        lo = np.searchsorted(self.months, _month(start), side='left') if start else 0
+        hi = np.searchsorted(self.months, _month(end), side='right') if end else len(self.months)
+        if start:
+            # Rows without a month sort first; never return them for a range
+            lo = max(lo, np.searchsorted(self.months, keys.MISSING, side='right'))
+        positions = np.arange(lo, hi)
+
+        for col, values in (filters or {}).items():
+            if col not in self.indexes:
+                raise KeyError(col)
+            index = self.indexes[col]
+            matches = [index[v] for v in values if v in index]
+            matched = np.unique(np.concatenate(matches)) if matches else np.array([], dtype=int)
+            positions = np.intersect1d(positions, matched, assume_unique=True)
+            if not len(positions):
+                break
+        return positions
+
+    def query(self, start=None, end=None, filters=None, offset=0, limit=100, columns=None):
+        positions = self.select(start, end, filters)
+        all_columns = schema.display_columns(self.df.columns, self.display)
+        selected = columns or all_columns
+        for col in selected:
+            if col not in all_columns:
+                raise KeyError(col)
+        page = schema.with_display(self.df.iloc[positions[offset:offset + limit]], self.display)
+        result = preview.to_columns(page[selected])
+        result.update({'offset': offset, 'limit': limit, 'total': int(len(positions))})
+        return result
+
+
+def _month(value):
+    """Parse a YYYY-MM query bound into an integer month key."""
+    month = keys.month_key([value])[0]
+    if month == keys.MISSING:
+        raise ValueError(f"Invalid month: {value}")
+    return month
+
+
+def _load_frame(name, source, manifest):
+    df = store.load_table(name, source['table'], manifest)
+    if 'date' in source:
+        df[MONTH_COLUMN] = pd.to_datetime(df[source['date']], errors='coerce').dt.to_period('M')
+    return df
+
+
+def get_dataset(name, source):
+    """Return the in-memory dataset of a pipeline, rebuilding it only when the data store changes."""
+    manifest = store.info(name)
+    version = manifest['version']
+    with _lock:
+        cached = _datasets.get(name)
+        if cached and cached[0] == version:
+            return cached[1]
+        dataset = Dataset(_load_frame(name, source, manifest), source['filters'].values(),
+                          store.display(name, source['table'], manifest))
+        _datasets[name] = (version, dataset)
+        return dataset
+
+
+def get_partials(name):
+    """Return the monthly partial aggregates of a pipeline as an indexed dataset."""
+    manifest = store.info(name)
+    version = manifest['version']
+    with _lock:
+        cached = _partials.get(name)
+        if cached and cached[0] == version:
+            return cached[1]
+        df = store.load_table(name, aggregate.PARTIALS_TABLE, manifest)
+        group_columns, _, _ = aggregate.partial_layout(df)
+        dataset = Dataset(df, [col for col in group_columns if col != MONTH_COLUMN])
+        _partials[name] = (version, dataset)
+        return dataset
+
+
+def rollup(name, by, start=None, end=None, filters=None, offset=0, limit=100):
+    """
+    Aggregate a month range by merging the stored monthly partials, so the
+    cost depends on the number of months and suppliers, not on the rows.
+
+    by lists the grouping columns (empty for one overall row). Each metric
+    column is returned as <column>_<statistic>, e.g. 发热量_weighted.
+    """
+    dataset = get_partials(name)
+    group_columns, weight, metrics = aggregate.partial_layout(dataset.df)
+    for col in by:
+        if col not in group_columns:
+            raise KeyError(col)
+    rows = dataset.df.iloc[dataset.select(start, end, filters)]
+    merged = aggregate.merge_partials(rows, [rows[col] for col in by], metrics, weight)
+    merged.columns = [f"{col}_{stat}" for col, stat in merged.columns]
+    merged = merged.reset_index() if by else merged.reset_index(drop=True)
+    result = preview.to_columns(merged.iloc[offset:offset + limit])
+    result.update({'offset': offset, 'limit': limit, 'total': len(merged)})
+    return result
@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# 流水线模块（以及 pandas）在 default_stages 和运行时才导入，
+# 导入本模块不会拖慢 cli 的 status/list 和 Web 服务的启动
+import cache
+import store
+
+# 各阶段上次成功运行时的输入指纹，与解析缓存放在一起
+STATE_FILE = os.path.join(cache.CACHE_DIR, 'runner_state.json')
+
+# 同时运行的阶段数
+MAX_PARALLEL = 3
+
+_state_lock = threading.Lock()
+# workers > 1 时，用进程池解析月报的阶段依次占用这把锁，同时运行的阶段合计不超过 workers 个解析进程
+_pool_lock = threading.Lock()
+
+
+class Stage:
+    """
+    流水线中的一个阶段。run(log, workers, progress, cancel) 执行阶段，progress 和 cancel
+    可能为 None，含义同 ingest.load_reports；inputs() 返回阶段自身的输入描述
+    （文件列表、解析版本等），与依赖阶段的指纹一起决定本阶段的指纹；
+    outputs() 返回输出的版本标识，输出不存在时为 None，没有输出的阶段不需要提供。
+    source 为阶段读取的输入文件夹，文件夹不存在时阶段记为跳过而不是失败，依赖它的阶段照常运行；
+    processes 为 True 表示阶段会用 workers 个进程解析月报。
+    """
+
+    def __init__(self, name, label, run, deps=(), inputs=None, outputs=None, source=None,
+                 processes=False):
+        self.name = name
+        self.label = label
+        self.run = run
+        self.deps = tuple(deps)
+        self.inputs = inputs or (lambda: None)
+        self.outputs = outputs
+        self.source = source
+        self.processes = processes
+
+
+def folder_inputs(folder_path, version):
+    """文件夹中月报的名称、大小、修改时间及解析版本号"""
+    import ingest
+
+    if not os.path.exists(folder_path):
+        return [version, []]
+    files = []
+    for filename in ingest.list_reports(folder_path):
+        stat = os.stat(os.path.join(folder_path, filename))
+        files.append([filename, stat.st_size, stat.st_mtime_ns])
+    return [version, files]
+
+
+def store_outputs(name, *files):
+    """数据仓中某条流水线的版本，及导出文件是否都存在"""
+    def outputs():
+        if not all(os.path.exists(f) for f in files):
+            return None
+        try:
+            return store.version(name)
+        except FileNotFoundError:
+            return None
+    return outputs
+
+
+def _ingest_stage(kind, label, folder_path, parser, version):
+    def run(log, workers, progress, cancel):
+        import ingest
+
+        parsed = ingest.warm_cache(kind, folder_path, parser, log, workers, version, progress, cancel)
+        log(f"解析了 {parsed} 个新增或变动的月报")
+    return Stage(f'ingest_{kind}', label, run, inputs=lambda: folder_inputs(folder_path, version),
+                 source=folder_path, processes=True)
+
+
+def default_stages():
+    """
+    化验、称重、收耗存的阶段：各自的月报读取互不依赖，可以同时进行；
+    称重汇总关联化验汇总的指标，收耗存与称重汇总对账，因此汇总阶段依次进行。
+    汇总阶段包括分组汇总、写入数据仓和导出 Excel。
+    某条流水线的输入文件夹不存在时跳过它，与单独运行各流水线时一样，称重汇总没有化验数据也照常进行。
+    """
+    import cz
+    import hy
+    import shc
+
+    return [
+        _ingest_stage('hy', '读取化验月报', '无人值守化验月报', hy.parse_report, hy.PARSE_VERSION),
+        _ingest_stage('cz', '读取称重月报', '无人值守称重月报', cz.parse_report, cz.PARSE_VERSION),
+        _ingest_stage('shc', '读取收耗存报表', '收耗存数据', shc.parse_report, shc.PARSE_VERSION),
+        Stage('hy', '化验月报汇总',
+              lambda log, workers, progress, cancel: hy.run_analysis(
+                  log_callback=log, workers=workers, progress_callback=progress, cancel_event=cancel),
+              deps=['ingest_hy'], source='无人值守化验月报',
+              outputs=store_outputs('hy', '化验月报汇总.xlsx', '化验月报汇总分类.xlsx')),
+        Stage('cz', '称重月报汇总',
+              lambda log, workers, progress, cancel: cz.run_weight_processing(
+                  log_callback=log, workers=workers, progress_callback=progress, cancel_event=cancel),
+              deps=['ingest_cz', 'hy'], source='无人值守称重月报',
+              outputs=store_outputs('cz', '称重月报汇总.xlsx', '称重月报汇总分类.xlsx')),
+        Stage('shc', '收耗存汇总',
+              lambda log, workers, progress, cancel: shc.run_stock_processing(
+                  log_callback=log, workers=workers, progress_callback=progress, cancel_event=cancel),
+              deps=['ingest_shc', 'cz'], source='收耗存数据',
+              outputs=store_outputs('shc', '收耗存汇总.xlsx')),
+    ]
+
+
+def _load_state(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(path, state):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp', dir=folder or '.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _fingerprint(stage, dep_fingerprints):
+    data = json.dumps([stage.inputs(), dep_fingerprints], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _needed(stages, targets):
+    """目标阶段及其全部依赖"""
+    needed = set()
+    todo = list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(stages[name].deps)
+    return needed
+
+
+def run(targets=None, stages=None, log=print, workers=1, force=False, max_parallel=MAX_PARALLEL,
+        state_file=None, progress=None, cancel=None):
+    """
+    按依赖关系运行阶段，类似 make：输入（包括依赖阶段的指纹）与上次成功运行相同、
+    且输出仍然存在的阶段直接跳过；依赖都已完成的阶段同时运行。
+    targets 为要更新的阶段名，为空时运行全部阶段；force 为 True 时不跳过。
+    progress(已完成数, 总数, 文件名) 报告正在运行的各阶段合计的文件进度；
+    cancel（threading.Event）设置后不再开始新的阶段，正在运行的阶段在文件之间停止。
+    返回 {阶段名: 'done' | 'skipped' | 'failed' | 'blocked' | 'cancelled'}。
+    """
+    import ingest
+
+    stages = {stage.name: stage for stage in (stages or default_stages())}
+    for stage in stages.values():
+        for dep in stage.deps:
+            if dep not in stages:
+                raise KeyError(f"阶段 {stage.name} 依赖未知阶段 {dep}")
+    needed = _needed(stages, targets or list(stages))
+    state_file = state_file or STATE_FILE
+    with _state_lock:
+        state = _load_state(state_file)
+
+    fingerprints = {}
+    status = {}
+    running = {}
+    # 阶段名 -> (已完成文件数, 文件总数)
+    files = {}
+    files_lock = threading.Lock()
+
+    def stage_progress(name):
+        if not progress:
+            return None
+
+        def report(done, total, filename):
+            with files_lock:
+                files[name] = (done, total)
+                done, total = (sum(counts) for counts in zip(*files.values()))
+            progress(done, total, filename)
+        return report
+
+    def execute(stage, fingerprint):
+        before = stage.outputs() if stage.outputs else None
+        started = time.perf_counter()
+        if stage.processes and workers > 1:
+            with _pool_lock:
+                ingest.check_cancelled(cancel)
+                stage.run(log, workers, stage_progress(stage.name), cancel)
+        else:
+            stage.run(log, workers, stage_progress(stage.name), cancel)
+        if stage.outputs:
+            after = stage.outputs()
+            # 流水线出错时只输出日志，以输出是否更新判断是否成功
+            if after is None or after == before:
+                raise RuntimeError("没有生成新的结果")
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix='stage') as executor:
+        while len(status) < len(needed):
+            progressed = False
+            for name in sorted(needed - status.keys() - running.keys()):
+                stage = stages[name]
+                if cancel is not None and cancel.is_set():
+                    progressed = True
+                    status[name] = 'cancelled'
+                    continue
+                if any(status.get(dep) in ('failed', 'blocked') for dep in stage.deps):
+                    progressed = True
+                    status[name] = 'blocked'
+                    log(f"跳过 {stage.label}：依赖的阶段未完成")
+                    continue
+                if not all(status.get(dep) in ('done', 'skipped') for dep in stage.deps):
+                    continue
+                fingerprint = _fingerprint(stage, [fingerprints[dep] for dep in stage.deps])
+                fingerprints[name] = fingerprint
+                progressed = True
+                if stage.source and not os.path.isdir(stage.source):
+                    # 不记录指纹，文件夹出现后照常运行
+                    status[name] = 'skipped'
+                    log(f"{stage.label}：输入文件夹 {stage.source} 不存在，跳过")
+                    continue
+                up_to_date = (state.get(name) == fingerprint
+                              and (not stage.outputs or stage.outputs() is not None))
+                if up_to_date and not force:
+                    status[name] = 'skipped'
+                    log(f"{stage.label}：输入未变动，跳过")
+                    continue
+                log(f">>> 开始 {stage.label}")
+                running[name] = executor.submit(execute, stage, fingerprint)
+
+            if not running:
+                if not progressed:
+                    raise RuntimeError("阶段之间存在循环依赖")
+                continue
+            done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name in [n for n, future in running.items() if future in done]:
+                future = running.pop(name)
+                stage = stages[name]
+                try:
+                    seconds = future.result()
+                except ingest.Cancelled:
+                    status[name] = 'cancelled'
+                    log(f"{stage.label} 已取消")
+                    continue
+                except Exception as e:
+                    status[name] = 'failed'
+                    log(f"!!! {stage.label} 出错: {e}")
+                    continue
+                status[name] = 'done'
+                log(f"<<< {stage.label} 完成（{seconds:.3f} 秒）")
+                with _state_lock:
+                    state = {**_load_state(state_file), name: fingerprints[name]}
+                    _save_state(state_file, state)
+    return status
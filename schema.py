@@ -0,0 +1,59 @@
+import pandas as pd
+
+# 数据在内存和数据仓中保持紧凑：名称为分类类型，月份为 Period，整数列用最小的整数类型。
+# 由其他列拼出的显示列（如 报表月份供应商）不保存，只在导出、预览和查询时按需生成。
+
+
+def categorize(df, columns):
+    """把名称列转换为分类类型（原地修改），不存在的列忽略"""
+    for col in columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def downcast(df):
+    """
+    把整数列转换为能容纳其取值的最小整数类型（原地修改）。
+    小数列保持 float64：化验指标和重量都是十进制小数，float32 无法精确表示，
+    且会降低分组求和的精度。
+    """
+    for col in df.columns:
+        dtype = df[col].dtype
+        if pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def month_text(values):
+    """把 Period 或日期列转换为 'YYYY-MM' 字符串，空值保持为空"""
+    if isinstance(values.dtype, pd.PeriodDtype) or pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.strftime('%Y-%m')
+    return values.astype(object)
+
+
+def month_label(column, position, month, text):
+    """
+    显示列定义：'月份-名称' 形式的拼接列（如 报表月份供应商），
+    插入到第 position 列。可以保存在数据仓清单中。
+    """
+    return {'column': column, 'position': position, 'month': month, 'text': text}
+
+
+def display_columns(columns, specs):
+    """加入显示列后的完整列顺序"""
+    columns = list(columns)
+    for spec in specs or []:
+        columns.insert(spec['position'], spec['column'])
+    return columns
+
+
+def with_display(df, specs):
+    """按定义生成显示列，返回新的数据框，原数据框不变"""
+    if not specs:
+        return df
+    df = df.copy(deep=False)
+    for spec in specs:
+        value = month_text(df[spec['month']]) + '-' + df[spec['text']].astype(object)
+        df.insert(spec['position'], spec['column'], value)
+    return df
@@ -0,0 +1,257 @@
+import pandas as pd
+import numpy as np
+import datetime
+import os
+import re
+
+import export
+import ingest
+import metrics
+import schema
+import store
+import suppliers
+
+# 收耗存表带有上万个空列，只读取前面的有效列
+MAX_COLUMNS = 200
+
+# 表头中合计列的名称（按前缀匹配，表头中带有换行和单位）
+RECEIVED_HEADER = '合计来煤'
+CONSUMED_HEADER = '皮带秤消耗'
+STOCK_HEADER = '库存'
+
+# 解析结果中的项目
+RECEIVED = '来煤量'
+CONSUMED = '耗煤量'
+STOCK = '库存'
+OPENING = '期初库存'
+MINE = '矿点来煤'
+
+# 以分类类型保存的列
+category_columns = ['项目', '分组', '矿点']
+
+# 解析逻辑版本号，修改 parse_report 后需加一以使旧缓存失效
+PARSE_VERSION = 1
+
+def _month_from_filename(file):
+    """从文件名（如 2025年01月侯马热电收耗存数据.xlsx）取得报表月份"""
+    match = re.search(r'(\d{4})年(\d{1,2})月', file)
+    if match:
+        return pd.Period(year=int(match.group(1)), month=int(match.group(2)), freq='M')
+    return None
+
+def _label(value):
+    """表头文字：去掉换行和多余空白"""
+    if pd.isna(value):
+        return None
+    return ' '.join(str(value).split())
+
+def mine_name(label):
+    """矿点简称：取矿点列名开头的中文部分，如 '金辛达(G) 1-1' -> '金辛达'"""
+    match = re.match(r'[一-鿿]+', label or '')
+    return match.group(0) if match else (label or '')
+
+def parse_report(file_path):
+    """
+    解析单个收耗存月报，返回长表：报表月份、日期、项目、分组、矿点、数量。
+    项目包括每日的来煤量、耗煤量、库存，各矿点的每日来煤，以及期初库存（日期为空）。
+    各月的矿点列不同，因此按表头定位列，而不是按固定位置。
+    """
+    file = os.path.basename(file_path)
+    rows = ingest.read_rows(file_path, MAX_COLUMNS)
+
+    # 定位表头：第一列为'日期'的行，下一行为各矿点名称
+    header = next((r for r, row in enumerate(rows) if row and row[0] == '日期'), None)
+    if header is None or header + 1 >= len(rows):
+        raise ValueError(f"未找到表头行（日期）: {file}")
+    groups = [_label(v) for v in rows[header]]
+    names = [_label(v) for v in rows[header + 1]]
+
+    def find(prefix):
+        for i, label in enumerate(groups):
+            if label and label.replace(' ', '').startswith(prefix):
+                return i
+        raise KeyError(prefix)
+
+    received, consumed, stock = find(RECEIVED_HEADER), find(CONSUMED_HEADER), find(STOCK_HEADER)
+
+    # 每日数据行：第一列为日期
+    body = [row for row in rows[header + 2:] if row and isinstance(row[0], datetime.datetime)]
+    dates = pd.to_datetime([row[0] for row in body])
+
+    def values(col):
+        return pd.to_numeric(pd.Series([row[col] if col < len(row) else np.nan for row in body]),
+                             errors='coerce').to_numpy(dtype=float)
+
+    month = _month_from_filename(file)
+    if month is None:
+        if not len(dates):
+            raise ValueError(f"无法确定报表月份: {file}")
+        month = dates[0].to_period('M')
+
+    frames = []
+
+    def add(item, amounts, group=None, mine=None, day=dates):
+        frames.append(pd.DataFrame({
+            '日期': day, '项目': item, '分组': group, '矿点': mine, '数量': amounts,
+        }))
+
+    # 每日合计
+    add(RECEIVED, values(received))
+    add(CONSUMED, values(consumed))
+    add(STOCK, values(stock))
+
+    # 期初库存：矿点名称行中库存列的数值
+    opening = pd.to_numeric(pd.Series([names[stock] if stock < len(names) else None]), errors='coerce')
+    add(OPENING, opening.to_numpy(dtype=float), day=pd.DatetimeIndex([pd.NaT]))
+
+    # 各矿点每日来煤（矿点列位于日期列与合计来煤列之间，分组名称向右延续）
+    group = None
+    for col in range(1, received):
+        group = groups[col] or group
+        amounts = values(col)
+        keep = ~np.isnan(amounts) & (amounts != 0)
+        if keep.any():
+            add(MINE, amounts[keep], group, names[col] or group, dates[keep])
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df[df['项目'].isin([OPENING, MINE]) | df['数量'].notna()]
+    df.insert(0, '报表月份', pd.Series(month, index=df.index))
+    df = df.reset_index(drop=True)
+    return schema.categorize(df, category_columns)
+
+def balance_tables(df):
+    """由解析结果生成日报和月度收耗存汇总"""
+    totals = df[df['项目'].isin([RECEIVED, CONSUMED, STOCK])]
+    daily = totals.pivot_table(index=['报表月份', '日期'], columns='项目', values='数量',
+                               aggfunc='sum', observed=True)
+    daily = daily.reindex(columns=[RECEIVED, CONSUMED, STOCK]).reset_index()
+    daily.columns.name = None
+
+    by_month = daily.groupby('报表月份', sort=True)
+    monthly = pd.DataFrame({
+        OPENING: df[df['项目'] == OPENING].groupby('报表月份')['数量'].sum(min_count=1),
+        RECEIVED: by_month[RECEIVED].sum(),
+        CONSUMED: by_month[CONSUMED].sum(),
+        # 期末库存取当月最后一个有库存记录的日期
+        '期末库存': by_month[STOCK].last(),
+        '天数': by_month['日期'].count(),
+    })
+    monthly['账面期末库存'] = monthly[OPENING] + monthly[RECEIVED] - monthly[CONSUMED]
+    # 吨数保留三位小数，避免浮点误差显示为差异
+    monthly['库存差异'] = (monthly['期末库存'] - monthly['账面期末库存']).round(3) + 0.0
+    monthly = monthly.rename_axis('报表月份').reset_index()
+    return daily, monthly
+
+def mine_tables(df):
+    """各矿点月度来煤量"""
+    mines = df[df['项目'] == MINE]
+    monthly = mines.groupby(['报表月份', '分组', '矿点'], sort=True, observed=True)['数量'].sum()
+    monthly = monthly.rename(RECEIVED).reset_index()
+    monthly['矿点简称'] = monthly['矿点'].astype(str).map(mine_name)
+    return monthly
+
+def match_suppliers(short_names, full_names):
+    """
+    按矿点简称匹配称重数据中的供应商全称：全称中包含简称即为匹配，
+    有多个时取最短的全称；没有匹配的为空字符串。
+    """
+    full_names = sorted((str(n) for n in full_names if n), key=len)
+    matched = {}
+    for short in short_names:
+        matched[short] = next((name for name in full_names if short and short in name), '')
+    return matched
+
+def reconcile(monthly, mine_monthly, weights):
+    """
+    将收耗存的来煤量与称重汇总的到厂重量对账，返回 (按月对账, 按供应商对账)。
+    weights 为称重合并数据（需包含 报表月份、供应商全称、重量）。
+    """
+    weighed = weights.groupby('报表月份', sort=True)['重量'].sum().rename('称重重量')
+    by_month = monthly[['报表月份', RECEIVED]].merge(
+        weighed, left_on='报表月份', right_index=True, how='outer').sort_values('报表月份')
+    by_month['差异'] = (by_month[RECEIVED] - by_month['称重重量']).round(3) + 0.0
+    by_month['差异率'] = by_month['差异'] / by_month['称重重量'].where(by_month['称重重量'] != 0)
+
+    names = match_suppliers(mine_monthly['矿点简称'].unique(), weights['供应商全称'].unique())
+    mines = mine_monthly.assign(供应商全称=mine_monthly['矿点简称'].map(names))
+    mines = mines.groupby(['报表月份', '供应商全称'], sort=True)[RECEIVED].sum()
+    weighed = weights.groupby(['报表月份', weights['供应商全称'].astype(str)], sort=True,
+                              observed=True)['重量'].sum().rename('称重重量')
+    by_supplier = pd.concat([mines, weighed], axis=1).reset_index()
+    by_supplier = by_supplier[by_supplier['供应商全称'] != '']
+    by_supplier['差异'] = (by_supplier[RECEIVED].fillna(0) - by_supplier['称重重量'].fillna(0)).round(3) + 0.0
+    return by_month.reset_index(drop=True), by_supplier.reset_index(drop=True)
+
+@metrics.instrumented('shc')
+def run_stock_processing(folder_path="收耗存数据", log_callback=None, use_cache=True, workers=1,
+                         progress_callback=None, cancel_event=None, run_metrics=None):
+    def log(message):
+        if log_callback:
+            log_callback(message)
+        else:
+            print(message)
+
+    if not os.path.exists(folder_path):
+        log(f"错误: 文件夹 '{folder_path}' 不存在")
+        return
+
+    # 读取所有收耗存月报（未变动的文件从缓存读取，其余可并行解析）
+    reports = ingest.load_reports('shc', folder_path, parse_report, log,
+                                  workers=workers, use_cache=use_cache, version=PARSE_VERSION,
+                                  run_metrics=run_metrics, progress=progress_callback,
+                                  cancel=cancel_event)
+    dfs = [df for _, df in reports if not df.empty]
+    run_metrics.lap('读取月报', sum(len(df) for df in dfs))
+    if not dfs:
+        log("没有找到可处理的收耗存文件")
+        return
+
+    for column in category_columns:
+        suppliers.unify(dfs, column)
+    combined_df = pd.concat(dfs, ignore_index=True)
+
+    daily, monthly = balance_tables(combined_df)
+    mine_monthly = mine_tables(combined_df)
+    for row in monthly.itertuples(index=False):
+        if pd.notna(row.库存差异) and abs(row.库存差异) >= 1:
+            log(f"警告：{row.报表月份} 期末库存与 期初+来煤-耗煤 相差 {row.库存差异:.2f} 吨")
+    run_metrics.lap('收耗存汇总', len(combined_df))
+
+    tables = {'月度收耗存': monthly}
+
+    # 与称重汇总对账
+    try:
+        weights = store.load_table('cz', '合并数据')
+        by_month, by_supplier = reconcile(monthly, mine_monthly, weights)
+        tables['来煤对账'] = by_month
+        tables['供应商对账'] = by_supplier
+        log("已与称重汇总完成来煤量对账")
+    except FileNotFoundError:
+        log("警告：数据仓中未找到称重汇总数据，请先执行称重月报汇总，无法对账")
+    except Exception as e:
+        log(f"对账时出错: {str(e)}")
+    run_metrics.lap('称重对账')
+
+    tables['矿点月度来煤'] = mine_monthly
+    tables['日报'] = daily
+    # 取消时保留上一次的结果，不写入
+    ingest.check_cancelled(cancel_event)
+
+    # snapshot 为空（写入失败）时只导出工作簿
+    snapshot = None
+    try:
+        snapshot = 'shc', store.save_tables('shc', tables)
+        log("汇总数据已写入数据仓")
+    except Exception as e:
+        log(f"写入数据仓时出错: {str(e)}")
+    run_metrics.lap('写入数据仓')
+
+    try:
+        export.write_workbook("收耗存汇总.xlsx", tables, snapshot=snapshot)
+        run_metrics.lap('导出汇总', len(daily))
+        log("收耗存汇总文件已保存为: 收耗存汇总.xlsx")
+    except Exception as e:
+        log(f"保存收耗存汇总文件时出错: {str(e)}")
+
+if __name__ == "__main__":
+    run_stock_processing()
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class Database:
+    """
+    A local SQLite file shared by the worker processes of the web server.
+
+    Each thread (and each forked process) gets its own connection in
+    autocommit mode; writes that must be atomic across processes go
+    through transaction(), which takes the database write lock up front.
+    WAL mode lets readers proceed while a writer commits.
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._local = threading.local()
+        # executescript() would commit on its own, so run the statements one by one
+        with self.transaction() as conn:
+            for statement in schema.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connect().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
@@ -29,16 +29,16 @@ function setupDragAndDrop(type) {
 }
 
 function handleFiles(files, type) {
-    const file = files[0];
-    uploadFile(file, type);
+    uploadFiles(Array.from(files), type);
 }
 
-function uploadFile(file, type) {
+// Upload several monthly reports in one request
+function uploadFiles(files, type) {
     const formData = new FormData();
-    formData.append('file', file);
+    files.forEach(file => formData.append('files', file));
     formData.append('type', type);
 
-    addLog(`正在上传文件: ${file.name}...`);
+    addLog(`正在上传文件: ${files.map(f => f.name).join(', ')}...`);
 
     fetch('/upload', {
         method: 'POST',
@@ -46,10 +46,15 @@ function uploadFile(file, type) {
     })
         .then(response => response.json())
         .then(data => {
+            (data.files || []).forEach(item => {
+                if (item.error) addLog(`❌ ${item.file} 上传失败: ${item.error}`, 'error');
+            });
+            // Some files of a batch may be saved even when others were rejected
+            if ((data.files || []).some(item => !item.error)) {
+                addLog(`✅ 上传成功! ${data.message}`, 'system');
+            }
             if (data.error) {
                 addLog(`❌ 上传失败: ${data.error}`, 'error');
-            } else {
-                addLog(`✅ 上传成功!`, 'system');
             }
         })
         .catch(error => {
@@ -76,8 +81,7 @@ function runTask(type) {
                 resetStatus(type);
             } else {
                 addLog(`🚀 ${data.message}`, 'system');
-                // Auto reset status after some time or wait for specific log message (simplified here)
-                setTimeout(() => resetStatus(type), 5000);
+                watchJob(type, data.job_id);
             }
         })
         .catch(error => {
@@ -86,6 +90,25 @@ function runTask(type) {
         });
 }
 
+// Poll the job until it finishes, then reset the status badge
+function watchJob(type, jobId) {
+    fetch(`/api/jobs/${jobId}`)
+        .then(response => response.json())
+        .then(job => {
+            if (job.error && !job.status) {
+                resetStatus(type);
+            } else if (['pending', 'queued', 'running'].includes(job.status)) {
+                document.getElementById(`status-${type}`).textContent = job.status === 'running' ? "运行中..." : "排队中...";
+                setTimeout(() => watchJob(type, jobId), 1000);
+            } else {
+                if (job.status === 'failed') addLog(`❌ 任务失败: ${job.error}`, 'error');
+                else addLog(`⏱ 任务耗时 ${job.run_seconds} 秒`, 'system');
+                resetStatus(type);
+            }
+        })
+        .catch(() => resetStatus(type));
+}
+
 function resetStatus(type) {
     const statusSpan = document.getElementById(`status-${type}`);
     statusSpan.textContent = "就绪";
@@ -106,14 +129,20 @@ function clearLogs() {
 }
 
 // SSE for Log Streaming
+let lastLogId = null;
+
 function setupLogStream() {
-    const eventSource = new EventSource('/api/logs');
+    // Resume from the last received message so nothing is lost while reconnecting
+    const url = lastLogId === null ? '/api/logs' : `/api/logs?last_id=${lastLogId}`;
+    const eventSource = new EventSource(url);
     eventSource.onmessage = function (event) {
+        if (event.lastEventId) lastLogId = event.lastEventId;
         const data = JSON.parse(event.data);
         if (data.message) {
             // Check for completion messages to reset status if needed
             if (data.message.includes("化验汇总任务完成")) resetStatus('hy');
             if (data.message.includes("称重汇总任务完成")) resetStatus('cz');
+            if (data.message.includes("收耗存汇总任务完成")) resetStatus('shc');
 
             addLog(data.message);
         }
@@ -125,7 +154,112 @@ function setupLogStream() {
     };
 }
 
-// Preview Results with Tabs
+// Preview helpers
+const PREVIEW_LANGUAGE = {
+    "sProcessing": "处理中...",
+    "sLengthMenu": "显示 _MENU_ 项结果",
+    "sZeroRecords": "没有匹配结果",
+    "sInfo": "显示第 _START_ 至 _END_ 项结果，共 _TOTAL_ 项",
+    "sInfoEmpty": "显示第 0 至 0 项结果，共 0 项",
+    "sInfoFiltered": "(由 _MAX_ 项结果过滤)",
+    "sSearch": "搜索:",
+    "sEmptyTable": "表中数据为空",
+    "oPaginate": {
+        "sFirst": "首页",
+        "sPrevious": "上页",
+        "sNext": "下页",
+        "sLast": "末页"
+    }
+};
+
+function formatCell(column, value) {
+    if (value === null || value === undefined) return '';
+    if (typeof value === 'number') {
+        if (column === '序号') return String(Math.trunc(value));
+        return value.toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 });
+    }
+    return value;
+}
+
+function fetchPreviewPage(type, sheet, offset, limit) {
+    const params = new URLSearchParams({ offset: offset, limit: limit });
+    if (sheet) params.set('sheet', sheet);
+    return fetch(`/api/preview/${type}?${params}`).then(response => {
+        if (!response.ok) {
+            return response.json().then(err => { throw new Error(err.error || 'Network response was not ok'); });
+        }
+        return response.json();
+    });
+}
+
+// Columnar page -> row arrays for DataTables
+function pageRows(page) {
+    const rows = [];
+    const count = page.columns.length ? page.data[page.columns[0]].length : 0;
+    for (let i = 0; i < count; i++) {
+        rows.push(page.columns.map(col => formatCell(col, page.data[col][i])));
+    }
+    return rows;
+}
+
+// Build a server-side paginated table for one sheet, starting from its first page
+function renderSheet(type, content, firstPage) {
+    const table = document.createElement('table');
+    table.className = 'result-table';
+    const headRow = document.createElement('tr');
+    firstPage.columns.forEach(col => {
+        const th = document.createElement('th');
+        th.textContent = col;
+        headRow.appendChild(th);
+    });
+    const thead = document.createElement('thead');
+    thead.appendChild(headRow);
+    table.appendChild(thead);
+    content.innerHTML = '';
+    const wrapper = document.createElement('div');
+    wrapper.appendChild(table);
+    content.appendChild(wrapper);
+
+    let initial = firstPage;
+    const dataTable = $(table).DataTable({
+        serverSide: true,
+        searching: false,
+        ordering: false,
+        colReorder: true,
+        paging: true,
+        pageLength: 20,
+        lengthMenu: [20, 50, 100, 500],
+        scrollX: true,
+        scrollY: '550px',
+        scrollCollapse: true,
+        autoWidth: false, // Disable auto width to let CSS control, helps with alignment
+        language: PREVIEW_LANGUAGE,
+        ajax: function (request, callback) {
+            // Reuse the page that was already fetched to build the header
+            const pagePromise = (initial && initial.offset === request.start && initial.limit === request.length)
+                ? Promise.resolve(initial)
+                : fetchPreviewPage(type, firstPage.sheet, request.start, request.length);
+            initial = null;
+            pagePromise.then(page => {
+                callback({
+                    draw: request.draw,
+                    recordsTotal: page.total,
+                    recordsFiltered: page.total,
+                    data: pageRows(page)
+                });
+            }).catch(error => {
+                addLog(`❌ 预览加载失败: ${error.message}`, 'error');
+            });
+        }
+    });
+
+    // Fix for alignment issues: Adjust columns after a short delay to ensure valid widths
+    setTimeout(() => {
+        dataTable.columns.adjust();
+    }, 200);
+}
+
+// Preview Results with Tabs (one sheet is loaded at a time, page by page)
 function previewResults(type) {
     const container = document.getElementById(`preview-${type}`);
     if (!container) return;
@@ -133,16 +267,10 @@ function previewResults(type) {
     container.innerHTML = '<div class="loading">正在加载数据预览...</div>';
     container.style.display = 'block';
 
-    fetch(`/api/preview/${type}`)
-        .then(response => {
-            if (!response.ok) {
-                return response.json().then(err => { throw new Error(err.error || 'Network response was not ok'); });
-            }
-            return response.json();
-        })
-        .then(data => {
+    fetchPreviewPage(type, null, 0, 20)
+        .then(firstPage => {
             container.innerHTML = '';
-            if (Object.keys(data).length === 0) {
+            if (!firstPage.sheets || firstPage.sheets.length === 0) {
                 container.innerHTML = '<div class="no-data">暂无数据 preview available.</div>';
                 return;
             }
@@ -153,10 +281,9 @@ function previewResults(type) {
             const tabContentContainer = document.createElement('div');
             tabContentContainer.className = 'tab-content-container';
 
-            let first = true;
-            const sheets = Object.entries(data);
+            firstPage.sheets.forEach((sheetName, index) => {
+                const first = index === 0;
 
-            sheets.forEach(([sheetName, tableHtml], index) => {
                 // Tab Button
                 const btn = document.createElement('button');
                 btn.className = `tab-btn ${first ? 'active' : ''}`;
@@ -167,8 +294,7 @@ function previewResults(type) {
                 const content = document.createElement('div');
                 content.id = `sheet-${type}-${index}`;
                 content.className = `sheet-content ${first ? 'active' : ''}`;
-                // Simplified wrapper without 'table-responsive' since DataTables handles scrolling
-                content.innerHTML = `<div>${tableHtml}</div>`;
+                content.dataset.loaded = first ? '1' : '';
 
                 // Click Event
                 btn.addEventListener('click', () => {
@@ -180,53 +306,30 @@ function previewResults(type) {
                     btn.classList.add('active');
                     content.classList.add('active');
 
-                    // Adjust DataTables columns on tab switch
-                    const table = $(content).find('table').DataTable();
-                    table.columns.adjust().draw();
+                    if (!content.dataset.loaded) {
+                        // Load the sheet lazily on first activation
+                        content.dataset.loaded = '1';
+                        content.innerHTML = '<div class="loading">正在加载数据预览...</div>';
+                        fetchPreviewPage(type, sheetName, 0, 20)
+                            .then(page => renderSheet(type, content, page))
+                            .catch(error => {
+                                content.dataset.loaded = '';
+                                content.innerHTML = `<div class="error-msg">加载失败: ${error.message}</div>`;
+                            });
+                    } else {
+                        // Adjust DataTables columns on tab switch
+                        $.fn.dataTable.tables({ visible: true, api: true }).columns.adjust();
+                    }
                 });
 
                 tabHeader.appendChild(btn);
                 tabContentContainer.appendChild(content);
-                first = false;
             });
 
             container.appendChild(tabHeader);
             container.appendChild(tabContentContainer);
 
-            // Initialize DataTables
-            $(container).find('table').each(function () {
-                const table = $(this).DataTable({
-                    colReorder: true,
-                    paging: true,
-                    pageLength: 20,
-                    lengthMenu: [[20, 50, 100, -1], [20, 50, 100, "全部"]],
-                    scrollX: true,
-                    scrollY: '550px',
-                    scrollCollapse: true,
-                    autoWidth: false, // Disable auto width to let CSS control, helps with alignment
-                    language: {
-                        "sProcessing": "处理中...",
-                        "sLengthMenu": "显示 _MENU_ 项结果",
-                        "sZeroRecords": "没有匹配结果",
-                        "sInfo": "显示第 _START_ 至 _END_ 项结果，共 _TOTAL_ 项",
-                        "sInfoEmpty": "显示第 0 至 0 项结果，共 0 项",
-                        "sInfoFiltered": "(由 _MAX_ 项结果过滤)",
-                        "sSearch": "搜索:",
-                        "sEmptyTable": "表中数据为空",
-                        "oPaginate": {
-                            "sFirst": "首页",
-                            "sPrevious": "上页",
-                            "sNext": "下页",
-                            "sLast": "末页"
-                        }
-                    }
-                });
-
-                // Fix for alignment issues: Adjust columns after a short delay to ensure valid widths
-                setTimeout(() => {
-                    table.columns.adjust().draw();
-                }, 200);
-            });
+            renderSheet(type, tabContentContainer.firstChild, firstPage);
         })
         .catch(error => {
             container.innerHTML = `<div class="error-msg">加载失败: ${error.message} <br> 请确保已运行任务生成了报表。</div>`;
@@ -254,6 +357,7 @@ function switchMainTab(type) {
 document.addEventListener('DOMContentLoaded', () => {
     setupDragAndDrop('hy');
     setupDragAndDrop('cz');
+    setupDragAndDrop('shc');
     setupLogStream();
 
     // Auto preview if data exists? Maybe later.
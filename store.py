@@ -0,0 +1,202 @@
+"""
+汇总数据仓。化验、称重、收耗存的汇总表以 pickle 格式保存在 STORE_DIR/<流水线>/ 下，
+称重汇总关联发热量、预览、查询和按月份导出都从这里读取，Excel 只是导出格式。
+
+每次保存生成一个新版本的快照目录（汇总表及随后导出的工作簿），最后原子替换清单文件
+manifest.json，读取方先读一次清单，再按其中的文件名读取，总是看到完整的同一个版本。
+只保留最近 RM_STORE_KEEP 个版本（默认 3），/download/<type> 从最新快照中的副本下载。
+"""
+import os
+import json
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+# 汇总数据仓目录，可通过环境变量 RM_STORE_DIR 修改
+STORE_DIR = os.environ.get('RM_STORE_DIR', 'store')
+
+MANIFEST = 'manifest.json'
+# 最近一次导出的工作簿：{文件名: 快照中的文件}
+EXPORTS = 'exports.json'
+
+# 保留最近几个版本的快照（表文件和导出的工作簿），正在读取旧版本的请求不会因文件被删除而失败
+KEEP_SNAPSHOTS = max(int(os.environ.get('RM_STORE_KEEP', '3')), 1)
+
+# mkstemp 创建的临时文件只有所有者可读写；导出的工作簿、上传的月报等供他人打开的文件
+# 在替换前恢复为按 umask 新建文件的权限
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+
+def _dir(name):
+    return os.path.join(STORE_DIR, name)
+
+
+@contextmanager
+def _replacing(path):
+    """
+    返回唯一的临时文件名（同一目录，以 .tmp 结尾），写完后替换 path，读取方只会看到
+    完整的旧文件或新文件；临时文件名唯一，多个线程、进程同时写入时互不影响
+    """
+    fd, tmp_file = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp',
+                                    dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    try:
+        yield tmp_file
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _write_json(path, data):
+    with _replacing(path) as tmp_file:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+def save_tables(name, tables, display=None, internal=None):
+    """
+    保存某条流水线的全部汇总表（{表名: 数据框}），作为一个新版本的快照：
+    各表单独存为带版本号的 pickle 文件，最后写入清单文件。读取方以清单为准，
+    因此不会读到写了一半的结果；旧版本保留 KEEP_SNAPSHOTS 个，之后再清理。
+    display 为 {表名: 显示列定义}（见 schema.month_label），随清单保存，供预览和查询生成显示列。
+    internal 为只供程序内部读取的表（如月度分项汇总），随快照保存，可用 load_table 读取，
+    但不列入 list_tables，不出现在预览和导出中。返回新快照的版本号，用于 add_export。
+    """
+    folder = _dir(name)
+    os.makedirs(folder, exist_ok=True)
+    stamp = time.time_ns()
+    try:
+        previous = _manifest(name).get('versions', [])
+    except (FileNotFoundError, ValueError):
+        previous = []
+    versions = [stamp] + previous[:KEEP_SNAPSHOTS - 1]
+    files = {}
+    for i, (table, df) in enumerate({**tables, **(internal or {})}.items()):
+        filename = f"{stamp}-{i:02d}.pkl"
+        with _replacing(os.path.join(folder, filename)) as tmp_file:
+            df.to_pickle(tmp_file)
+        files[table] = filename
+
+    manifest = {
+        'version': stamp,
+        'versions': versions,
+        'tables': list(tables),
+        'files': files,
+        'display': display or {},
+        'updated': time.time(),
+    }
+    _write_json(os.path.join(folder, MANIFEST), manifest)
+    _prune(folder, versions)
+    return stamp
+
+
+def _prune(folder, versions):
+    """删除不在保留版本中的快照文件（文件名以版本号开头）"""
+    keep = {str(v) for v in versions}
+    for old in os.listdir(folder):
+        if old in (MANIFEST, EXPORTS) or old.endswith('.tmp'):
+            continue
+        if old.split('-', 1)[0] not in keep:
+            try:
+                os.remove(os.path.join(folder, old))
+            except OSError:
+                # 例如 Windows 上仍有请求在读取，下次保存时再清理
+                pass
+
+
+def add_export(name, path, version):
+    """
+    把刚导出的工作簿加入 version 版本（save_tables 的返回值）的快照：以 版本号-文件名
+    保存一份不再改动的副本（能硬链接时用硬链接），并记入导出清单。下载从快照读取，
+    与正在重新生成的工作簿互不影响。
+    """
+    folder = _dir(name)
+    filename = os.path.basename(path)
+    stored = f"{version}-{filename}"
+    with _replacing(os.path.join(folder, stored)) as tmp_file:
+        os.remove(tmp_file)
+        try:
+            os.link(path, tmp_file)
+        except OSError:
+            shutil.copyfile(path, tmp_file)
+
+    exports_file = os.path.join(folder, EXPORTS)
+    try:
+        with open(exports_file, encoding='utf-8') as f:
+            exports = json.load(f)
+    except (OSError, ValueError):
+        exports = {}
+    exports[filename] = stored
+    _write_json(exports_file, exports)
+
+
+def export_path(name, filename):
+    """最近一次导出的工作簿在快照中的路径，没有时抛出 FileNotFoundError"""
+    folder = _dir(name)
+    try:
+        with open(os.path.join(folder, EXPORTS), encoding='utf-8') as f:
+            stored = json.load(f).get(filename)
+    except (OSError, ValueError):
+        stored = None
+    path = os.path.join(folder, stored) if stored else None
+    if not path or not os.path.exists(path):
+        raise FileNotFoundError(f"数据仓中没有导出的 {filename}")
+    return path
+
+
+def _manifest(name):
+    path = os.path.join(_dir(name), MANIFEST)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"数据仓中没有 {name} 的汇总数据")
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def info(name):
+    """返回清单内容（版本、表名、更新时间等），不读取汇总表"""
+    return _manifest(name)
+
+
+def version(name):
+    """返回数据的版本标识（清单文件的修改时间），不存在时抛出 FileNotFoundError"""
+    return os.stat(os.path.join(_dir(name), MANIFEST)).st_mtime_ns
+
+
+def exists(name):
+    return os.path.exists(os.path.join(_dir(name), MANIFEST))
+
+
+def list_tables(name):
+    return _manifest(name)['tables']
+
+
+def display(name, table, manifest=None):
+    """返回表的显示列定义，没有时返回空列表；manifest 为 info() 的返回值时从该版本读取"""
+    return (manifest or _manifest(name)).get('display', {}).get(table, [])
+
+
+def load_table(name, table, manifest=None):
+    """
+    读取单张汇总表，表不存在时抛出 KeyError。manifest 为 info() 的返回值时读取该版本，
+    同一请求中的多次读取先取一次清单，不会读到两个版本
+    """
+    import pandas as pd
+
+    files = (manifest or _manifest(name))['files']
+    if table not in files:
+        raise KeyError(table)
+    return pd.read_pickle(os.path.join(_dir(name), files[table]))
+
+
+def load_tables(name):
+    import pandas as pd
+
+    manifest = _manifest(name)
+    return {
+        table: pd.read_pickle(os.path.join(_dir(name), manifest['files'][table]))
+        for table in manifest['tables']
+    }
@@ -0,0 +1,59 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# 原始名称 -> 供应商全称，在进程内跨文件、跨运行保留；供应商只有几十家，缓存不会变大。
+# 缓存只在本进程有效：进程池的子进程各自从空缓存开始、退出时丢弃，
+# 因此流水线在主进程中合并全部月报后再调用 normalize，而不是在 parse_report 中调用
+_names = {}
+
+_TRAILING_DIGITS = re.compile(r'\d+$')
+
+
+def normalize_name(raw, strip_digits=False):
+    """
+    提取供应商全称：取中文或英文括号前的部分。
+    strip_digits 为 True 时再去掉末尾的数字和首尾空白（称重月报的供应单位）。
+    """
+    key = (raw, strip_digits)
+    name = _names.get(key)
+    if name is None:
+        name = str(raw).split('（')[0].split('(')[0]
+        if strip_digits:
+            name = _TRAILING_DIGITS.sub('', name).strip()
+        _names[key] = name
+    return name
+
+
+def normalize(values, strip_digits=False, na_value=None):
+    """
+    将一列原始名称转换为供应商全称，返回分类（category）类型的列，类别按名称排序。
+    列中每个不同的原始名称只处理一次，并在本进程内跨调用缓存；空值转换为 na_value（为 None 时保持空值）。
+    """
+    codes, uniques = pd.factorize(values)
+    names = [normalize_name(raw, strip_digits) for raw in uniques]
+    if na_value is not None and (codes == -1).any():
+        codes = np.where(codes == -1, len(names), codes)
+        names.append(na_value)
+
+    # 不同的原始名称可能得到相同的全称，再按全称去重
+    name_codes, categories = pd.factorize(pd.Index(names, dtype=object), sort=True)
+    name_codes = np.asarray(name_codes)
+    codes = np.where(codes == -1, -1, name_codes[codes] if len(name_codes) else codes)
+    return pd.Series(pd.Categorical.from_codes(codes, categories),
+                     index=getattr(values, 'index', None), name=getattr(values, 'name', None))
+
+
+def unify(dfs, column):
+    """
+    统一多个数据框中同一分类列的类别（取并集并排序），使 pd.concat 后仍为分类类型。
+    原地修改各数据框。
+    """
+    frames = [df for df in dfs if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype)]
+    if not frames:
+        return
+    categories = pd.api.types.union_categoricals(
+        [df[column] for df in frames], sort_categories=True).categories
+    for df in frames:
+        df[column] = df[column].cat.set_categories(categories)
@@ -0,0 +1,172 @@
+import argparse
+import datetime
+import os
+import shutil
+
+import numpy as np
+
+# 当前实际数据量：约 11 个月，每月约 17 条记录，涉及约 6 家供应商
+BASE_MONTHS = 11
+BASE_ROWS = 17
+BASE_SUPPLIERS = 6
+
+HY_FOLDER = '无人值守化验月报'
+CZ_FOLDER = '无人值守称重月报'
+
+# 与实际月报相同的表头（化验月报两行表头，称重月报标题下空一行）
+HY_TITLE = '侯马热电分公司入厂煤质量报表'
+HY_HEADER = ['序号', '公司名称', '来煤量(吨)', '化验日期', '全水%', '水分%', '灰分%', '',
+             '挥发分%', '', '固定碳%', '全硫%', '发热量J/g', '', '', '']
+HY_SUBHEADER = ['', '', '', '', 'Mt', '空气干燥基Mad', '空气干燥基Aad', '干燥基Ad',
+                '空气干燥基Vad', '干燥无灰基Vdaf', '分析煤样FCad', '空气干燥基St,ad',
+                '收到基低\n位发热量\nQnet,ar(J/g)', '大卡（Kal）', '空干基高\n位热值\nQgr,ad(J/g)', '']
+CZ_TITLE = '侯马热电公司入厂煤数量统计总表'
+CZ_HEADER = ['序号', '供应单位', '运输单位', '货名', '车数', '到厂重量（t）', '矿发重量（t）', '']
+
+TRANSPORT_MODES = ['火车', '宝特', '宝特火车', '']
+CARRIERS = ['山西吉泽物流有限公司', '山西广茂原物流贸易有限公司', '侯马市顺达运输有限公司']
+
+
+def month_names(months, start='2025-01'):
+    """返回从 start 开始的连续月份（'YYYY-MM'）"""
+    year, month = map(int, start.split('-'))
+    names = []
+    for i in range(months):
+        y, m = divmod(month - 1 + i, 12)
+        names.append(f"{year + y}-{m + 1:02d}")
+    return names
+
+
+def supply_lines(suppliers, rows):
+    """生成每月的供应线路名称，形如 '模拟煤业003有限公司（2-1宝特）'，与实际月报的公司名称格式一致"""
+    lines = []
+    for i in range(rows):
+        supplier = f"模拟煤业{i % suppliers + 1:03d}有限公司"
+        route = f"{i // suppliers + 1}-1{TRANSPORT_MODES[i % len(TRANSPORT_MODES)]}"
+        lines.append(f"{supplier}（{route}）")
+    return lines
+
+
+def _month_values(rng, rows):
+    """一个月各线路的来煤量和化验指标"""
+    weight = np.round(rng.uniform(500, 30000, rows), 2)
+    mt = np.round(rng.uniform(4, 12, rows), 1)
+    mad = np.round(rng.uniform(0.2, 1.5, rows), 2)
+    aad = np.round(rng.uniform(15, 55, rows), 2)
+    ad = np.round(aad * 100 / (100 - mad), 2)
+    vad = np.round(rng.uniform(10, 30, rows), 2)
+    vdaf = np.round(vad * 100 / (100 - mad - aad), 2)
+    fcad = np.round(100 - mad - aad - vad, 2)
+    st = np.round(rng.uniform(0.3, 3.5, rows), 2)
+    qnet = np.round(rng.uniform(10000, 24000, rows))
+    kcal = np.round(qnet / 4.1816)
+    qgr = np.round(qnet * rng.uniform(1.08, 1.12, rows))
+    return weight, [mt, mad, aad, ad, vad, vdaf, fcad, st, qnet, kcal, qgr]
+
+
+def _weighted(values, weight):
+    return round(float(np.sum(values * weight) / np.sum(weight)), 2)
+
+
+def write_hy_report(path, month, lines, weight, metrics):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet('monthreport')
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        test_date = datetime.datetime.strptime(month + '-01', '%Y-%m-%d')
+
+        worksheet.write_row(0, 0, [HY_TITLE] + [''] * 14 + [' '])
+        worksheet.write_row(1, 0, HY_HEADER)
+        worksheet.write_row(2, 0, HY_SUBHEADER)
+        for i, line in enumerate(lines):
+            row = i + 3
+            worksheet.write_row(row, 0, [i + 1, line, weight[i]])
+            worksheet.write_datetime(row, 3, test_date, date_format)
+            worksheet.write_row(row, 4, [float(m[i]) for m in metrics])
+        # 末尾的加权平均值行
+        worksheet.write_row(len(lines) + 3, 0,
+                            ['', '加权平均值', '', ''] + [_weighted(m, weight) for m in metrics])
+    finally:
+        workbook.close()
+
+
+def write_cz_report(path, lines, weight, rng):
+    import xlsxwriter
+
+    cars = np.maximum(np.round(weight / rng.uniform(28, 32, len(lines))), 1).astype(int)
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet('lsrb')
+        worksheet.write_row(0, 0, [CZ_TITLE] + [''] * 6 + [' '])
+        worksheet.write_row(2, 0, CZ_HEADER)
+        for i, line in enumerate(lines):
+            worksheet.write_row(i + 3, 0, [i + 1, line, CARRIERS[i % len(CARRIERS)], '煤',
+                                           f"{cars[i]}车", weight[i], 0.0])
+        # 末尾的合计行
+        worksheet.write_row(len(lines) + 3, 0, ['', '', '合计', '', f"{cars.sum()}车",
+                                                f"{weight.sum():.2f}吨", '吨'])
+    finally:
+        workbook.close()
+
+
+def generate(output_dir, months=BASE_MONTHS, suppliers=BASE_SUPPLIERS, rows=BASE_ROWS,
+             start='2025-01', seed=0):
+    """
+    在 output_dir 下生成化验月报和称重月报目录，每月一个文件。
+    两类月报使用相同的供应线路和来煤量，因此称重汇总可以关联到化验发热量。
+    返回 (化验目录, 称重目录)。
+    """
+    rng = np.random.default_rng(seed)
+    hy_dir = os.path.join(output_dir, HY_FOLDER)
+    cz_dir = os.path.join(output_dir, CZ_FOLDER)
+    os.makedirs(hy_dir, exist_ok=True)
+    os.makedirs(cz_dir, exist_ok=True)
+
+    lines = supply_lines(suppliers, rows)
+    for month in month_names(months, start):
+        weight, metrics = _month_values(rng, rows)
+        write_hy_report(os.path.join(hy_dir, f"{month}.xlsx"), month, lines, weight, metrics)
+        write_cz_report(os.path.join(cz_dir, f"{month}.xlsx"), lines, weight, rng)
+    return hy_dir, cz_dir
+
+
+def generate_scaled(output_dir, scale=1, months=BASE_MONTHS, seed=0):
+    """按当前数据量的倍数生成数据（每月记录数和供应商数同时放大）"""
+    return generate(output_dir, months=months, suppliers=BASE_SUPPLIERS * scale,
+                    rows=BASE_ROWS * scale, seed=seed)
+
+
+def replicate_samples(output_dir, scale=1, hy_source=HY_FOLDER, cz_source=CZ_FOLDER, start='2025-01'):
+    """
+    把实际的 .xls 月报依次复制为连续月份的文件（文件数为原来的 scale 倍），
+    与生产环境一样经 xlrd 读取。模拟数据为 .xlsx，只能测量 openpyxl 的读取路径。
+    每个文件的内容不变，数据量按文件数放大。返回 (化验目录, 称重目录)。
+    """
+    folders = []
+    for source, name in ((hy_source, HY_FOLDER), (cz_source, CZ_FOLDER)):
+        samples = sorted(f for f in os.listdir(source) if f.lower().endswith('.xls'))
+        if not samples:
+            raise FileNotFoundError(f"{source} 中没有 .xls 月报")
+        folder = os.path.join(output_dir, name)
+        os.makedirs(folder, exist_ok=True)
+        for i, month in enumerate(month_names(len(samples) * scale, start)):
+            shutil.copyfile(os.path.join(source, samples[i % len(samples)]),
+                            os.path.join(folder, f"{month}.xls"))
+        folders.append(folder)
+    return tuple(folders)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='生成模拟的化验月报和称重月报')
+    parser.add_argument('output_dir')
+    parser.add_argument('--months', type=int, default=BASE_MONTHS)
+    parser.add_argument('--suppliers', type=int, default=BASE_SUPPLIERS)
+    parser.add_argument('--rows', type=int, default=BASE_ROWS, help='每月记录数')
+    parser.add_argument('--start', default='2025-01', help='起始月份 YYYY-MM')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    hy_dir, cz_dir = generate(args.output_dir, args.months, args.suppliers, args.rows,
+                              args.start, args.seed)
+    print(f"已生成: {hy_dir}, {cz_dir}")
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import aggregate
+
+
+@pytest.fixture
+def weights():
+    return pd.DataFrame({
+        '报表月份': ['2025-01', '2025-01', '2025-01', '2025-02', '2025-02', '2025-02', '2025-02'],
+        '供应商全称': ['甲', '甲', '乙', '甲', '乙', '乙', '丙'],
+        '重量': [10.0, 30.0, 5.0, 20.0, 0.0, 0.0, 8.0],
+        '发热量': [5000.0, 4000.0, np.nan, 4500.0, 4200.0, 4300.0, np.nan],
+    })
+
+
+def baseline(df, keys):
+    """The per-group weighted mean the pipelines computed with groupby().agg before partials"""
+    def weighted_average(values):
+        weights = df.loc[values.index, '重量']
+        valid = ~(values.isna() | weights.isna())
+        if valid.sum() == 0 or weights[valid].sum() == 0:
+            return np.nan
+        return (values[valid] * weights[valid]).sum() / weights[valid].sum()
+
+    return df.groupby(keys).agg(
+        重量=('重量', 'sum'), 加权平均发热量=('发热量', weighted_average),
+        平均发热量=('发热量', 'mean'), 最大发热量=('发热量', 'max'), 记录数=('发热量', 'count'))
+
+
+def monthly_partials(df, keys=('报表月份', '供应商全称')):
+    return aggregate.partials(df, [df[k] for k in keys], ['发热量'], '重量')
+
+
+def merged(df, by):
+    parts = monthly_partials(df)
+    stats = aggregate.merge_partials(parts, [parts[k] for k in by], ['发热量'], '重量')
+    return pd.DataFrame({
+        '重量': stats[('重量', 'sum')],
+        '加权平均发热量': stats[('发热量', 'weighted')],
+        '平均发热量': stats[('发热量', 'mean')],
+        '最大发热量': stats[('发热量', 'max')],
+        '记录数': stats[('发热量', 'count')],
+    })
+
+
+@pytest.mark.parametrize('by', [['报表月份', '供应商全称'], ['供应商全称'], ['报表月份']])
+def test_merged_partials_match_grouped_weighted_average(weights, by):
+    result = merged(weights, by)
+    pd.testing.assert_frame_equal(result, baseline(weights, by), check_names=False, check_dtype=False)
+
+
+def test_zero_weight_and_missing_metric_groups_are_nan(weights):
+    result = merged(weights, ['报表月份', '供应商全称'])
+    # 乙 in 2025-02 only has zero weights, 丙 has no heat value
+    assert np.isnan(result.loc[('2025-02', '乙'), '加权平均发热量'])
+    assert np.isnan(result.loc[('2025-02', '丙'), '加权平均发热量'])
+    assert result.loc[('2025-02', '丙'), '重量'] == 8.0
+
+
+def test_overall_row_without_keys(weights):
+    parts = monthly_partials(weights, ['报表月份'])
+    stats = aggregate.merge_partials(parts, [], ['发热量'], '重量')
+    assert stats[('重量', 'sum')].iloc[0] == 73.0
+    assert stats[('发热量', 'weighted')].iloc[0] == pytest.approx((50000 + 120000 + 90000) / 60)
+    assert stats[('发热量', 'count')].iloc[0] == 5
+
+
+def test_weighted_means_match_partials(weights):
+    keys = [weights['报表月份'], weights['供应商全称']]
+    sums = aggregate.weighted_sums(weights, ['发热量'], '重量')
+    means = aggregate.weighted_means(sums, keys, ['发热量'], '重量')
+    expected = baseline(weights, ['报表月份', '供应商全称'])
+    pd.testing.assert_series_equal(means['发热量'], expected['加权平均发热量'], check_names=False)
+
+
+def test_partial_layout_round_trips(weights):
+    parts = monthly_partials(weights)
+    assert aggregate.partial_layout(parts) == (['报表月份', '供应商全称'], '重量', ['发热量'])
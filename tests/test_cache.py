@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def report(tmp_path):
+    path = tmp_path / 'report.xlsx'
+    path.write_bytes(b'month one')
+    return str(path)
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'cache')
+
+
+def save(report, cache_dir, version=1):
+    cache.save('hy', report, pd.DataFrame({'a': [1, 2]}), version=version, cache_dir=cache_dir)
+
+
+def test_unchanged_file_hits(report, cache_dir):
+    assert cache.load('hy', report, cache_dir=cache_dir) is None
+    save(report, cache_dir)
+    assert cache.exists('hy', report, cache_dir=cache_dir)
+    assert cache.load('hy', report, cache_dir=cache_dir)['a'].tolist() == [1, 2]
+
+
+def test_size_change_invalidates(report, cache_dir):
+    save(report, cache_dir)
+    stat = os.stat(report)
+    with open(report, 'ab') as f:
+        f.write(b' and more')
+    os.utime(report, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert not cache.exists('hy', report, cache_dir=cache_dir)
+    assert cache.load('hy', report, cache_dir=cache_dir) is None
+
+
+def test_mtime_change_invalidates(report, cache_dir):
+    save(report, cache_dir)
+    stat = os.stat(report)
+    os.utime(report, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not cache.exists('hy', report, cache_dir=cache_dir)
+    assert cache.load('hy', report, cache_dir=cache_dir) is None
+
+
+def test_version_change_invalidates(report, cache_dir):
+    save(report, cache_dir, version=1)
+    assert not cache.exists('hy', report, version=2, cache_dir=cache_dir)
+    assert cache.load('hy', report, version=2, cache_dir=cache_dir) is None
+
+
+def test_save_replaces_stale_entry(report, cache_dir):
+    save(report, cache_dir, version=1)
+    save(report, cache_dir, version=2)
+    assert len(os.listdir(os.path.join(cache_dir, 'hy'))) == 1
+    assert not cache.exists('hy', report, version=1, cache_dir=cache_dir)
+    assert cache.exists('hy', report, version=2, cache_dir=cache_dir)
+
+
+def test_corrupt_entry_is_a_miss(report, cache_dir):
+    save(report, cache_dir)
+    folder = os.path.join(cache_dir, 'hy')
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(b'not a pickle')
+    assert cache.load('hy', report, cache_dir=cache_dir) is None
+
+
+def test_entry_saved_before_move_hits_at_target(report, tmp_path, cache_dir):
+    # Uploads are parsed and cached before they are moved into the input folder
+    target = str(tmp_path / 'inputs' / 'report.xlsx')
+    os.makedirs(os.path.dirname(target))
+    cache.save('hy', target, pd.DataFrame({'a': [1]}), cache_dir=cache_dir, stat_path=report)
+    os.replace(report, target)
+    assert cache.load('hy', target, cache_dir=cache_dir)['a'].tolist() == [1]
@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import cz
+import hy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HY_SAMPLE = os.path.join(ROOT, '无人值守化验月报', '2025-01.xls')
+CZ_SAMPLE = os.path.join(ROOT, '无人值守称重月报', '2025-01.xls')
+
+
+def test_samples_match_string_key_lookup():
+    lab = hy.parse_report(HY_SAMPLE)
+    weights = cz.parse_report(CZ_SAMPLE)
+    messages = []
+    matched = cz.join_lab_metrics(weights, lab, messages.append)
+
+    # The lookup the pipeline used before integer keys: mean heat per 'month + unit' string
+    lookup = lab.groupby(lab['化验日期'].dt.strftime('%Y-%m') + lab['公司名称'].astype(str))['发热量'].mean()
+    expected = (weights['报表月份'].astype(str) + weights['供应单位'].astype(str)).map(lookup)
+    assert matched['发热量'].tolist() == expected.tolist()
+    assert matched.index.equals(weights.index)
+    # The sample has one lab unit without a weighing record
+    assert len(messages) == 1 and '（12-1）' in messages[0]
+
+
+def test_duplicate_lab_rows_are_averaged_and_unmatched_reported():
+    weights = pd.DataFrame({
+        '报表月份': pd.PeriodIndex(['2025-01', '2025-01', '2025-02', '2025-02'], freq='M'),
+        '供应单位': pd.Categorical(['甲', '乙', '甲', None]),
+    })
+    lab = pd.DataFrame({
+        '化验日期': pd.to_datetime(['2025-01-03', '2025-01-20', '2025-02-01', '2025-03-01']),
+        '公司名称': pd.Categorical(['甲', '甲', '甲', '乙']),
+        '发热量': [4000.0, 5000.0, 4200.0, 3900.0],
+    })
+    messages = []
+    matched = cz.join_lab_metrics(weights, lab, messages.append)
+
+    assert list(matched.columns) == ['发热量']
+    np.testing.assert_array_equal(matched['发热量'], [4500.0, np.nan, 4200.0, np.nan])
+    assert '2 条称重记录' in messages[0] and '2025-01-乙' in messages[0]
+    assert '2025-03-乙' in messages[1]
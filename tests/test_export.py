@@ -0,0 +1,22 @@
+import openpyxl
+import pandas as pd
+
+import export
+
+
+def test_workbook_has_styled_header_and_values(tmp_path):
+    path = str(tmp_path / 'out.xlsx')
+    df = pd.DataFrame({
+        '报表月份': pd.PeriodIndex(['2025-01', '2025-02'], freq='M'),
+        '重量': [1.5, None],
+    })
+    export.write_workbook(path, {'汇总': df}, number_formats={'汇总': {1: '0.00'}})
+
+    sheet = openpyxl.load_workbook(path)['汇总']
+    header = sheet['A1']
+    assert header.value == '报表月份'
+    assert header.font.b
+    assert header.border.bottom.style == 'thin'
+    assert header.alignment.horizontal == 'center'
+    assert [[c.value for c in row] for row in sheet.iter_rows(min_row=2)] == [['2025-01', 1.5], ['2025-02', None]]
+    assert sheet['B2'].number_format == '0.00'
@@ -0,0 +1,69 @@
+import os
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import ingest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HY_SAMPLE = os.path.join(ROOT, '无人值守化验月报', '2025-01.xls')
+CZ_SAMPLE = os.path.join(ROOT, '无人值守称重月报', '2025-01.xls')
+
+
+def write_sheet(path, rows):
+    book = openpyxl.Workbook()
+    for row in rows:
+        book.active.append(row)
+    book.save(path)
+    return str(path)
+
+
+def test_lab_sample_skips_multi_row_header_and_weighted_average_row():
+    df = ingest.read_report(HY_SAMPLE, [0, 1, 2], ['序号', '公司名称', '来煤量'])
+    # Title row, header row and the unit row below it are skipped
+    assert df['序号'].iloc[0] == 1
+    assert df['公司名称'].iloc[0].startswith('大同煤矿集团')
+    # The trailing 加权平均值 row is dropped
+    assert df['序号'].tolist() == list(range(1, 13))
+    assert '加权平均值' not in df['公司名称'].tolist()
+
+
+def test_weighing_sample_by_header_name_drops_total_row():
+    df = ingest.read_report(CZ_SAMPLE, ['序号', '供应单位', '到厂重量（t）'], ['序号', '供应单位', '重量'])
+    assert list(df.columns) == ['序号', '供应单位', '重量']
+    assert df['序号'].tolist() == list(range(1, 12))
+    assert df['重量'].iloc[0] == pytest.approx(3442.2)
+
+
+def test_blank_rows_only_consider_selected_columns(tmp_path):
+    path = write_sheet(tmp_path / 'report.xlsx', [
+        ['月报'],
+        ['序号', '名称', '备注', '数量'],
+        [None, None, '单位', '吨'],
+        [1, 'a', None, 10],
+        [None, None, '只有备注的行', None],
+        [2, 'b', None, 20],
+        [None, '合计', None, 30],
+    ])
+    df = ingest.read_report(path, [0, 1, 3], ['序号', '名称', '数量'])
+    assert df.to_dict('list') == {'序号': [1, 2], '名称': ['a', 'b'], '数量': [10, 20]}
+
+
+def test_missing_header_raises(tmp_path):
+    path = write_sheet(tmp_path / 'report.xlsx', [['no header'], [1, 2]])
+    with pytest.raises(ValueError, match='未找到表头行'):
+        ingest.read_report(path, [0, 1])
+
+
+def test_unknown_column_name_raises(tmp_path):
+    path = write_sheet(tmp_path / 'report.xlsx', [['序号', '名称'], [1, 'a']])
+    with pytest.raises(KeyError):
+        ingest.read_report(path, ['序号', '重量'])
+
+
+def test_matches_read_excel_on_sample():
+    expected = pd.read_excel(CZ_SAMPLE, header=2).iloc[:-1]
+    df = ingest.read_report(CZ_SAMPLE, ['供应单位', '到厂重量（t）'])
+    assert df['供应单位'].tolist() == expected['供应单位'].tolist()
+    assert df['到厂重量（t）'].tolist() == expected['到厂重量（t）'].tolist()
@@ -0,0 +1,174 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+import statedb
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class Recorder:
+    """Runners that block until released and record which job types overlapped."""
+
+    def __init__(self, types):
+        self.lock = threading.Lock()
+        self.active = set()
+        self.overlaps = []
+        self.started = []
+        self.release = {t: threading.Event() for t in types}
+        self.runners = {t: self._runner(t) for t in types}
+
+    def _runner(self, job_type):
+        def run():
+            with self.lock:
+                if self.active:
+                    self.overlaps.append(sorted(self.active | {job_type}))
+                self.active.add(job_type)
+                self.started.append(job_type)
+            self.release[job_type].wait(5)
+            with self.lock:
+                self.active.discard(job_type)
+        return run
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_manager(request, tmp_path):
+    def make(runners, **kwargs):
+        if request.param == 'memory':
+            return jobs.JobManager(runners, **kwargs)
+        return jobs.SqliteJobManager(runners, str(tmp_path / 'state.sqlite3'), **kwargs)
+    return make
+
+
+def status(manager, job):
+    return manager.get(job.id).status
+
+
+def test_duplicate_requests_coalesce_into_pending_job(make_manager):
+    rec = Recorder(['hy'])
+    manager = make_manager(rec.runners)
+    first, coalesced = manager.submit('hy')
+    assert not coalesced
+    assert wait_until(lambda: rec.started == ['hy'])
+
+    second, coalesced = manager.submit('hy')
+    assert not coalesced
+    assert status(manager, second) == 'pending'
+    third, coalesced = manager.submit('hy')
+    assert coalesced
+    assert third.id == second.id
+    assert manager.get(second.id).requests == 2
+
+    rec.release['hy'].set()
+    assert wait_until(lambda: status(manager, second) == 'succeeded')
+    assert status(manager, first) == 'succeeded'
+    assert rec.started == ['hy', 'hy']
+    assert rec.overlaps == []
+
+
+def test_different_types_run_concurrently(make_manager):
+    rec = Recorder(['hy', 'cz'])
+    manager = make_manager(rec.runners, max_workers=2)
+    manager.submit('hy')
+    manager.submit('cz')
+    assert wait_until(lambda: len(rec.started) == 2)
+    assert rec.overlaps == [['cz', 'hy']]
+    for event in rec.release.values():
+        event.set()
+
+
+def test_exclusive_job_waits_for_running_jobs(make_manager):
+    rec = Recorder(['hy', 'all'])
+    manager = make_manager(rec.runners, max_workers=2, exclusive=['all'])
+    manager.submit('hy')
+    assert wait_until(lambda: rec.started == ['hy'])
+
+    job, _ = manager.submit('all')
+    assert status(manager, job) == 'pending'
+    time.sleep(1)
+    assert rec.started == ['hy']
+
+    rec.release['hy'].set()
+    assert wait_until(lambda: rec.started == ['hy', 'all'])
+    rec.release['all'].set()
+    assert wait_until(lambda: status(manager, job) == 'succeeded')
+    assert rec.overlaps == []
+
+
+def test_jobs_wait_for_running_exclusive_job(make_manager):
+    rec = Recorder(['hy', 'cz', 'all'])
+    manager = make_manager(rec.runners, max_workers=3, exclusive=['all'])
+    manager.submit('all')
+    assert wait_until(lambda: rec.started == ['all'])
+
+    hy_job, _ = manager.submit('hy')
+    cz_job, _ = manager.submit('cz')
+    assert status(manager, hy_job) == 'pending'
+    time.sleep(1)
+    assert rec.started == ['all']
+
+    rec.release['all'].set()
+    assert wait_until(lambda: sorted(rec.started[1:]) == ['cz', 'hy'])
+    rec.release['hy'].set()
+    rec.release['cz'].set()
+    assert wait_until(lambda: status(manager, hy_job) == status(manager, cz_job) == 'succeeded')
+    assert all('all' not in pair for pair in rec.overlaps)
+
+
+def test_job_submitted_after_pending_exclusive_job_waits_behind_it(make_manager):
+    rec = Recorder(['hy', 'cz', 'all'])
+    manager = make_manager(rec.runners, max_workers=3, exclusive=['all'])
+    manager.submit('hy')
+    assert wait_until(lambda: rec.started == ['hy'])
+    manager.submit('all')
+    cz_job, _ = manager.submit('cz')
+    assert status(manager, cz_job) == 'pending'
+
+    rec.release['hy'].set()
+    assert wait_until(lambda: rec.started == ['hy', 'all'])
+    rec.release['all'].set()
+    assert wait_until(lambda: rec.started == ['hy', 'all', 'cz'])
+    rec.release['cz'].set()
+    assert rec.overlaps == []
+
+
+def test_failed_job_records_error(make_manager):
+    def fail():
+        raise RuntimeError('boom')
+
+    errors = []
+    manager = make_manager({'hy': fail}, on_error=lambda job, e: errors.append(str(e)))
+    job, _ = manager.submit('hy')
+    assert wait_until(lambda: status(manager, job) == 'failed')
+    assert manager.get(job.id).error == 'boom'
+    assert errors == ['boom']
+
+
+def test_unknown_job_type_is_rejected(make_manager):
+    manager = make_manager({'hy': lambda: None})
+    with pytest.raises(KeyError):
+        manager.submit('nope')
+
+
+def test_sqlite_manager_recovers_stale_jobs_without_submitting(tmp_path):
+    path = str(tmp_path / 'state.sqlite3')
+    jobs.SqliteJobManager({'hy': lambda: None}, path)
+    job = jobs.Job('hy')
+    stale = time.time() - jobs.SqliteJobManager.STALE_AFTER - 1
+    with statedb.Database(path, jobs.SqliteJobManager.SCHEMA).transaction() as conn:
+        conn.execute("INSERT INTO jobs (id, type, status, requests, created, started, heartbeat) "
+                     "VALUES (?, 'hy', 'running', 1, ?, ?, ?)", (job.id, stale, stale, stale))
+
+    # Another worker process starting up marks the job of the dead process failed
+    manager = jobs.SqliteJobManager({'hy': lambda: None}, path)
+    assert wait_until(lambda: status(manager, job) == 'failed')
+    assert manager.get(job.id).error == 'worker process exited'
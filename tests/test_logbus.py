@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+import logbus
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_bus(request, tmp_path):
+    def make(maxlen=1000):
+        if request.param == 'memory':
+            return logbus.LogBus(maxlen=maxlen)
+        return logbus.SqliteLogBus(str(tmp_path / 'state.sqlite3'), maxlen=maxlen)
+    return make
+
+
+def test_since_replays_messages_after_cursor(make_bus):
+    bus = make_bus()
+    ids = [bus.publish(f"m{i}") for i in range(4)]
+    assert bus.last_id == ids[-1]
+    assert bus.since(ids[1]) == [(ids[2], 'm2'), (ids[3], 'm3')]
+    assert bus.since(ids[-1]) == []
+    assert bus.since(0) == list(zip(ids, ['m0', 'm1', 'm2', 'm3']))
+
+
+def test_replay_is_bounded_by_buffer_size(make_bus):
+    bus = make_bus(maxlen=3)
+    for i in range(5):
+        bus.publish(f"m{i}")
+    assert [message for _, message in bus.since(0)] == ['m2', 'm3', 'm4']
+
+
+def test_wait_returns_new_messages(make_bus):
+    bus = make_bus()
+    last_id = bus.publish('old')
+    threading.Timer(0.05, bus.publish, ['new']).start()
+    assert [message for _, message in bus.wait(last_id, timeout=5)] == ['new']
+    assert bus.wait(bus.last_id, timeout=0.01) == []
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'log_bus', logbus.LogBus())
+    return app.app.test_client(), app.log_bus
+
+
+def first_event(client, **kwargs):
+    response = client.get('/api/logs', buffered=False, **kwargs)
+    try:
+        return next(iter(response.response)).decode()
+    finally:
+        response.close()
+
+
+def test_stream_resumes_from_last_event_id(client):
+    client, bus = client
+    for i in range(3):
+        bus.publish(f"m{i}")
+    assert first_event(client, headers={'Last-Event-ID': '1'}).startswith('id: 2\ndata: {"message": "m1"}')
+    assert first_event(client, query_string={'last_id': '2'}).startswith('id: 3\n')
+
+
+def test_stale_last_event_id_replays_buffer(client):
+    # An id from before a server restart is ahead of the new ids
+    client, bus = client
+    bus.publish('m0')
+    assert first_event(client, headers={'Last-Event-ID': '99'}).startswith('id: 1\n')
+
+
+def test_history_endpoint_returns_messages_after_cursor(client):
+    client, bus = client
+    for i in range(3):
+        bus.publish(f"m{i}")
+    data = client.get('/api/logs/history', query_string={'after': 1}).get_json()
+    assert data == {'last_id': 3, 'messages': [{'id': 2, 'message': 'm1'}, {'id': 3, 'message': 'm2'}]}
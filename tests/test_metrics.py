@@ -0,0 +1,24 @@
+import metrics
+
+
+def test_stage_memory_is_recorded_by_default(monkeypatch):
+    monkeypatch.setattr(metrics, 'TRACE_MEMORY', False)
+    monkeypatch.setattr(metrics, '_history', metrics.MemoryHistory())
+    run = metrics.RunMetrics('test', log=lambda message: None)
+    data = b'x' * (32 * 1024 * 1024)
+    stage = run.lap('allocate', len(data))
+    result = run.finish()
+
+    assert stage['peak_mb'] > 32
+    assert stage['alloc_peak_mb'] is None
+    assert result['peak_mb'] >= stage['peak_mb']
+    assert metrics.history('test') == [result]
+
+
+def test_traced_allocations_are_opt_in(monkeypatch):
+    monkeypatch.setattr(metrics, 'TRACE_MEMORY', True)
+    with metrics.measure() as m:
+        data = bytearray(8 * 1024 * 1024)
+    del data
+    assert m.alloc_peak_mb >= 8
+    assert m.peak_mb is not None
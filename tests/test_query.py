@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cz
+import query
+import suppliers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MONTHS = ['2025-03', '2025-01', '2025-04', '2025-02']
+
+
+@pytest.fixture(scope='module')
+def weights():
+    # Real weighing reports, concatenated out of month order
+    dfs = [cz.parse_report(os.path.join(ROOT, '无人值守称重月报', f"{month}.xls")) for month in MONTHS]
+    suppliers.unify(dfs, '供应单位')
+    return pd.concat(dfs, ignore_index=True)
+
+
+@pytest.fixture(scope='module')
+def dataset(weights):
+    return query.Dataset(weights, ['供应单位'])
+
+
+def rows(dataset, positions):
+    return dataset.df.iloc[positions].reset_index(drop=True)
+
+
+def expected(weights, start=None, end=None, units=None):
+    month = weights['报表月份'].astype(str)
+    mask = pd.Series(True, index=weights.index)
+    if start:
+        mask &= month >= start
+    if end:
+        mask &= month <= end
+    if units is not None:
+        mask &= weights['供应单位'].isin(units)
+    return weights[mask].sort_values('报表月份', kind='stable').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('start, end', [
+    (None, None), ('2025-02', None), (None, '2025-02'), ('2025-02', '2025-03'),
+    ('2025-03', '2025-03'), ('2024-01', '2024-12'),
+])
+def test_month_range_matches_filtering_the_frame(weights, dataset, start, end):
+    result = rows(dataset, dataset.select(start, end))
+    pd.testing.assert_frame_equal(result, expected(weights, start, end))
+
+
+def test_filters_intersect_with_month_range(weights, dataset):
+    units = [weights['供应单位'].iloc[0], weights['供应单位'].iloc[-1], '不存在的单位']
+    result = rows(dataset, dataset.select('2025-02', '2025-04', {'供应单位': units}))
+    assert len(result)
+    pd.testing.assert_frame_equal(result, expected(weights, '2025-02', '2025-04', units))
+    assert not len(dataset.select(filters={'供应单位': ['不存在的单位']}))
+
+
+def test_rows_without_month_only_match_open_ranges():
+    df = pd.DataFrame({'报表月份': ['2025-02', None, '2025-01'], '供应单位': ['甲', '乙', '甲']})
+    dataset = query.Dataset(df, ['供应单位'])
+    assert len(dataset.select()) == 3
+    np.testing.assert_array_equal(dataset.df.iloc[dataset.select('2025-01')]['报表月份'],
+                                  ['2025-01', '2025-02'])
+
+
+def test_invalid_month_and_unknown_filter_raise(dataset):
+    with pytest.raises(ValueError):
+        dataset.select('2025-13')
+    with pytest.raises(KeyError):
+        dataset.select(filters={'运输单位': ['x']})
@@ -0,0 +1,114 @@
+import subprocess
+import sys
+
+import pytest
+
+import runner
+
+
+class Pipeline:
+    """Two file-backed stages, build -> report, that count how often they ran."""
+
+    def __init__(self, tmp_path):
+        self.source = tmp_path / 'source.txt'
+        self.built = tmp_path / 'built.txt'
+        self.report = tmp_path / 'report.txt'
+        self.state_file = str(tmp_path / 'runner_state.json')
+        self.source.write_text('v1')
+        self.calls = []
+        self.fail = set()
+        self.writes = 0
+
+    def _write(self, name, path, text):
+        def run(log, workers, progress, cancel):
+            self.calls.append(name)
+            if name in self.fail:
+                raise RuntimeError('boom')
+            self.writes += 1
+            path.write_text(f"{text()}:{self.writes}")
+        return run
+
+    def _outputs(self, path):
+        return lambda: path.read_text() if path.exists() else None
+
+    def stages(self):
+        return [
+            runner.Stage('build', 'build', self._write('build', self.built, self.source.read_text),
+                         inputs=self.source.read_text, outputs=self._outputs(self.built)),
+            runner.Stage('report', 'report', self._write('report', self.report, self.built.read_text),
+                         deps=['build'], outputs=self._outputs(self.report)),
+        ]
+
+    def run(self, targets=None, **kwargs):
+        self.calls.clear()
+        return runner.run(targets, stages=self.stages(), log=lambda message: None,
+                          state_file=self.state_file, **kwargs)
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    return Pipeline(tmp_path)
+
+
+def test_unchanged_inputs_are_skipped(pipeline):
+    assert pipeline.run() == {'build': 'done', 'report': 'done'}
+    assert pipeline.run() == {'build': 'skipped', 'report': 'skipped'}
+    assert pipeline.calls == []
+
+
+def test_changed_input_reruns_stage_and_dependents(pipeline):
+    pipeline.run()
+    pipeline.source.write_text('v2')
+    assert pipeline.run() == {'build': 'done', 'report': 'done'}
+    assert pipeline.calls == ['build', 'report']
+
+
+def test_missing_output_reruns_only_that_stage(pipeline):
+    pipeline.run()
+    pipeline.report.unlink()
+    assert pipeline.run() == {'build': 'skipped', 'report': 'done'}
+    assert pipeline.calls == ['report']
+
+
+def test_force_reruns_everything(pipeline):
+    pipeline.run()
+    assert pipeline.run(force=True) == {'build': 'done', 'report': 'done'}
+
+
+def test_target_runs_only_its_dependencies(pipeline):
+    assert pipeline.run(['build']) == {'build': 'done'}
+    assert pipeline.calls == ['build']
+
+
+def test_failed_stage_blocks_dependents_and_is_retried(pipeline):
+    pipeline.fail.add('build')
+    assert pipeline.run() == {'build': 'failed', 'report': 'blocked'}
+    pipeline.fail.clear()
+    assert pipeline.run() == {'build': 'done', 'report': 'done'}
+
+
+def test_stage_without_new_output_fails(pipeline):
+    pipeline.run()
+    stages = pipeline.stages()
+    stages[0].run = lambda log, workers, progress, cancel: None
+    status = runner.run(stages=stages, log=lambda message: None, state_file=pipeline.state_file,
+                        force=True)
+    assert status == {'build': 'failed', 'report': 'blocked'}
+
+
+def test_missing_source_folder_skips_stage_and_runs_dependents(pipeline, tmp_path):
+    pipeline.run()
+    pipeline.calls.clear()
+    stages = pipeline.stages()
+    stages[0].source = str(tmp_path / 'missing')
+    status = runner.run(stages=stages, log=lambda message: None, state_file=pipeline.state_file,
+                        force=True)
+    assert status == {'build': 'skipped', 'report': 'done'}
+    assert pipeline.calls == ['report']
+
+
+def test_import_does_not_load_pandas():
+    code = 'import sys, runner; print("pandas" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            check=True, cwd=runner.__file__.rsplit('runner.py', 1)[0] or '.')
+    assert result.stdout.strip() == 'False'
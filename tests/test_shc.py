@@ -0,0 +1,83 @@
+import os
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import cz
+import shc
+import suppliers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FOLDER = os.path.join(ROOT, '收耗存数据')
+SAMPLES = sorted(os.listdir(FOLDER))
+JANUARY = os.path.join(FOLDER, '2025年01月侯马热电收耗存数据.xlsx')
+
+
+@pytest.fixture(scope='module')
+def january():
+    return shc.parse_report(JANUARY)
+
+
+@pytest.mark.parametrize('filename', SAMPLES)
+def test_samples_balance(filename):
+    # Mine columns differ from month to month; every sample is located by its header
+    df = shc.parse_report(os.path.join(FOLDER, filename))
+    daily, monthly = shc.balance_tables(df)
+    assert str(monthly['报表月份'].iloc[0]) == f"{filename[:4]}-{filename[5:7]}"
+    assert monthly['天数'].iloc[0] == len(daily) == monthly['报表月份'].iloc[0].days_in_month
+    assert monthly['库存差异'].iloc[0] == 0
+    mines = df.loc[df['项目'] == shc.MINE, '数量'].sum()
+    assert mines == pytest.approx(monthly[shc.RECEIVED].iloc[0])
+
+
+def test_january_sample_rows(january):
+    assert january['项目'].value_counts().to_dict() == {
+        shc.MINE: 55, shc.RECEIVED: 31, shc.CONSUMED: 31, shc.STOCK: 31, shc.OPENING: 1}
+    opening = january[january['项目'] == shc.OPENING]
+    assert opening['数量'].tolist() == [145977.24]
+    assert opening['日期'].isna().all()
+    # Mine names have their line breaks collapsed; groups carry over to the columns on their right
+    mines = shc.mine_tables(january)
+    row = mines[mines['矿点'] == '龙泉（T） 11-1'].iloc[0]
+    assert (row['分组'], row['矿点简称'], row[shc.RECEIVED]) == ('太原煤气化', '龙泉', 5264.84)
+
+
+def test_reconcile_with_weighing_sample(january):
+    weights = cz.parse_report(os.path.join(ROOT, '无人值守称重月报', '2025-01.xls'))
+    weights['供应商全称'] = suppliers.normalize(weights['供应单位'], strip_digits=True)
+    _, monthly = shc.balance_tables(january)
+    by_month, by_supplier = shc.reconcile(monthly, shc.mine_tables(january), weights)
+
+    assert by_month[['来煤量', '称重重量', '差异', '差异率']].iloc[0].tolist() == \
+        pytest.approx([139389.67, 139389.67, 0, 0])
+    assert len(by_supplier) == 10
+    assert (by_supplier['差异'] == 0).all()
+    assert '太原煤气化龙泉能源' in by_supplier['供应商全称'].tolist()
+
+
+def test_match_suppliers_prefers_shortest_name():
+    names = shc.match_suppliers(['龙泉', '无名'], ['太原煤气化龙泉能源有限公司', '太原煤气化龙泉能源', None])
+    assert names == {'龙泉': '太原煤气化龙泉能源', '无名': ''}
+
+
+def test_unmatched_mines_and_months_are_kept_apart():
+    monthly = pd.DataFrame({'报表月份': pd.PeriodIndex(['2025-01'], freq='M'), shc.RECEIVED: [30.0]})
+    mines = pd.DataFrame({'报表月份': pd.PeriodIndex(['2025-01', '2025-01'], freq='M'),
+                          '矿点简称': ['甲', '无名'], shc.RECEIVED: [20.0, 10.0]})
+    weights = pd.DataFrame({'报表月份': pd.PeriodIndex(['2025-01', '2025-02'], freq='M'),
+                            '供应商全称': ['甲煤业', '乙煤业'], '重量': [18.0, 5.0]})
+    by_month, by_supplier = shc.reconcile(monthly, mines, weights)
+    assert by_month['差异'].tolist()[0] == 12.0
+    assert pd.isna(by_month['来煤量'].iloc[1])
+    # The unmatched mine has no supplier row; the supplier without mine rows counts as received 0
+    assert by_supplier[['供应商全称', '差异']].values.tolist() == [['甲煤业', 2.0], ['乙煤业', -5.0]]
+
+
+def test_report_without_header_raises(tmp_path):
+    path = tmp_path / '2025年01月收耗存数据.xlsx'
+    book = openpyxl.Workbook()
+    book.active.append(['无表头'])
+    book.save(path)
+    with pytest.raises(ValueError, match='未找到表头行'):
+        shc.parse_report(str(path))
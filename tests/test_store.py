@@ -0,0 +1,73 @@
+import os
+
+import pandas as pd
+import pytest
+
+import store
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, 'STORE_DIR', str(tmp_path))
+    monkeypatch.setattr(store, 'KEEP_SNAPSHOTS', 2)
+    return tmp_path
+
+
+def test_save_and_load_tables():
+    df = pd.DataFrame({'重量': [1.0, 2.0]})
+    version = store.save_tables('cz', {'合并数据': df}, display={'合并数据': ['月份']},
+                                internal={'月度分项汇总': df})
+    manifest = store.info('cz')
+    assert manifest['version'] == version
+    assert store.list_tables('cz') == ['合并数据']
+    assert store.display('cz', '合并数据') == ['月份']
+    pd.testing.assert_frame_equal(store.load_table('cz', '合并数据'), df)
+    # Internal tables are readable but not listed
+    pd.testing.assert_frame_equal(store.load_table('cz', '月度分项汇总'), df)
+    assert list(store.load_tables('cz')) == ['合并数据']
+    with pytest.raises(KeyError):
+        store.load_table('cz', '不存在')
+
+
+def test_old_snapshots_are_pruned(store_dir):
+    versions = [store.save_tables('hy', {'原始数据': pd.DataFrame({'n': [i]})}) for i in range(3)]
+    manifest = store.info('hy')
+    assert manifest['versions'] == [versions[2], versions[1]]
+    files = set(os.listdir(store_dir / 'hy'))
+    assert not any(name.startswith(str(versions[0])) for name in files)
+    assert any(name.startswith(str(versions[1])) for name in files)
+    assert store.load_table('hy', '原始数据')['n'].tolist() == [2]
+
+
+def test_reader_keeps_its_manifest_version():
+    store.save_tables('hy', {'原始数据': pd.DataFrame({'n': [1]})})
+    manifest = store.info('hy')
+    store.save_tables('hy', {'原始数据': pd.DataFrame({'n': [2]})})
+    # A request that read the manifest before the save still sees the old version
+    assert store.load_table('hy', '原始数据', manifest)['n'].tolist() == [1]
+    assert store.load_table('hy', '原始数据')['n'].tolist() == [2]
+
+
+def test_exports_follow_their_snapshot(tmp_path):
+    workbook = tmp_path / '称重月报汇总.xlsx'
+    for text in ('first', 'second'):
+        version = store.save_tables('cz', {'合并数据': pd.DataFrame()})
+        workbook.write_text(text)
+        store.add_export('cz', str(workbook), version)
+    path = store.export_path('cz', '称重月报汇总.xlsx')
+    assert os.path.basename(path) == f"{version}-称重月报汇总.xlsx"
+    # Regenerating the workbook does not change the stored copy
+    workbook.unlink()
+    workbook.write_text('third')
+    with open(path) as f:
+        assert f.read() == 'second'
+    with pytest.raises(FileNotFoundError):
+        store.export_path('cz', '其他.xlsx')
+
+
+def test_missing_pipeline_raises():
+    assert not store.exists('shc')
+    with pytest.raises(FileNotFoundError):
+        store.info('shc')
+    with pytest.raises(FileNotFoundError):
+        store.version('shc')
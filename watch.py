@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+
+# watchdog is optional: with it changes are noticed from OS file events
+# (inotify on Linux), otherwise the folders are polled
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+REPORT_EXTENSIONS = ('.xls', '.xlsx')
+# Quiet period after the last change before a folder counts as settled,
+# so a burst of copies (or one large copy) triggers a single run
+DEBOUNCE_SECONDS = 3.0
+POLL_INTERVAL = 1.0
+
+
+def _snapshot(folder, extensions):
+    """name -> (size, mtime) of the monthly reports in a folder."""
+    files = {}
+    try:
+        entries = list(os.scandir(folder))
+    except FileNotFoundError:
+        return files
+    for entry in entries:
+        name = entry.name
+        # Skip Excel lock files (~$name.xlsx) of workbooks that are open
+        if name.startswith('~$') or not name.lower().endswith(extensions):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files[name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class _EventHandler:
+    """watchdog handler: any event in a folder only triggers a rescan of it."""
+
+    def __init__(self, watcher, kind):
+        self._watcher = watcher
+        self._kind = kind
+
+    def dispatch(self, event):
+        self._watcher._scan(self._kind)
+
+
+class FolderWatcher:
+    """
+    Watches the input folders of the pipelines and calls
+    on_change(kind, files) once the new, changed or removed reports of a
+    folder have settled for `debounce` seconds.
+
+    Files present when the watcher starts are taken as already processed.
+    Pipelines read unchanged reports from the parse cache, so a triggered
+    run only parses the files that actually changed.
+    """
+
+    def __init__(self, folders, on_change, debounce=DEBOUNCE_SECONDS, interval=POLL_INTERVAL,
+                 extensions=REPORT_EXTENSIONS, use_events=True, log=None):
+        self._folders = dict(folders)
+        self._on_change = on_change
+        self._debounce = debounce
+        self._interval = interval
+        self._extensions = extensions
+        self._use_events = use_events and Observer is not None
+        self._log = log
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        # kind -> (time of the last change, changed file names)
+        self._changes = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    @property
+    def mode(self):
+        return 'events' if self._observer else 'polling'
+
+    def start(self):
+        if self._thread:
+            return self
+        for kind, folder in self._folders.items():
+            self._snapshots[kind] = _snapshot(folder, self._extensions)
+        if self._use_events:
+            try:
+                observer = Observer()
+                for kind, folder in self._folders.items():
+                    os.makedirs(folder, exist_ok=True)
+                    observer.schedule(_EventHandler(self, kind), folder, recursive=False)
+                observer.daemon = True
+                observer.start()
+                self._observer = observer
+            except Exception as e:
+                # e.g. the inotify watch limit is reached: fall back to polling
+                if self._log:
+                    self._log(f"无法监听文件夹事件（{e}），改为定时扫描")
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name='watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stopped.wait(self._interval):
+            if not self._observer:
+                for kind in self._folders:
+                    self._scan(kind)
+            self._flush()
+
+    def _scan(self, kind):
+        snapshot = _snapshot(self._folders[kind], self._extensions)
+        with self._lock:
+            previous = self._snapshots.get(kind, {})
+            changed = {name for name in snapshot.keys() | previous.keys()
+                       if snapshot.get(name) != previous.get(name)}
+            self._snapshots[kind] = snapshot
+            if changed:
+                _, files = self._changes.get(kind, (None, set()))
+                self._changes[kind] = (time.monotonic(), files | changed)
+
+    def _flush(self):
+        now = time.monotonic()
+        with self._lock:
+            settled = [(kind, sorted(files)) for kind, (last, files) in self._changes.items()
+                       if now - last >= self._debounce]
+            for kind, _ in settled:
+                del self._changes[kind]
+        for kind, files in settled:
+            try:
+                self._on_change(kind, files)
+            except Exception as e:
+                if self._log:
+                    self._log(f"文件夹 {self._folders[kind]} 变动后自动处理出错: {e}")
@@ -0,0 +1,67 @@
+"""
+Production entry point for serving the app to LAN users.
+
+Linux, several worker processes (pipelines, previews and downloads are
+spread over the CPU cores):
+
+    gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:5000 wsgi:app
+
+Any platform, one process with a thread pool (pip install waitress):
+
+    python wsgi.py
+
+Job status and the log stream are kept in a SQLite file shared by the
+worker processes (RM_STATE_DB, default .cache/state.sqlite3), so any
+worker can answer /api/jobs and /api/logs whichever one runs the job.
+Use a threaded worker class: every /api/logs client holds a connection.
+Do not start gunicorn with --preload, so the folder watcher starts in a
+worker process.
+"""
+import os
+
+os.environ.setdefault('RM_STATE_DB', os.path.join(os.environ.get('RM_CACHE_DIR', '.cache'), 'state.sqlite3'))
+
+import app as application_module  # noqa: E402
+
+app = application_module.app
+application = app
+
+HOST = os.environ.get('RM_HOST', '0.0.0.0')
+PORT = int(os.environ.get('RM_PORT', 5000))
+THREADS = int(os.environ.get('RM_THREADS', 8))
+
+_watch_lock = None
+
+
+def _acquire_watch_lock(path):
+    """Non-blocking exclusive lock held for the life of the process; None if another process holds it."""
+    lock_file = open(path, 'a+')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+# Only one worker process watches the folders; the lock is released when it exits,
+# so a replacement worker takes over
+if application_module.WATCH_FOLDERS:
+    _watch_lock = _acquire_watch_lock(application_module.STATE_DB + '.watch.lock')
+    if _watch_lock:
+        application_module.start_watcher()
+
+
+if __name__ == '__main__':
+    try:
+        from waitress import serve
+    except ImportError:
+        raise SystemExit("waitress is not installed (pip install waitress); "
+                         "on Linux run: gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:5000 wsgi:app")
+    print(f"Web Server Starting on http://{HOST}:{PORT} (LAN access enabled, {THREADS} threads)")
+    serve(app, host=HOST, port=PORT, threads=THREADS)